@@ -1,18 +1,54 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
-from .db import init_db, conn
-from .dossier import build_dossier
-from .predictors import predict_and_store
-from .backtest import run_backtest
+from .db import init_db, reader
+from .backtest import cancel_run, get_run, resume_runs, shutdown_pool, submit_runs
+from .fixtures_index import sync_league_range
+from .providers.apifootball import APIFootball
+from .quota import QUOTA, BACKTEST
+from .resilience import resilience_stats
+from .teams import TEAMS, resolve_team
+from .singleflight import SF
+from .pipeline import run_prediction, stream_prediction, sse
+from .jobs import submit, get_job, queue_stats, start_workers, stop_workers, PRIORITY_INTERACTIVE
+from .batch import run_batch, ndjson
+from .config import BATCH_LLM_CONCURRENCY, BATCH_LLM_RATE_PER_MIN
 from .web import router as web_router
+from .http_pool import POOL
+from .cassette import cassette_stats
+from .cache import cache_stats, start_sweeper, stop_sweeper
+from .ingest import get_state as ingest_state, run_ingest, start_ingest_scheduler, stop_ingest_scheduler
+from .prefetch import (
+    get_state as prefetch_state, get_watchlist, prefetch_stats, remove_watchlist_entry, run_prefetch,
+    set_watchlist_entry, start_prefetch_scheduler, stop_prefetch_scheduler,
+)
+from .compact import STATS as PROMPT_STATS
+from .predictors import reuse_stats
+from .poisson import MODEL as POISSON_MODEL
 
 app = FastAPI(title="MatchLab", version="1.1.0")
 
 @app.on_event("startup")
 def _startup():
     init_db()
+    app.state.http = POOL
+    start_sweeper()
+    start_workers()
+    start_ingest_scheduler()
+    start_prefetch_scheduler()
+    resume_runs()
+
+@app.on_event("shutdown")
+async def _shutdown():
+    stop_sweeper()
+    stop_workers()
+    stop_ingest_scheduler()
+    stop_prefetch_scheduler()
+    shutdown_pool()
+    await POOL.aclose()
+    POOL.close()
 
 # Página web ("/")
 app.include_router(web_router)
@@ -27,43 +63,199 @@ class PredictReq(BaseModel):
     recent_n: int = 5
     h2h_n: int = 10
     mode: str = "full"  # full/compact
+    model: str = "openai"  # openai (LLM) / poisson (modelo local, milissegundos)
+    force: bool = False  # ignora previsão reaproveitável (mesmo dossiê) e chama o LLM
 
 @app.get("/health")
 def health():
     return {"ok": True}
 
+@app.get("/metrics")
+def metrics():
+    return {
+        "http": POOL.stats(),
+        "cache": cache_stats(),
+        "teams": TEAMS.stats(),
+        "singleflight": dict(SF.stats),
+        "jobs": queue_stats(),
+        "prompt": dict(PROMPT_STATS),
+        "reuse": reuse_stats(),
+        "poisson": POISSON_MODEL.stats(),
+        "apifootball_quota": QUOTA.stats(),
+        "providers": resilience_stats(),
+        "prefetch": prefetch_stats(),
+        "cassette": cassette_stats(),
+    }
+
+@app.get("/teams/resolve")
+def teams_resolve(name: str):
+    # catálogo local primeiro; só vai à API-Football se o nome for desconhecido
+    try:
+        team = resolve_team(APIFootball(), name)
+    except RuntimeError as e:
+        if not str(e).startswith("Time não encontrado"):
+            raise
+        return {"found": False, "team": None}
+    return {"found": True, "team": team}
+
 @app.post("/predict")
-def predict(req: PredictReq):
-    dossier = build_dossier(
-        home=req.home,
-        away=req.away,
-        kickoff=req.kickoff,
-        tz=req.tz,
-        season=req.season,
-        league_id=req.league_id,
-        recent_n=req.recent_n,
-        h2h_n=req.h2h_n,
+async def predict(req: PredictReq):
+    return await run_prediction(req.model_dump())
+
+@app.post("/predict/stream")
+async def predict_stream(req: PredictReq):
+    # Server-Sent Events: tokens do modelo conforme chegam
+    return StreamingResponse(
+        sse(stream_prediction(req.model_dump())),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    result = predict_and_store(dossier, mode=req.mode)
-    return result
+
+class BatchPredictReq(BaseModel):
+    league_id: int
+    season: int
+    from_date: str  # YYYY-MM-DD
+    to_date: str    # YYYY-MM-DD
+    tz: Optional[str] = "America/Sao_Paulo"
+    recent_n: int = 5
+    h2h_n: int = 10
+    mode: str = "full"
+    model: str = "openai"
+    force: bool = False
+    concurrency: int = BATCH_LLM_CONCURRENCY
+    rate_per_min: float = BATCH_LLM_RATE_PER_MIN
+
+@app.post("/predict/batch")
+async def predict_batch(req: BatchPredictReq):
+    # NDJSON: uma linha por jogo assim que a análise dele termina
+    return StreamingResponse(ndjson(run_batch(**req.model_dump())), media_type="application/x-ndjson")
+
+class PredictJobReq(PredictReq):
+    priority: int = PRIORITY_INTERACTIVE
+    callback_url: Optional[str] = None  # recebe POST com o job ao terminar
+
+@app.post("/jobs/predict")
+def predict_job(req: PredictJobReq):
+    payload = req.model_dump(exclude={"priority", "callback_url"})
+    job_id = submit("predict", payload, priority=req.priority, callback_url=req.callback_url)
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="job não encontrado")
+    return job
 
 @app.get("/predictions/latest")
 def latest(limit: int = 20):
-    c = conn()
-    rows = c.execute("""
-      SELECT id, fixture_id, created_at_iso, scoreline, confidence
-      FROM predictions ORDER BY id DESC LIMIT ?
-    """, (limit,)).fetchall()
-    c.close()
+    with reader() as c:
+        rows = c.execute("""
+          SELECT id, fixture_id, created_at_iso, scoreline, confidence
+          FROM predictions ORDER BY id DESC LIMIT ?
+        """, (limit,)).fetchall()
     return {"items": [dict(r) for r in rows]}
 
+class BacktestTarget(BaseModel):
+    league_id: Optional[int] = None
+    season: Optional[int] = None
+
 class BacktestReq(BaseModel):
-    league_id: int
-    season: int
+    league_id: Optional[int] = None  # vazio: todas as ligas
+    season: Optional[int] = None
     from_date: str  # YYYY-MM-DD
     to_date: str    # YYYY-MM-DD
+    model: Optional[str] = None  # openai/poisson; vazio: todos (ver by_model)
+    # várias ligas/seasons: uma execução por item, em paralelo (pool de processos)
+    targets: Optional[List[BacktestTarget]] = None
 
 @app.post("/backtest/run")
 def backtest(req: BacktestReq):
-    metrics = run_backtest(req.league_id, req.season, req.from_date, req.to_date)
-    return {"metrics": metrics}
+    # em segundo plano, só banco local (resultados vêm de /ingest/run);
+    # acompanhar em GET /backtest/runs/{id}
+    targets = [(t.league_id, t.season) for t in req.targets] if req.targets else [(req.league_id, req.season)]
+    try:
+        ids = submit_runs(targets, req.from_date, req.to_date, req.model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"runs": ids}
+
+@app.get("/backtest/runs/{run_id}")
+def backtest_progress(run_id: int):
+    run = get_run(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="backtest não encontrado")
+    return run
+
+@app.post("/backtest/runs/{run_id}/cancel")
+def backtest_cancel(run_id: int):
+    if not get_run(run_id):
+        raise HTTPException(status_code=404, detail="backtest não encontrado")
+    if not cancel_run(run_id):
+        raise HTTPException(status_code=409, detail="backtest já terminou")
+    return get_run(run_id)
+
+class FixturesIndexReq(BaseModel):
+    league_id: int
+    season: int
+    from_date: str  # YYYY-MM-DD
+    to_date: str    # YYYY-MM-DD
+
+@app.post("/fixtures/index")
+def fixtures_index(req: FixturesIndexReq):
+    # carga em lote para o índice local usado na resolução de fixtures
+    # (histórico em massa: última classe na fila de cota)
+    indexed = sync_league_range(APIFootball(priority=BACKTEST), req.league_id, req.season, req.from_date, req.to_date)
+    return {"indexed": indexed}
+
+class IngestReq(BaseModel):
+    # vazio: todas as ligas de TRACKED_LEAGUES
+    league_id: Optional[int] = None
+    season: Optional[int] = None
+
+@app.post("/ingest/run")
+def ingest_run(req: IngestReq):
+    # puxa resultados desde a marca d'água de cada liga e grava status/placar
+    leagues = [(req.league_id, req.season)] if req.league_id and req.season else None
+    return {"leagues": run_ingest(leagues)}
+
+@app.get("/ingest/state")
+def ingest_status(league_id: Optional[int] = None):
+    return {"items": ingest_state(league_id)}
+
+class WatchlistReq(BaseModel):
+    league_id: int
+    season: int
+    # vazio: mantém o atual (ou o padrão PREFETCH_* da config)
+    enabled: Optional[bool] = None
+    lead_hours: Optional[float] = None
+    lineup_minutes: Optional[float] = None
+    llm: Optional[bool] = None  # grava o relatório do LLM antes do jogo
+    mode: Optional[str] = None
+    recent_n: Optional[int] = None
+    h2h_n: Optional[int] = None
+
+@app.get("/prefetch/watchlist")
+def prefetch_watchlist():
+    return {"items": get_watchlist()}
+
+@app.put("/prefetch/watchlist")
+def prefetch_watchlist_set(req: WatchlistReq):
+    entry = set_watchlist_entry(**req.model_dump())
+    start_prefetch_scheduler()  # primeira liga da watchlist liga o agendador
+    return entry
+
+@app.delete("/prefetch/watchlist/{league_id}/{season}")
+def prefetch_watchlist_remove(league_id: int, season: int):
+    if not remove_watchlist_entry(league_id, season):
+        raise HTTPException(status_code=404, detail="liga não está na watchlist")
+    return {"removed": True}
+
+@app.post("/prefetch/run")
+def prefetch_run(req: IngestReq):
+    # uma rodada agora (vazio: todas as ligas habilitadas da watchlist)
+    return {"leagues": run_prefetch(req.league_id, req.season)}
+
+@app.get("/prefetch/state")
+def prefetch_status(league_id: Optional[int] = None):
+    return {"items": prefetch_state(league_id)}
@@ -1,94 +1,371 @@
+import os
 import json
-from datetime import datetime
-from typing import Dict, Any, List, Tuple
-from .db import conn
-from .providers.apifootball import APIFootball
-
-def _parse_scoreline(scoreline: str) -> Tuple[int, int]:
-    import re
-    m = re.search(r"(\d+)\s*[–-]\s*(\d+)", scoreline)
-    if not m:
-        return (-1, -1)
-    return (int(m.group(1)), int(m.group(2)))
-
-def run_backtest(league_id: int, season: int, from_date: str, to_date: str) -> Dict[str, Any]:
-    api = APIFootball()
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .config import APP_TZ, BACKTEST_PROCESSES, BACKTEST_STALE_SECONDS
+from .db import reader, transaction
+
+log = logging.getLogger("matchlab.backtest")
+
+# Backtest offline: previsões x resultados já gravados em matches (ingestão),
+# numa consulta só; métricas vetorizadas com pandas/NumPy. Sem rede.
+
+FINISHED = ("FT", "AET", "PEN")
+CONF_BUCKETS = list(range(0, 101, 10))
+EPS = 1e-6
+
+
+def _ts(day: Optional[str], end: bool = False) -> Optional[int]:
+    """YYYY-MM-DD (no APP_TZ) -> epoch; end=True: fim do dia."""
+    if not day:
+        return None
+    d = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=ZoneInfo(APP_TZ))
+    return int((d + timedelta(days=1) if end else d).timestamp())
+
+
+def _where(league_id, season, from_date, to_date, model=None):
+    sql = [f"m.status IN ({','.join('?' * len(FINISHED))})",
+           "m.home_goals IS NOT NULL", "m.away_goals IS NOT NULL"]
+    params: List[Any] = list(FINISHED)
+    for cond, value in (("m.league_id = ?", league_id), ("m.season = ?", season),
+                        ("m.kickoff_ts >= ?", _ts(from_date)), ("m.kickoff_ts < ?", _ts(to_date, end=True)),
+                        ("p.model = ?", model)):
+        if value is not None:
+            sql.append(cond)
+            params.append(value)
+    return " AND ".join(sql), params
+
+
+# {where} sai de _where (scripts/check_query_plans.py confere o plano desta consulta)
+_LOAD_FRAME = """
+  SELECT p.id, p.fixture_id, COALESCE(p.model, 'openai') AS model, p.confidence,
+         p.pred_home_goals, p.pred_away_goals, p.p_home, p.p_draw, p.p_away,
+         m.league_id, m.season, m.kickoff_ts, m.home_goals, m.away_goals
+  FROM predictions p
+  JOIN matches m ON m.fixture_id = p.fixture_id
+  WHERE {where}
+"""
+
+
+def load_frame(league_id: Optional[int] = None, season: Optional[int] = None,
+               from_date: Optional[str] = None, to_date: Optional[str] = None,
+               model: Optional[str] = None) -> pd.DataFrame:
+    """Previsões com resultado final; a mais recente por (jogo, modelo)."""
+    where, params = _where(league_id, season, from_date, to_date, model)
+    with reader() as c:
+        df = pd.read_sql_query(_LOAD_FRAME.format(where=where), c, params=params)
+    return (df.sort_values("id")
+              .drop_duplicates(["fixture_id", "model"], keep="last")
+              .reset_index(drop=True))
+
+
+def _outcome(h: pd.Series, a: pd.Series) -> np.ndarray:
+    """0 = casa, 1 = empate, 2 = fora (NaN onde falta placar)."""
+    out = np.where(h > a, 0.0, np.where(h == a, 1.0, 2.0))
+    return np.where(h.isna() | a.isna(), np.nan, out)
+
+
+def prepare(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Colunas derivadas: acertos e a matriz 1X2 de probabilidades (placar previsto
+    já vem separado em pred_home_goals/pred_away_goals).
+    Modelos sem probabilidade (LLM): confiança vai para o resultado previsto e o
+    resto divide por igual entre os outros dois.
+    """
+    df = df.copy()
+    df["pred_home"] = df["pred_home_goals"].astype(float)
+    df["pred_away"] = df["pred_away_goals"].astype(float)
+    df = df[df["pred_home"].notna() & df["pred_away"].notna()].reset_index(drop=True)
+
+    real = _outcome(df["home_goals"], df["away_goals"]).astype(int)
+    pred = _outcome(df["pred_home"], df["pred_away"]).astype(int)
+    df["real"], df["pred"] = real, pred
+    df["exact"] = (df["pred_home"] == df["home_goals"]) & (df["pred_away"] == df["away_goals"])
+    df["hit"] = real == pred
+
+    probs = df[["p_home", "p_draw", "p_away"]].to_numpy(dtype=float)
+    missing = np.isnan(probs).any(axis=1)
+    conf = np.clip(df["confidence"].fillna(0).to_numpy(dtype=float) / 100.0, 1 / 3, 1 - EPS)
+    implied = np.repeat(((1 - conf) / 2)[:, None], 3, axis=1)
+    implied[np.arange(len(df)), pred] = conf
+    probs[missing] = implied[missing]
+    df[["q_home", "q_draw", "q_away"]] = probs
+    df["prob_source"] = np.where(missing, "confidence", "model")
+    # confiança efetiva = prob. atribuída ao resultado previsto
+    df["q_pred"] = probs[np.arange(len(df)), pred]
+    return df
+
+
+# ---------------- acumuladores ----------------
+# Somas aditivas: o backtest roda dia a dia e junta os pedaços (checkpoint).
+
+_SUMS = ("n", "exact", "hit", "brier", "log_loss", "conf")
+
+
+def _empty() -> Dict[str, Any]:
+    return {"total_finished": 0, "fixtures": 0, "all": dict.fromkeys(_SUMS, 0.0),
+            "calibration": {}, "by_model": {}, "by_league": {}}
+
+
+def _row_sums(df: pd.DataFrame) -> pd.DataFrame:
+    probs = df[["q_home", "q_draw", "q_away"]].to_numpy(dtype=float)
+    onehot = np.eye(3)[df["real"].to_numpy()]
+    p_real = np.clip((probs * onehot).sum(axis=1), EPS, 1.0)
+    return pd.DataFrame({
+        "n": 1.0,
+        "exact": df["exact"].astype(float),
+        "hit": df["hit"].astype(float),
+        "brier": ((probs - onehot) ** 2).sum(axis=1),
+        "log_loss": -np.log(p_real),
+        "conf": df["q_pred"].astype(float),
+    }, index=df.index)
+
+
+def _grouped(sums: pd.DataFrame, key: pd.Series) -> Dict[str, Dict[str, float]]:
+    g = sums.groupby(key.astype(str), observed=True).sum()
+    return {k: {c: float(v) for c, v in row.items()} for k, row in g.iterrows()}
+
+
+def accumulate(df: pd.DataFrame, total_finished: int = 0) -> Dict[str, Any]:
+    """Somas de um pedaço (já passado por prepare)."""
+    acc = _empty()
+    acc["total_finished"] = total_finished
+    if df.empty:
+        return acc
+    sums = _row_sums(df)
+    acc["fixtures"] = int(df["fixture_id"].nunique())
+    acc["all"] = {c: float(v) for c, v in sums.sum().items()}
+    bucket = pd.cut(df["q_pred"] * 100, CONF_BUCKETS, include_lowest=True, right=False)
+    labels = bucket.map(lambda iv: f"{int(iv.left)}-{int(iv.right)}")
+    acc["calibration"] = _grouped(sums, labels)
+    acc["by_model"] = _grouped(sums, df["model"])
+    acc["by_league"] = _grouped(sums, df["league_id"])
+    return acc
+
+
+def _add(a: Dict[str, float], b: Dict[str, float]) -> Dict[str, float]:
+    return {k: a.get(k, 0.0) + b.get(k, 0.0) for k in _SUMS}
+
+
+def merge(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
+    out = {"total_finished": a["total_finished"] + b["total_finished"],
+           "fixtures": a["fixtures"] + b["fixtures"],
+           "all": _add(a["all"], b["all"])}
+    for part in ("calibration", "by_model", "by_league"):
+        keys = set(a[part]) | set(b[part])
+        out[part] = {k: _add(a[part].get(k, {}), b[part].get(k, {})) for k in keys}
+    return out
+
+
+def _scores(s: Dict[str, float]) -> Dict[str, Any]:
+    n = s.get("n", 0)
+    if not n:
+        return {"n": 0}
+    return {
+        "n": int(n),
+        "exact_score_accuracy": round(s["exact"] / n, 4),
+        "outcome_accuracy": round(s["hit"] / n, 4),
+        "brier": round(s["brier"] / n, 4),
+        "log_loss": round(s["log_loss"] / n, 4),
+        "mean_confidence": round(s["conf"] / n, 4),
+    }
+
+
+def finalize(acc: Dict[str, Any]) -> Dict[str, Any]:
+    calibration = [
+        {"bucket": k, "n": int(v["n"]), "confidence": round(v["conf"] / v["n"], 4),
+         "accuracy": round(v["hit"] / v["n"], 4)}
+        for k, v in sorted(acc["calibration"].items(), key=lambda kv: int(kv[0].split("-")[0]))
+    ]
+    return {
+        "total_finished": acc["total_finished"],
+        "predictions_found": acc["fixtures"],
+        **_scores(acc["all"]),
+        "calibration": calibration,
+        "by_model": {k: _scores(v) for k, v in sorted(acc["by_model"].items())},
+        "by_league": {k: _scores(v) for k, v in sorted(acc["by_league"].items())},
+    }
+
+
+def evaluate(df: pd.DataFrame, total_finished: int = 0) -> Dict[str, Any]:
+    return finalize(accumulate(prepare(df), total_finished))
+
+
+def _count_finished(league_id, season, from_date, to_date) -> int:
+    where, params = _where(league_id, season, from_date, to_date)
+    with reader() as c:
+        return c.execute(f"SELECT COUNT(*) FROM matches m WHERE {where}", params).fetchone()[0]
+
+
+# ---------------- execuções persistentes (backtest_runs) ----------------
+# Cada execução avança dia a dia: ao fim de cada dia grava checkpoint (último dia
+# concluído) + somas parciais. Se o processo cair, outra chamada de execute_run
+# retoma do dia seguinte ao checkpoint. Cancelamento é checado entre dias.
+
+def _now_iso() -> str:
+    return datetime.utcnow().isoformat()
+
+
+def _days(from_date: str, to_date: str) -> List[str]:
+    d, end = date.fromisoformat(from_date), date.fromisoformat(to_date)
+    out = []
+    while d <= end:
+        out.append(d.isoformat())
+        d += timedelta(days=1)
+    return out
+
+
+def create_run(league_id: Optional[int], season: Optional[int], from_date: str, to_date: str,
+               model: Optional[str] = None) -> int:
+    _days(from_date, to_date)  # valida as datas antes de gravar
+    with transaction() as c:
+        return c.execute("""
+          INSERT INTO backtest_runs(created_at_iso, league_id, season, from_date, to_date, model,
+                                    status, progress, updated_at)
+          VALUES(?,?,?,?,?,?,'queued',0,?)
+        """, (_now_iso(), league_id, season, from_date, to_date, model, time.time())).lastrowid
+
+
+def get_run(run_id: int) -> Optional[Dict[str, Any]]:
+    with reader() as c:
+        row = c.execute("""
+          SELECT id, created_at_iso, league_id, season, from_date, to_date, model, status, progress,
+                 checkpoint, error, worker, metrics_json, cancel_requested
+          FROM backtest_runs WHERE id=?
+        """, (run_id,)).fetchone()
+    if not row:
+        return None
+    d = dict(row)
+    d["metrics"] = json.loads(d.pop("metrics_json")) if d.get("metrics_json") else None
+    d["cancel_requested"] = bool(d["cancel_requested"])
+    return d
+
+
+def cancel_run(run_id: int) -> bool:
+    with transaction() as c:
+        # na fila: cancela já; rodando: o executor para no fim do dia atual
+        c.execute("UPDATE backtest_runs SET status='cancelled', updated_at=? WHERE id=? AND status='queued'",
+                  (time.time(), run_id))
+        return c.execute("""
+          UPDATE backtest_runs SET cancel_requested=1 WHERE id=? AND status IN ('queued', 'running', 'cancelled')
+        """, (run_id,)).rowcount > 0
+
+
+def _claim(run_id: int, worker: str) -> Optional[Dict[str, Any]]:
+    now = time.time()
+    with transaction() as c:
+        row = c.execute("""
+          UPDATE backtest_runs SET status='running', worker=?, updated_at=?
+          WHERE id=? AND (status='queued' OR (status='running' AND updated_at < ?))
+          RETURNING *
+        """, (worker, now, run_id, now - BACKTEST_STALE_SECONDS)).fetchone()
+    return dict(row) if row else None
+
+
+def _checkpoint(run_id: int, day: str, progress: float, acc: Dict[str, Any]) -> bool:
+    """Grava o dia concluído; devolve False se pediram cancelamento."""
+    with transaction() as c:
+        c.execute("""
+          UPDATE backtest_runs SET checkpoint=?, progress=?, partial_json=?, updated_at=? WHERE id=?
+        """, (day, progress, json.dumps(acc), time.time(), run_id))
+        row = c.execute("SELECT cancel_requested FROM backtest_runs WHERE id=?", (run_id,)).fetchone()
+    return not row["cancel_requested"]
+
+
+def _close(run_id: int, status: str, metrics: Optional[dict] = None, error: Optional[str] = None) -> None:
+    with transaction() as c:
+        c.execute("""
+          UPDATE backtest_runs SET status=?, metrics_json=COALESCE(?, metrics_json), error=?,
+                 progress=CASE WHEN ?='done' THEN 1 ELSE progress END, updated_at=?
+          WHERE id=?
+        """, (status, json.dumps(metrics, ensure_ascii=False) if metrics else None, error, status,
+              time.time(), run_id))
+
+
+def execute_run(run_id: int) -> Optional[Dict[str, Any]]:
+    """Roda (ou retoma) uma execução. None se outro processo já está com ela."""
+    run = _claim(run_id, f"{os.getpid()}")
+    if run is None:
+        return None
     try:
-        from_dt = datetime.strptime(from_date, "%Y-%m-%d").date()
-        to_dt = datetime.strptime(to_date, "%Y-%m-%d").date()
-        days = []
-        d = from_dt
-        while d <= to_dt:
-            days.append(d.isoformat())
-            d = d.fromordinal(d.toordinal() + 1)
-
-        fixtures: List[dict] = []
+        days = _days(run["from_date"], run["to_date"])
+        acc = json.loads(run["partial_json"]) if run.get("partial_json") else _empty()
+        if run.get("checkpoint"):
+            days = [d for d in days if d > run["checkpoint"]]
+        total = len(_days(run["from_date"], run["to_date"]))
         for day in days:
-            fixtures.extend(api.fixtures_by_date_league(day, league_id, season, timezone=None))
-
-        c = conn()
-        preds = c.execute("""
-          SELECT fixture_id, scoreline
-          FROM predictions
-          WHERE fixture_id IN (%s)
-        """ % ",".join(["?"] * len({fx["fixture"]["id"] for fx in fixtures})),
-        [fx["fixture"]["id"] for fx in fixtures]).fetchall() if fixtures else []
-        c.close()
-
-        pred_map = {row["fixture_id"]: row["scoreline"] for row in preds}
-
-        total = 0
-        exact = 0
-        outcome = 0
-        missing = 0
-
-        for fx in fixtures:
-            fid = fx["fixture"]["id"]
-            status = fx["fixture"]["status"]["short"]
-            goals = fx.get("goals", {})
-            hg, ag = goals.get("home"), goals.get("away")
-            if status not in ("FT", "AET", "PEN"):  # finalizados
-                continue
-            if hg is None or ag is None:
-                continue
-
-            total += 1
-            if fid not in pred_map:
-                missing += 1
-                continue
-
-            ph, pa = _parse_scoreline(pred_map[fid])
-            if ph < 0:
-                continue
-
-            if ph == hg and pa == ag:
-                exact += 1
-
-            real = 0 if hg == ag else (1 if hg > ag else -1)
-            pred = 0 if ph == pa else (1 if ph > pa else -1)
-            if real == pred:
-                outcome += 1
-
-        metrics = {
-            "total_finished": total,
-            "predictions_found": total - missing,
-            "exact_score_accuracy": (exact / (total - missing)) if (total - missing) > 0 else 0.0,
-            "outcome_accuracy": (outcome / (total - missing)) if (total - missing) > 0 else 0.0,
-        }
-
-        c = conn()
-        c.execute("""
-          INSERT INTO backtest_runs(created_at_iso, league_id, season, from_date, to_date, metrics_json)
-          VALUES(?,?,?,?,?,?)
-        """, (
-            datetime.utcnow().isoformat(),
-            league_id, season, from_date, to_date,
-            json.dumps(metrics, ensure_ascii=False),
-        ))
-        c.commit()
-        c.close()
-
-        return metrics
-
-    finally:
-        api.close()
+            df = prepare(load_frame(run["league_id"], run["season"], day, day, run["model"]))
+            acc = merge(acc, accumulate(df, _count_finished(run["league_id"], run["season"], day, day)))
+            done = total - len(days) + days.index(day) + 1
+            if not _checkpoint(run_id, day, round(done / total, 4), acc):
+                _close(run_id, "cancelled")
+                return get_run(run_id)
+        _close(run_id, "done", finalize(acc))
+    except Exception as e:
+        log.exception("Backtest %s falhou", run_id)
+        _close(run_id, "failed", error=f"{type(e).__name__}: {e}")
+    return get_run(run_id)
+
+
+def run_backtest(league_id: Optional[int], season: Optional[int], from_date: str, to_date: str,
+                 model: Optional[str] = None) -> Dict[str, Any]:
+    """Síncrono (scripts): cria a execução e roda neste processo."""
+    run = execute_run(create_run(league_id, season, from_date, to_date, model))
+    return run["metrics"] or {"error": run["error"]}
+
+
+# ---------------- execução em segundo plano ----------------
+# Pool de processos (spawn: cada processo abre suas próprias conexões SQLite).
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=BACKTEST_PROCESSES,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def submit_runs(targets: List[Tuple[Optional[int], Optional[int]]], from_date: str, to_date: str,
+                model: Optional[str] = None) -> List[int]:
+    """Uma execução por (liga, season), distribuídas no pool de processos."""
+    ids = [create_run(league_id, season, from_date, to_date, model) for league_id, season in targets]
+    for run_id in ids:
+        _pool().submit(execute_run, run_id)
+    return ids
+
+
+def resume_runs() -> List[int]:
+    """Reenvia ao pool execuções na fila ou interrompidas (processo caiu)."""
+    with reader() as c:
+        rows = c.execute("""
+          SELECT id FROM backtest_runs
+          WHERE status='queued' OR (status='running' AND updated_at < ?)
+          ORDER BY id
+        """, (time.time() - BACKTEST_STALE_SECONDS,)).fetchall()
+    ids = [r["id"] for r in rows]
+    for run_id in ids:
+        _pool().submit(execute_run, run_id)
+    return ids
+
+
+def shutdown_pool() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
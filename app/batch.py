@@ -0,0 +1,173 @@
+import json
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from .config import APP_TZ, DOSSIER_CONCURRENCY, BATCH_LLM_CONCURRENCY, BATCH_LLM_RATE_PER_MIN, BATCH_FLUSH_SIZE
+from .dossier import assemble_dossier, match_info
+from .poisson import MODEL_NAME as POISSON, predict_dossiers
+from .fixtures_index import index_fixtures
+from .predictors import analyze_dossier, find_reusable, prepare_prompt, store_predictions
+from .providers.apifootball import AsyncAPIFootball
+from .quota import PREFETCH
+
+log = logging.getLogger("matchlab.batch")
+
+# Previsão de uma rodada inteira: enumera os jogos da liga no intervalo, monta
+# os dossiês com uma única tabela (standings) e roda o LLM com concorrência e
+# ritmo limitados. Resultados saem um a um (NDJSON); gravação em lotes.
+
+
+class _RateLimiter:
+    """No máx. per_min liberações por minuto, espaçadas por igual."""
+
+    def __init__(self, per_min: float):
+        self.interval = 60.0 / per_min if per_min else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+            self._next = max(now, self._next) + self.interval
+
+
+def _team(fx: Dict[str, Any], side: str) -> Dict[str, Any]:
+    t = (fx.get("teams") or {}).get(side) or {}
+    return {"id": t.get("id"), "name": t.get("name")}
+
+
+async def run_batch(
+    league_id: int,
+    season: int,
+    from_date: str,
+    to_date: str,
+    tz: Optional[str] = None,
+    recent_n: int = 5,
+    h2h_n: int = 10,
+    mode: str = "full",
+    model: str = "openai",
+    force: bool = False,
+    concurrency: int = BATCH_LLM_CONCURRENCY,
+    rate_per_min: float = BATCH_LLM_RATE_PER_MIN,
+) -> AsyncIterator[Dict[str, Any]]:
+    tz = tz or APP_TZ
+    # rodada inteira: abaixo do /predict interativo na fila de cota
+    api = AsyncAPIFootball(max_concurrency=DOSSIER_CONCURRENCY, priority=PREFETCH)
+
+    fixtures = await api.fixtures_by_league_range(league_id, season, from_date, to_date, tz)
+    fixtures = [fx for fx in fixtures if (fx.get("fixture") or {}).get("id")]
+    # alimenta índice de fixtures + catálogo de times: nada de team_search no lote
+    index_fixtures(fixtures)
+
+    if model == POISSON:
+        # modelo local: todos os jogos numa chamada vetorizada, sem dossiê nem LLM
+        async for ev in _run_poisson(fixtures, season, tz):
+            yield ev
+        return
+
+    # uma tabela só para todos os jogos da liga
+    try:
+        standings = await api.standings(league_id, season=season)
+    except Exception:
+        standings = None  # sem tabela no lote: cada dossiê usa a do cache (ou busca/degrada)
+
+    yield {"type": "start", "fixtures": len(fixtures)}
+
+    llm_sem = asyncio.Semaphore(max(1, concurrency))
+    limiter = _RateLimiter(rate_per_min)
+
+    async def one(fx: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[dict], Optional[dict], Optional[str]]:
+        # dossier None com result: previsão reaproveitada, já está gravada
+        try:
+            f = fx["fixture"]
+            kickoff_local = datetime.fromtimestamp(f["timestamp"], ZoneInfo(tz))
+            dossier = await assemble_dossier(
+                api, fx, season, _team(fx, "home"), _team(fx, "away"), kickoff_local, tz,
+                season, league_id, recent_n, h2h_n, standings=standings,
+            )
+            prepared = prepare_prompt(dossier, mode)
+            if not force:
+                hit = await asyncio.to_thread(find_reusable, dossier, prepared[2])
+                if hit:
+                    return fx, None, hit, None
+            async with llm_sem:
+                await limiter.wait()
+                result = await asyncio.to_thread(analyze_dossier, dossier, mode, prepared)
+            return fx, dossier, result, None
+        except Exception as e:
+            return fx, None, None, f"{type(e).__name__}: {e}"
+
+    tasks = [asyncio.create_task(one(fx)) for fx in fixtures]
+    pending: List[Tuple[dict, dict]] = []
+    done = failed = 0
+    try:
+        for fut in asyncio.as_completed(tasks):
+            fx, dossier, result, error = await fut
+            if error:
+                failed += 1
+                yield {
+                    "type": "error",
+                    "fixture_id": fx["fixture"]["id"],
+                    "home": _team(fx, "home")["name"],
+                    "away": _team(fx, "away")["name"],
+                    "error": error,
+                }
+                continue
+
+            done += 1
+            if dossier is not None:
+                pending.append((dossier, result))
+            if len(pending) >= BATCH_FLUSH_SIZE:
+                await asyncio.to_thread(store_predictions, pending)
+                pending = []
+            yield {"type": "result", **result}
+
+        # fim normal: o último lote está gravado antes do "end"
+        if pending:
+            await asyncio.to_thread(store_predictions, pending)
+            pending = []
+        yield {"type": "end", "done": done, "failed": failed}
+    finally:
+        # cliente desconectou no meio: cancela o que falta e grava o que já saiu
+        # numa thread sem await (o gerador cancelado não pode mais esperar;
+        # thread não-daemon: o shutdown espera)
+        for t in tasks:
+            t.cancel()
+        if pending:
+            threading.Thread(target=_flush_detached, args=(pending,), name="batch-flush").start()
+
+
+def _flush_detached(pending: List[Tuple[dict, dict]]) -> None:
+    try:
+        store_predictions(pending)
+    except Exception:
+        log.exception("Lote: falha ao gravar %d previsões após desconexão", len(pending))
+
+
+async def _run_poisson(fixtures: List[Dict[str, Any]], season: int, tz: str) -> AsyncIterator[Dict[str, Any]]:
+    yield {"type": "start", "fixtures": len(fixtures)}
+    dossiers = [
+        {"match": match_info(
+            fx, season, _team(fx, "home"), _team(fx, "away"),
+            datetime.fromtimestamp(fx["fixture"]["timestamp"], ZoneInfo(tz)), tz, season,
+        )}
+        for fx in fixtures
+    ]
+    results = await asyncio.to_thread(predict_dossiers, dossiers)
+    await asyncio.to_thread(store_predictions, list(zip(dossiers, results)))
+    for r in results:
+        yield {"type": "result", **r}
+    yield {"type": "end", "done": len(results), "failed": 0}
+
+
+async def ndjson(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    async for ev in events:
+        yield (json.dumps(ev, ensure_ascii=False) + "\n").encode("utf-8")
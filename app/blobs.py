@@ -0,0 +1,129 @@
+import json
+import zlib
+import hashlib
+import sqlite3
+from typing import Any, Iterable, NamedTuple, Optional
+
+from .config import BLOB_ZLIB_LEVEL, BLOB_ZSTD_LEVEL
+
+try:  # opcional: zstd comprime melhor e mais rápido; sem ele, zlib
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Armazenamento por conteúdo (tabela blobs): dossiês e relatórios ficam uma vez
+# só, comprimidos, e as linhas de matches/predictions guardam apenas o hash.
+# O hash é do conteúdo original (antes de comprimir): o mesmo texto sempre cai
+# no mesmo blob, qualquer que seja o codec.
+
+
+class Blob(NamedTuple):
+    hash: str
+    codec: str
+    size: int
+    data: bytes
+
+
+def canonical_json(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def _compress(raw: bytes):
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=BLOB_ZSTD_LEVEL).compress(raw)
+    return "zlib", zlib.compress(raw, BLOB_ZLIB_LEVEL)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Blob em zstd, mas o pacote zstandard não está instalado.")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "raw":
+        return data
+    raise RuntimeError(f"Codec de blob desconhecido: {codec}")
+
+
+def pack_text(text: str) -> Blob:
+    raw = text.encode("utf-8")
+    codec, data = _compress(raw)
+    if len(data) >= len(raw):
+        codec, data = "raw", raw  # texto curto: comprimir só aumenta
+    return Blob(hashlib.sha256(raw).hexdigest(), codec, len(raw), data)
+
+
+def pack_json(obj: Any) -> Blob:
+    return pack_text(canonical_json(obj))
+
+
+def store(c: sqlite3.Connection, blobs: Iterable[Optional[Blob]]) -> None:
+    """Grava os blobs que ainda não existem (chamar dentro de transaction())."""
+    c.executemany(
+        "INSERT OR IGNORE INTO blobs(hash, codec, size, data) VALUES(?,?,?,?)",
+        [tuple(b) for b in blobs if b is not None],
+    )
+
+
+def load_text(c: sqlite3.Connection, h: Optional[str]) -> Optional[str]:
+    if not h:
+        return None
+    row = c.execute("SELECT codec, data FROM blobs WHERE hash=?", (h,)).fetchone()
+    if row is None:
+        return None
+    return _decompress(row["codec"], row["data"]).decode("utf-8")
+
+
+def load_json(c: sqlite3.Connection, h: Optional[str]) -> Any:
+    text = load_text(c, h)
+    return json.loads(text) if text is not None else None
+
+
+def blob_stats(c: sqlite3.Connection) -> dict:
+    row = c.execute("""
+      SELECT COUNT(*) n, COALESCE(SUM(size), 0) raw_bytes, COALESCE(SUM(LENGTH(data)), 0) stored_bytes
+      FROM blobs
+    """).fetchone()
+    return {"blobs": row["n"], "raw_bytes": row["raw_bytes"], "stored_bytes": row["stored_bytes"]}
+
+
+def migrate_inline(c: sqlite3.Connection, batch: int = 500) -> None:
+    """
+    Migração única: move matches.raw_json, predictions.dossier_json e
+    predictions.report_text para a tabela blobs (deduplicando) e zera as colunas.
+    """
+    jobs = [
+        ("matches", "fixture_id", [("raw_json", "raw_hash", True)]),
+        ("predictions", "id", [("dossier_json", "dossier_hash", True), ("report_text", "report_hash", False)]),
+    ]
+    for table, pk, cols in jobs:
+        last = None
+        while True:
+            where = f"WHERE {pk} > ?" if last is not None else ""
+            rows = c.execute(
+                f"SELECT {pk}, {', '.join(src for src, _, _ in cols)} FROM {table} {where} ORDER BY {pk} LIMIT ?",
+                ((last,) if last is not None else ()) + (batch,),
+            ).fetchall()
+            if not rows:
+                break
+            for r in rows:
+                packed = []
+                for src, _, is_json in cols:
+                    v = r[src]
+                    if v is None:
+                        packed.append(None)
+                        continue
+                    if is_json:
+                        try:
+                            v = canonical_json(json.loads(v))
+                        except ValueError:
+                            pass  # guarda como está
+                    packed.append(pack_text(v))
+                store(c, packed)
+                sets = ", ".join(f"{dst}=?, {src}=NULL" for src, dst, _ in cols)
+                c.execute(
+                    f"UPDATE {table} SET {sets} WHERE {pk}=?",
+                    tuple(b.hash if b else None for b in packed) + (r[pk],),
+                )
+            last = rows[-1][pk]
@@ -1,30 +1,217 @@
 import json
 import time
-from typing import Any, Optional
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
 from .db import conn
-from .config import CACHE_TTL_SECONDS
+from .config import (
+    CACHE_TTL_SECONDS,
+    CACHE_MEM_MAX_BYTES,
+    CACHE_DB_MAX_ROWS,
+    CACHE_SWEEP_SECONDS,
+)
+
+# Dois níveis:
+#   1) memória: LRU limitado por bytes (valor já decodificado)
+#   2) SQLite: tabela `cache`, conexão persistente, expiração por sweeper
+# Valores devolvidos pelo nível de memória são compartilhados: não mutar.
+# _lock protege só memória/contadores (nunca fica preso em I/O); o SQLite tem
+# _db_lock. Ordem: _db_lock antes de _lock. No event loop, use as versões
+# *_async: acerto em memória na hora, disco numa thread.
+
+_lock = threading.Lock()
+_db_lock = threading.Lock()
+_counters = {
+    "mem_hits": 0,
+    "db_hits": 0,
+    "misses": 0,
+    "sets": 0,
+    "mem_evictions": 0,
+    "db_evictions": 0,
+    "expired": 0,
+}
+
+
+def _count(name: str, n: int = 1) -> None:
+    _counters[name] += n
+
+
+class _MemoryLRU:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()  # k -> (expires_at, value, size)
+
+    def get(self, key: str):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if item[0] < time.time():
+            self.pop(key)
+            return None
+        self._items.move_to_end(key)
+        return item
+
+    def put(self, key: str, value: Any, expires_at: int, size: int) -> None:
+        self.pop(key)
+        if size > self.max_bytes:
+            return  # não cabe: fica só no SQLite
+        self._items[key] = (expires_at, value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, _, sz) = self._items.popitem(last=False)
+            self.bytes -= sz
+            _count("mem_evictions")
+
+    def pop(self, key: str) -> None:
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.bytes -= item[2]
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        dead = [k for k, (exp, _, _) in self._items.items() if exp < now]
+        for k in dead:
+            self.pop(k)
+        return len(dead)
+
+    def __len__(self):
+        return len(self._items)
+
+
+_mem = _MemoryLRU(CACHE_MEM_MAX_BYTES)
+_db: Optional[sqlite3.Connection] = None
+
+
+def _sqlite() -> sqlite3.Connection:
+    # conexão única e persistente (uso sempre sob _db_lock)
+    global _db
+    if _db is None:
+        _db = conn(check_same_thread=False)
+    return _db
+
+
+def cache_peek(key: str) -> Optional[Any]:
+    """Só o nível de memória (não toca o SQLite). None = não está na memória."""
+    with _lock:
+        item = _mem.get(key)
+        if item is None:
+            return None
+        _count("mem_hits")
+        return item[1]
+
 
 def cache_get(key: str) -> Optional[Any]:
-    c = conn()
-    row = c.execute("SELECT v, expires_at FROM cache WHERE k=?", (key,)).fetchone()
-    c.close()
-    if not row:
-        return None
-    if row["expires_at"] < int(time.time()):
-        cache_del(key)
-        return None
-    return json.loads(row["v"])
+    value = cache_peek(key)
+    if value is not None:
+        return value
+
+    with _db_lock:
+        row = _sqlite().execute("SELECT v, expires_at FROM cache WHERE k=?", (key,)).fetchone()
+        if not row or row["expires_at"] < int(time.time()):
+            with _lock:
+                _count("misses")
+            return None  # expirado: o sweeper apaga
+
+        value = json.loads(row["v"])
+        # ainda sob _db_lock: nenhum set/del entre a leitura e a cópia em memória
+        with _lock:
+            _mem.put(key, value, row["expires_at"], len(row["v"]))
+            _count("db_hits")
+        return value
+
 
 def cache_set(key: str, value: Any, ttl_seconds: int = CACHE_TTL_SECONDS) -> None:
-    c = conn()
     expires = int(time.time()) + int(ttl_seconds)
-    c.execute("INSERT OR REPLACE INTO cache(k,v,expires_at) VALUES(?,?,?)",
-              (key, json.dumps(value, ensure_ascii=False), expires))
-    c.commit()
-    c.close()
+    raw = json.dumps(value, ensure_ascii=False)
+    with _db_lock:
+        db = _sqlite()
+        db.execute("INSERT OR REPLACE INTO cache(k,v,expires_at) VALUES(?,?,?)", (key, raw, expires))
+        db.commit()
+        with _lock:
+            _mem.put(key, value, expires, len(raw))
+            _count("sets")
+
 
 def cache_del(key: str) -> None:
-    c = conn()
-    c.execute("DELETE FROM cache WHERE k=?", (key,))
-    c.commit()
-    c.close()
+    with _db_lock:
+        db = _sqlite()
+        db.execute("DELETE FROM cache WHERE k=?", (key,))
+        db.commit()
+        with _lock:
+            _mem.pop(key)
+
+
+async def cache_get_async(key: str) -> Optional[Any]:
+    value = cache_peek(key)
+    if value is None:
+        value = await asyncio.to_thread(cache_get, key)
+    return value
+
+
+async def cache_set_async(key: str, value: Any, ttl_seconds: int = CACHE_TTL_SECONDS) -> None:
+    await asyncio.to_thread(cache_set, key, value, ttl_seconds)
+
+
+def cache_sweep(max_rows: int = CACHE_DB_MAX_ROWS) -> Dict[str, int]:
+    """
+    Apaga expirados (usa idx_cache_expires) e, se a tabela passar de max_rows,
+    remove as entradas que venceriam primeiro.
+    """
+    with _db_lock:
+        db = _sqlite()
+        expired = db.execute("DELETE FROM cache WHERE expires_at < ?", (int(time.time()),)).rowcount
+
+        evicted = 0
+        total = db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if max_rows and total > max_rows:
+            evicted = db.execute("""
+              DELETE FROM cache WHERE k IN (
+                SELECT k FROM cache ORDER BY expires_at ASC LIMIT ?
+              )
+            """, (total - max_rows,)).rowcount
+        db.commit()
+
+    with _lock:
+        expired += _mem.purge_expired()
+        _count("expired", expired)
+        _count("db_evictions", evicted)
+    return {"expired": expired, "evicted": evicted}
+
+
+_sweeper: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+def start_sweeper(interval: int = CACHE_SWEEP_SECONDS) -> None:
+    global _sweeper
+    if _sweeper is not None and _sweeper.is_alive():
+        return
+    _stop.clear()
+
+    def loop():
+        while not _stop.wait(interval):
+            try:
+                cache_sweep()
+            except Exception:
+                pass
+
+    _sweeper = threading.Thread(target=loop, name="cache-sweeper", daemon=True)
+    _sweeper.start()
+
+
+def stop_sweeper() -> None:
+    _stop.set()
+
+
+def cache_stats() -> Dict[str, Any]:
+    with _lock:
+        out = dict(_counters)
+        out["mem_items"] = len(_mem)
+        out["mem_bytes"] = _mem.bytes
+        out["mem_max_bytes"] = _mem.max_bytes
+        lookups = out["mem_hits"] + out["db_hits"] + out["misses"]
+        out["hit_ratio"] = ((out["mem_hits"] + out["db_hits"]) / lookups) if lookups else 0.0
+        return out
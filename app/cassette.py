@@ -0,0 +1,319 @@
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+import httpx
+
+from .blobs import Blob, load_text, pack_json, pack_text, store
+from .config import CASSETTE_RECORD
+
+# Cassetes: gravação das respostas dos providers (API-Football, The Odds API,
+# OpenAI) num SQLite à parte, para rodar dossiê, backtest e bot sem rede.
+#
+#  - gravar: CASSETTE_RECORD=./data/cassettes/x.sqlite. Os clientes do POOL
+#    passam por RecordingTransport, que copia cada resposta (corpo inteiro,
+#    status, content-type e tempos) sem atrasar quem consome (stream incluso).
+#  - reproduzir: python -m app.fake_upstream --cassette ./data/cassettes/x.sqlite
+#    e as URLs base dos providers apontando para ele (ver app/fake_upstream.py).
+#
+# Corpos de requisição e resposta vão para a tabela blobs (mesmo formato de
+# app/blobs.py): comprimidos e sem repetição (a mesma tabela de classificação
+# baixada 50x ocupa uma vez). Chaves de API não são gravadas: cabeçalhos de
+# requisição ficam de fora e parâmetros como apiKey saem da query.
+# O path é gravado relativo à URL base do provider (/fixtures, /sports/x/odds,
+# /responses), então o stand-in atende todos na mesma porta.
+
+_SECRET_PARAMS = {"apikey", "api_key", "key", "token", "access_token"}
+_KEEP_HEADERS = ("content-type",)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs(
+  hash TEXT PRIMARY KEY,
+  codec TEXT NOT NULL,
+  size INTEGER NOT NULL,
+  data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS interactions(
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  provider TEXT NOT NULL,
+  method TEXT NOT NULL,
+  path TEXT NOT NULL,
+  query TEXT NOT NULL,
+  request_hash TEXT,
+  status INTEGER NOT NULL,
+  headers TEXT NOT NULL,
+  response_hash TEXT NOT NULL,
+  latency_ms REAL NOT NULL,
+  duration_ms REAL NOT NULL,
+  recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_interactions_match ON interactions(method, path, query, request_hash, id);
+"""
+
+
+class Interaction(NamedTuple):
+    id: int
+    provider: str
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+    latency_ms: float   # até os cabeçalhos
+    duration_ms: float  # até o fim do corpo
+
+
+def normalize_query(items: Iterable[Tuple[str, str]]) -> str:
+    """Query em ordem fixa e sem chaves de API (mesma regra na gravação e no replay)."""
+    return urlencode(sorted((k, v) for k, v in items if k.lower() not in _SECRET_PARAMS))
+
+
+def relative_path(path: str, base_url: str) -> str:
+    prefix = urlsplit(base_url).path.rstrip("/")
+    if prefix and path.startswith(prefix):
+        path = path[len(prefix):]
+    return path or "/"
+
+
+def _request_blob(content: bytes) -> Optional[Blob]:
+    if not content:
+        return None
+    text = content.decode("utf-8", "replace")
+    try:
+        # JSON canônico: ordem das chaves não muda o hash
+        return pack_json(json.loads(text))
+    except ValueError:
+        return pack_text(text)
+
+
+class Cassette:
+    def __init__(self, path: str):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._c = sqlite3.connect(path, check_same_thread=False)
+        self._c.row_factory = sqlite3.Row
+        self._c.execute("PRAGMA journal_mode=WAL")
+        self._c.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        # replay: quantas vezes cada requisição já foi servida (segue a ordem gravada)
+        self._served: Dict[tuple, int] = {}
+        self.recorded = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._c.close()
+
+    # ---------------- gravação ----------------
+
+    def record(self, provider: str, base_url: str, request: httpx.Request, response: httpx.Response,
+               raw: bytes, latency: float, duration: float) -> None:
+        # raw ainda vem com content-encoding: decodifica como o cliente faria
+        body = httpx.Response(response.status_code, headers=response.headers, content=raw).read()
+        try:
+            req_blob = _request_blob(request.content)
+        except httpx.RequestNotRead:
+            req_blob = None
+        resp_blob = pack_text(body.decode("utf-8", "replace"))
+        headers = {k.lower(): v for k, v in response.headers.items()
+                   if k.lower() in _KEEP_HEADERS or k.lower().startswith("x-ratelimit")}
+        row = (
+            provider,
+            request.method,
+            relative_path(request.url.path, base_url),
+            normalize_query(request.url.params.multi_items()),
+            req_blob.hash if req_blob else None,
+            response.status_code,
+            json.dumps(headers),
+            resp_blob.hash,
+            latency * 1000,
+            duration * 1000,
+            time.time(),
+        )
+        with self._lock:
+            store(self._c, [req_blob, resp_blob])
+            self._c.execute(
+                """
+                INSERT INTO interactions(provider, method, path, query, request_hash, status, headers,
+                                         response_hash, latency_ms, duration_ms, recorded_at)
+                VALUES(?,?,?,?,?,?,?,?,?,?,?)
+                """,
+                row,
+            )
+            self._c.commit()
+            self.recorded += 1
+
+    # ---------------- replay ----------------
+
+    def lookup(self, method: str, path: str, query: str, content: bytes = b"",
+               loose: bool = False) -> Optional[Tuple[Interaction, str]]:
+        """
+        Resposta gravada para a requisição, e o tipo do acerto ("exact" ou "loose").
+        A mesma requisição gravada N vezes (ex.: escalação antes e depois de sair)
+        é servida na ordem da gravação, repetindo a última.
+        loose: se o corpo não bater, aceita outra gravação do mesmo método/path/query.
+        """
+        blob = _request_blob(content)
+        req_hash = blob.hash if blob else None
+        with self._lock:
+            ids = [r["id"] for r in self._c.execute(
+                "SELECT id FROM interactions WHERE method=? AND path=? AND query=? AND request_hash IS ? ORDER BY id",
+                (method, path, query, req_hash),
+            )]
+            kind = "exact"
+            if not ids and loose:
+                ids = [r["id"] for r in self._c.execute(
+                    "SELECT id FROM interactions WHERE method=? AND path=? AND query=? ORDER BY id",
+                    (method, path, query),
+                )]
+                kind = "loose"
+            if not ids:
+                return None
+            key = (method, path, query, req_hash if kind == "exact" else None)
+            n = self._served.get(key, 0)
+            self._served[key] = n + 1
+            row = self._c.execute("SELECT * FROM interactions WHERE id=?", (ids[min(n, len(ids) - 1)],)).fetchone()
+            body = load_text(self._c, row["response_hash"]) or ""
+        return Interaction(row["id"], row["provider"], row["status"], json.loads(row["headers"]),
+                           body.encode("utf-8"), row["latency_ms"], row["duration_ms"]), kind
+
+    def rewind(self) -> None:
+        with self._lock:
+            self._served.clear()
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._c.execute(
+                """
+                SELECT provider, method, path, COUNT(*) AS n,
+                       AVG(latency_ms) AS latency_avg_ms, MAX(latency_ms) AS latency_max_ms
+                FROM interactions GROUP BY provider, method, path ORDER BY provider, n DESC
+                """
+            ).fetchall()
+            blobs = self._c.execute("SELECT COUNT(*) AS n, SUM(size) AS raw, SUM(LENGTH(data)) AS stored FROM blobs").fetchone()
+        return {
+            "path": self.path,
+            "interactions": sum(r["n"] for r in rows),
+            "endpoints": [
+                {"provider": r["provider"], "method": r["method"], "path": r["path"], "count": r["n"],
+                 "latency_avg_ms": round(r["latency_avg_ms"], 1), "latency_max_ms": round(r["latency_max_ms"], 1)}
+                for r in rows
+            ],
+            "blobs": blobs["n"],
+            "bytes_raw": blobs["raw"] or 0,
+            "bytes_stored": blobs["stored"] or 0,
+        }
+
+
+# ---------------- transportes de gravação ----------------
+
+class _Tee:
+    """Repassa os pedaços do corpo e grava tudo ao final (só se o corpo veio inteiro)."""
+
+    def __init__(self, stream, on_done: Callable[[bytes], None]):
+        self._stream = stream
+        self._on_done = on_done
+        self._chunks: List[bytes] = []
+        self._done = False
+
+    def _finish(self) -> None:
+        if not self._done:
+            self._done = True
+            try:
+                self._on_done(b"".join(self._chunks))
+            except Exception:
+                pass  # gravar nunca derruba a chamada real
+
+
+class _SyncTee(_Tee, httpx.SyncByteStream):
+    def __iter__(self):
+        for chunk in self._stream:
+            self._chunks.append(chunk)
+            yield chunk
+        self._finish()
+
+    def close(self) -> None:
+        self._stream.close()
+
+
+class _AsyncTee(_Tee, httpx.AsyncByteStream):
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._chunks.append(chunk)
+            yield chunk
+        self._finish()
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+
+
+class RecordingTransport(httpx.BaseTransport):
+    def __init__(self, cassette: Cassette, provider: str, base_url: str, inner: httpx.BaseTransport):
+        self._cassette, self._provider, self._base_url = cassette, provider, base_url
+        self._inner = inner
+        self._pool = getattr(inner, "_pool", None)  # POOL.stats() conta as conexões por aqui
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        response = self._inner.handle_request(request)
+        latency = time.perf_counter() - start
+        response.stream = _SyncTee(response.stream, lambda raw: self._cassette.record(
+            self._provider, self._base_url, request, response, raw, latency, time.perf_counter() - start))
+        return response
+
+    def close(self) -> None:
+        self._inner.close()
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette, provider: str, base_url: str, inner: httpx.AsyncBaseTransport):
+        self._cassette, self._provider, self._base_url = cassette, provider, base_url
+        self._inner = inner
+        self._pool = getattr(inner, "_pool", None)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        response = await self._inner.handle_async_request(request)
+        latency = time.perf_counter() - start
+        response.stream = _AsyncTee(response.stream, lambda raw: self._cassette.record(
+            self._provider, self._base_url, request, response, raw, latency, time.perf_counter() - start))
+        return response
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+
+_recorder: Optional[Cassette] = None
+_recorder_lock = threading.Lock()
+
+
+def recorder() -> Optional[Cassette]:
+    """Cassete de gravação do processo (None se CASSETTE_RECORD vazio)."""
+    global _recorder
+    if not CASSETTE_RECORD:
+        return None
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = Cassette(CASSETTE_RECORD)
+        return _recorder
+
+
+def cassette_stats() -> Dict[str, Any]:
+    if _recorder is None:
+        return {"recording": False}
+    return {"recording": True, "path": _recorder.path, "recorded": _recorder.recorded}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumo de um cassete gravado")
+    parser.add_argument("path")
+    args = parser.parse_args()
+    if not Path(args.path).exists():
+        raise SystemExit(f"Cassete não encontrado: {args.path}")
+    print(json.dumps(Cassette(args.path).summary(), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
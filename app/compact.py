@@ -0,0 +1,222 @@
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .config import PROMPT_TOKEN_BUDGET_FULL, PROMPT_TOKEN_BUDGET_COMPACT
+
+# Compactação do dossiê antes do prompt: cada seção vira só os campos que a
+# análise usa (times/ligas repetidos viram nomes), depois corta o que sobrar até
+# caber no orçamento de tokens do mode. Serialização estável (sort_keys) para o
+# prefixo do prompt se repetir entre chamadas do mesmo jogo.
+
+CHARS_PER_TOKEN = 3.5  # aproximação para JSON em pt-BR
+
+_lock = threading.Lock()
+STATS = {"prompts": 0, "tokens_before": 0, "tokens_after": 0}
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def _name(obj: Optional[dict]) -> Optional[str]:
+    return (obj or {}).get("name")
+
+
+def _drop_empty(d: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in d.items() if v not in (None, [], {}, "")}
+
+
+# ---------------- projeções por seção ----------------
+
+def _match(m: Dict[str, Any]) -> Dict[str, Any]:
+    league = m.get("league") or {}
+    return _drop_empty({
+        "fixture_id": m.get("fixture_id"),
+        "kickoff_local": m.get("kickoff_local"),
+        "league": _drop_empty({
+            "name": league.get("name"),
+            "country": league.get("country"),
+            "round": league.get("round"),
+            "season": league.get("season") or m.get("season_used"),
+        }),
+        "venue": _drop_empty({"name": _name(m.get("venue")), "city": (m.get("venue") or {}).get("city")}),
+        "home": _name(m.get("home")),
+        "away": _name(m.get("away")),
+    })
+
+
+def _table_row(row: Optional[dict]) -> Optional[dict]:
+    if not row:
+        return None
+    def split(part):
+        p = row.get(part)
+        if not p:
+            return None
+        g = p.get("goals") or {}
+        return [p.get("played"), p.get("win"), p.get("draw"), p.get("lose"), g.get("for"), g.get("against")]
+    return _drop_empty({
+        "rank": row.get("rank"),
+        "points": row.get("points"),
+        "goals_diff": row.get("goalsDiff"),
+        "form": row.get("form"),
+        # [J, V, E, D, GP, GC]
+        "all": split("all"),
+        "home": split("home"),
+        "away": split("away"),
+    })
+
+
+def _recent(r: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "W": r.get("W"), "D": r.get("D"), "L": r.get("L"), "GF": r.get("GF"), "GA": r.get("GA"),
+        # "AAAA-MM-DD H/A adversário placar resultado"
+        "matches": [
+            f"{(x.get('date') or '')[:10]} {x.get('H/A')} {x.get('vs')} {x.get('score')} {x.get('result')}"
+            for x in r.get("matches") or []
+        ],
+    }
+
+
+def _h2h(fixtures: List[dict]) -> List[str]:
+    out = []
+    for fx in fixtures or []:
+        goals = fx.get("goals") or {}
+        if goals.get("home") is None:
+            continue
+        teams = fx.get("teams") or {}
+        date = ((fx.get("fixture") or {}).get("date") or "")[:10]
+        out.append(f"{date} {_name(teams.get('home'))} {goals.get('home')}-{goals.get('away')} {_name(teams.get('away'))}")
+    return out
+
+
+def _lineups(raw: List[dict]) -> List[dict]:
+    out = []
+    for t in raw or []:
+        out.append(_drop_empty({
+            "team": _name(t.get("team")),
+            "formation": t.get("formation"),
+            "coach": _name(t.get("coach")),
+            # "Nome (pos)"
+            "xi": [f"{(p.get('player') or {}).get('name')} ({(p.get('player') or {}).get('pos')})" for p in t.get("startXI") or []],
+            "bench": [(p.get("player") or {}).get("name") for p in t.get("substitutes") or []],
+        }))
+    return out
+
+
+def _injuries(raw: List[dict]) -> List[str]:
+    return [
+        f"{_name(i.get('team'))}: {_name(i.get('player'))} ({(i.get('player') or {}).get('type')}, {(i.get('player') or {}).get('reason')})"
+        for i in raw or []
+    ]
+
+
+def _statistics(raw: List[dict]) -> Dict[str, Dict[str, Any]]:
+    return {
+        _name(t.get("team")) or "?": {s.get("type"): s.get("value") for s in t.get("statistics") or [] if s.get("value") is not None}
+        for t in raw or []
+    }
+
+
+def project(dossier: Dict[str, Any]) -> Dict[str, Any]:
+    xg = dossier.get("xg") or {}
+    return _drop_empty({
+        "match": _match(dossier.get("match") or {}),
+        "standings": _drop_empty({
+            "home": _table_row((dossier.get("standings") or {}).get("home_row")),
+            "away": _table_row((dossier.get("standings") or {}).get("away_row")),
+        }),
+        "recent_form": {
+            side: _recent(r) for side, r in (dossier.get("recent_form") or {}).items()
+        },
+        "head_to_head": _h2h((dossier.get("head_to_head") or {}).get("fixtures")),
+        "lineups": _lineups((dossier.get("lineups") or {}).get("raw")),
+        "injuries": _injuries(dossier.get("injuries")),
+        "fixture_statistics": _statistics(dossier.get("fixture_statistics")),
+        "xg": xg if xg.get("enabled") else None,
+        "missing_sections": sorted((dossier.get("degraded") or {}).keys()),
+    })
+
+
+# ---------------- cortes até caber no orçamento ----------------
+# Em ordem: o que menos pesa na análise sai primeiro.
+
+def _cut_bench(d):
+    for t in d.get("lineups", []):
+        t.pop("bench", None)
+
+def _cut_h2h(d):
+    if d.get("head_to_head"):
+        d["head_to_head"] = d["head_to_head"][:5]
+
+def _cut_statistics(d):
+    d.pop("fixture_statistics", None)
+
+def _cut_table_splits(d):
+    for row in (d.get("standings") or {}).values():
+        row.pop("home", None)
+        row.pop("away", None)
+
+def _cut_recent_matches(d):
+    for r in (d.get("recent_form") or {}).values():
+        r["matches"] = r.get("matches", [])[:3]
+
+def _cut_injuries(d):
+    if d.get("injuries"):
+        d["injuries"] = d["injuries"][:10]
+
+def _cut_xi_positions(d):
+    for t in d.get("lineups", []):
+        t["xi"] = [p.rsplit(" (", 1)[0] for p in t.get("xi", [])]
+
+def _cut_h2h_all(d):
+    d.pop("head_to_head", None)
+
+
+CUTS: List[Tuple[str, Callable[[dict], None]]] = [
+    ("bench", _cut_bench),
+    ("head_to_head>5", _cut_h2h),
+    ("fixture_statistics", _cut_statistics),
+    ("standings_home_away", _cut_table_splits),
+    ("recent_matches>3", _cut_recent_matches),
+    ("injuries>10", _cut_injuries),
+    ("xi_positions", _cut_xi_positions),
+    ("head_to_head", _cut_h2h_all),
+]
+
+
+def budget_for(mode: str) -> int:
+    return PROMPT_TOKEN_BUDGET_COMPACT if mode == "compact" else PROMPT_TOKEN_BUDGET_FULL
+
+
+def compact_dossier(dossier: Dict[str, Any], mode: str = "full") -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Devolve (dossiê compacto, relatório com tokens antes/depois e cortes feitos).
+    """
+    before = estimate_tokens(dumps(dossier))
+    budget = budget_for(mode)
+    out = project(dossier)
+    trimmed = []
+    after = estimate_tokens(dumps(out))
+    for name, cut in CUTS:
+        if after <= budget:
+            break
+        cut(out)
+        trimmed.append(name)
+        after = estimate_tokens(dumps(out))
+
+    with _lock:
+        STATS["prompts"] += 1
+        STATS["tokens_before"] += before
+        STATS["tokens_after"] += after
+    return out, {"tokens_before": before, "tokens_after": after, "budget": budget, "trimmed": trimmed}
+
+
+def prompt_payload(dossier: Dict[str, Any], mode: str = "full") -> Tuple[str, Dict[str, Any]]:
+    """JSON compacto e estável para o prompt + relatório de tokens."""
+    out, report = compact_dossier(dossier, mode)
+    return dumps(out), report
@@ -8,6 +8,7 @@ def env(key: str, default=None):
 
 OPENAI_API_KEY = env("OPENAI_API_KEY")
 OPENAI_MODEL = env("OPENAI_MODEL", "gpt-5")
+OPENAI_BASE_URL = env("OPENAI_BASE_URL", "https://api.openai.com/v1")
 
 APIFOOTBALL_KEY = env("APIFOOTBALL_KEY")
 APIFOOTBALL_BASE_URL = env("APIFOOTBALL_BASE_URL", "https://v3.football.api-sports.io")
@@ -15,3 +16,113 @@ APIFOOTBALL_BASE_URL = env("APIFOOTBALL_BASE_URL", "https://v3.football.api-spor
 APP_TZ = env("APP_TZ", "America/Sao_Paulo")
 DB_PATH = env("DB_PATH", "./data/matchlab.sqlite")
 CACHE_TTL_SECONDS = int(env("CACHE_TTL_SECONDS", "21600"))
+
+# máx. de chamadas simultâneas à API-Football ao montar um dossiê
+DOSSIER_CONCURRENCY = int(env("DOSSIER_CONCURRENCY", "6"))
+# componente do dossiê vencido ainda serve por N s se a coleta nova falhar
+DOSSIER_COMPONENT_GRACE_SECONDS = int(env("DOSSIER_COMPONENT_GRACE_SECONDS", "86400"))
+
+# The Odds API
+ODDS_API_KEY = env("ODDS_API_KEY")
+ODDS_REGION = env("ODDS_REGION", "eu")
+ODDS_MARKETS = env("ODDS_MARKETS", "h2h")
+ODDS_ODDS_FORMAT = env("ODDS_ODDS_FORMAT", "decimal")
+ODDS_BASE_URL = env("ODDS_BASE_URL", "https://api.the-odds-api.com/v4")
+
+# pool HTTP compartilhado (app/http_pool.py)
+HTTP_HTTP2 = env("HTTP_HTTP2", "1") == "1"
+HTTP_MAX_CONNECTIONS = int(env("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(env("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(env("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_POOL_TIMEOUT = float(env("HTTP_POOL_TIMEOUT", "10"))
+
+# cache de respostas da API-Football: janela máx. (s) servindo resposta vencida
+# enquanto revalida em background
+APIFOOTBALL_STALE_SECONDS = int(env("APIFOOTBALL_STALE_SECONDS", "3600"))
+
+# cota da API-Football (app/quota.py): ritmo por minuto/rajada do balde, cota
+# diária (0 = aprende pelos cabeçalhos), fração da cota diária que cada classe
+# abaixo de interactive deixa para as de cima e espera máx. na fila (s)
+APIFOOTBALL_RATE_PER_MINUTE = float(env("APIFOOTBALL_RATE_PER_MINUTE", "10"))
+APIFOOTBALL_BURST = int(env("APIFOOTBALL_BURST", "0"))
+APIFOOTBALL_DAILY_LIMIT = int(env("APIFOOTBALL_DAILY_LIMIT", "0"))
+APIFOOTBALL_QUOTA_RESERVE = float(env("APIFOOTBALL_QUOTA_RESERVE", "0.1"))
+APIFOOTBALL_QUEUE_MAX_WAIT = float(env("APIFOOTBALL_QUEUE_MAX_WAIT", "120"))
+
+# resiliência dos providers (app/resilience.py), por provider:
+# "tentativas,backoff_base_s,backoff_teto_s,timeout_s[,hedge_ms]" (hedge 0 = desligado)
+RESILIENCE_APIFOOTBALL = env("RESILIENCE_APIFOOTBALL", "3,0.5,4,10,0")
+RESILIENCE_THEODDSAPI = env("RESILIENCE_THEODDSAPI", "3,0.5,4,10,0")
+RESILIENCE_OPENAI = env("RESILIENCE_OPENAI", "2,1,8,120,0")
+BREAKER_FAILURES = int(env("BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(env("BREAKER_RESET_SECONDS", "30"))
+# provider fora do ar: até quantos s depois de vencida uma resposta em cache ainda serve
+PROVIDER_FALLBACK_SECONDS = int(env("PROVIDER_FALLBACK_SECONDS", str(3 * 24 * 3600)))
+
+# cache em 2 níveis (app/cache.py)
+CACHE_MEM_MAX_BYTES = int(env("CACHE_MEM_MAX_BYTES", str(32 * 1024 * 1024)))
+CACHE_DB_MAX_ROWS = int(env("CACHE_DB_MAX_ROWS", "50000"))
+CACHE_SWEEP_SECONDS = int(env("CACHE_SWEEP_SECONDS", "300"))
+
+# SQLite (app/db.py)
+SQLITE_CACHE_KB = int(env("SQLITE_CACHE_KB", "20000"))
+SQLITE_MMAP_BYTES = int(env("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT = float(env("SQLITE_BUSY_TIMEOUT", "10"))
+
+# catálogo de times: similaridade mínima (Dice de trigramas) pra sugerir um nome
+# parecido quando /teams?search= não acha (o fuzzy nunca resolve sozinho)
+TEAM_FUZZY_MIN_SCORE = float(env("TEAM_FUZZY_MIN_SCORE", "0.75"))
+
+# single-flight de /predict entre workers (app/singleflight.py)
+SINGLEFLIGHT_LEASE_SECONDS = int(env("SINGLEFLIGHT_LEASE_SECONDS", "300"))
+SINGLEFLIGHT_POLL_SECONDS = float(env("SINGLEFLIGHT_POLL_SECONDS", "0.5"))
+
+# fila de jobs de previsão (app/jobs.py)
+JOBS_WORKERS = int(env("JOBS_WORKERS", "2"))
+JOBS_MAX_ATTEMPTS = int(env("JOBS_MAX_ATTEMPTS", "3"))
+JOBS_RETRY_BASE_SECONDS = float(env("JOBS_RETRY_BASE_SECONDS", "10"))
+JOBS_STALE_SECONDS = int(env("JOBS_STALE_SECONDS", "900"))
+
+# previsão em lote (app/batch.py)
+BATCH_LLM_CONCURRENCY = int(env("BATCH_LLM_CONCURRENCY", "3"))
+BATCH_LLM_RATE_PER_MIN = float(env("BATCH_LLM_RATE_PER_MIN", "20"))
+BATCH_FLUSH_SIZE = int(env("BATCH_FLUSH_SIZE", "10"))
+
+# orçamento de tokens do dossiê no prompt, por mode (app/compact.py)
+PROMPT_TOKEN_BUDGET_FULL = int(env("PROMPT_TOKEN_BUDGET_FULL", "6000"))
+PROMPT_TOKEN_BUDGET_COMPACT = int(env("PROMPT_TOKEN_BUDGET_COMPACT", "2500"))
+
+# blobs comprimidos (app/blobs.py): zstd se o pacote zstandard existir, senão zlib
+BLOB_ZSTD_LEVEL = int(env("BLOB_ZSTD_LEVEL", "9"))
+BLOB_ZLIB_LEVEL = int(env("BLOB_ZLIB_LEVEL", "6"))
+
+# reaproveita a previsão com o mesmo fingerprint de dossiê por até N segundos (0 = nunca)
+REUSE_MAX_AGE_SECONDS = int(env("REUSE_MAX_AGE_SECONDS", "21600"))
+
+# modelo local Poisson/Dixon-Coles (app/poisson.py)
+POISSON_HALF_LIFE_DAYS = float(env("POISSON_HALF_LIFE_DAYS", "365"))
+POISSON_PRIOR_GAMES = float(env("POISSON_PRIOR_GAMES", "3"))
+POISSON_MAX_GOALS = int(env("POISSON_MAX_GOALS", "10"))
+
+# ingestão de resultados (app/ingest.py): "liga:season,liga:season"
+TRACKED_LEAGUES = env("TRACKED_LEAGUES", "")
+INGEST_INTERVAL_SECONDS = int(env("INGEST_INTERVAL_SECONDS", "3600"))
+INGEST_CHUNK_DAYS = int(env("INGEST_CHUNK_DAYS", "31"))
+INGEST_LOOKBACK_DAYS = int(env("INGEST_LOOKBACK_DAYS", "3"))
+
+# backtests em segundo plano (app/backtest.py)
+BACKTEST_PROCESSES = int(env("BACKTEST_PROCESSES", "2"))
+BACKTEST_STALE_SECONDS = int(env("BACKTEST_STALE_SECONDS", "300"))
+
+# pré-aquecimento antes do jogo (app/prefetch.py): "liga:season" iniciais da
+# watchlist (ajustável por liga em /prefetch/watchlist) e padrões de cada entrada
+PREFETCH_LEAGUES = env("PREFETCH_LEAGUES", "")
+PREFETCH_INTERVAL_SECONDS = int(env("PREFETCH_INTERVAL_SECONDS", "300"))
+PREFETCH_LEAD_HOURS = float(env("PREFETCH_LEAD_HOURS", "24"))
+PREFETCH_LINEUP_MINUTES = float(env("PREFETCH_LINEUP_MINUTES", "60"))
+PREFETCH_VOLATILE_REFRESH_MINUTES = float(env("PREFETCH_VOLATILE_REFRESH_MINUTES", "15"))
+PREFETCH_LLM = env("PREFETCH_LLM", "0") == "1"
+
+# cassete (app/cassette.py): grava as respostas dos providers nesse arquivo
+# SQLite para replay offline com python -m app.fake_upstream --cassette (vazio = não grava)
+CASSETTE_RECORD = env("CASSETTE_RECORD", "")
@@ -1,68 +1,396 @@
 import sqlite3
+import threading
+from datetime import datetime
+from contextlib import contextmanager
 from pathlib import Path
-from .config import DB_PATH
+from typing import Callable, List, Tuple, Union
+from .config import DB_PATH, SQLITE_CACHE_KB, SQLITE_MMAP_BYTES, SQLITE_BUSY_TIMEOUT
 
-def conn():
-    Path(DB_PATH).parent.mkdir(parents=True, exist_ok=True)
-    c = sqlite3.connect(DB_PATH)
+_local = threading.local()
+_dir_ready = False
+
+def _connect(readonly: bool = False, check_same_thread: bool = True) -> sqlite3.Connection:
+    global _dir_ready
+    if not _dir_ready:
+        Path(DB_PATH).parent.mkdir(parents=True, exist_ok=True)
+        _dir_ready = True
+
+    if readonly:
+        uri = f"{Path(DB_PATH).resolve().as_uri()}?mode=ro"
+        c = sqlite3.connect(uri, uri=True, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=check_same_thread)
+        c.execute("PRAGMA query_only=ON")
+    else:
+        c = sqlite3.connect(DB_PATH, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=check_same_thread)
+        # WAL: leitores (dashboard) não bloqueiam o escritor e vice-versa
+        c.execute("PRAGMA journal_mode=WAL")
+    c.execute("PRAGMA synchronous=NORMAL")
+    c.execute(f"PRAGMA cache_size=-{int(SQLITE_CACHE_KB)}")
+    c.execute(f"PRAGMA mmap_size={int(SQLITE_MMAP_BYTES)}")
+    c.execute("PRAGMA temp_store=MEMORY")
     c.row_factory = sqlite3.Row
     return c
 
+def conn(check_same_thread: bool = True):
+    """Conexão nova (o chamador fecha). Prefira transaction()/reader()."""
+    return _connect(check_same_thread=check_same_thread)
+
+def _thread_conn(readonly: bool = False) -> sqlite3.Connection:
+    # uma conexão de escrita e uma de leitura por thread, reaproveitadas
+    attr = "ro" if readonly else "rw"
+    c = getattr(_local, attr, None)
+    if c is None:
+        c = _connect(readonly=readonly)
+        setattr(_local, attr, c)
+    return c
+
+@contextmanager
+def transaction():
+    """
+    Conexão de escrita da thread; commit no fim ou rollback em erro.
+    Aninhado: só o bloco mais externo faz commit.
+    """
+    c = _thread_conn()
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    try:
+        yield c
+        if depth == 0:
+            c.commit()
+    except BaseException:
+        if depth == 0:
+            c.rollback()
+        raise
+    finally:
+        _local.depth = depth
+
+@contextmanager
+def reader():
+    """Conexão somente-leitura da thread (dashboard, relatórios)."""
+    yield _thread_conn(readonly=True)
+
+def close_thread_conns():
+    for attr in ("rw", "ro"):
+        c = getattr(_local, attr, None)
+        if c is not None:
+            c.close()
+            setattr(_local, attr, None)
+
 def init_db():
-    c = conn()
-    cur = c.cursor()
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS cache (
-      k TEXT PRIMARY KEY,
-      v TEXT NOT NULL,
-      expires_at INTEGER NOT NULL
-    )
-    """)
+    migrate(_thread_conn())
 
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS matches (
-      fixture_id INTEGER PRIMARY KEY,
-      league_id INTEGER,
-      season INTEGER,
-      kickoff_iso TEXT,
-      home_name TEXT,
-      away_name TEXT,
-      home_id INTEGER,
-      away_id INTEGER,
-      status TEXT,
-      home_goals INTEGER,
-      away_goals INTEGER,
-      raw_json TEXT
-    )
-    """)
+# ---------------- migrações ----------------
+# Cada migração: (versão, nome, passos). Passo = SQL ou função(conn).
+# Nunca editar uma migração já publicada: sempre adicionar uma nova no fim.
 
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS predictions (
-      id INTEGER PRIMARY KEY AUTOINCREMENT,
-      fixture_id INTEGER,
-      created_at_iso TEXT,
-      model TEXT,
-      dossier_json TEXT,
-      report_text TEXT,
-      scoreline TEXT,
-      confidence INTEGER,
-      risk_json TEXT,
-      FOREIGN KEY (fixture_id) REFERENCES matches(fixture_id)
-    )
-    """)
+Step = Union[str, Callable[[sqlite3.Connection], None]]
+
+MIGRATIONS: List[Tuple[int, str, List[Step]]] = [
+    (1, "baseline", [
+        """
+        CREATE TABLE IF NOT EXISTS cache (
+          k TEXT PRIMARY KEY,
+          v TEXT NOT NULL,
+          expires_at INTEGER NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache(expires_at)",
+        """
+        CREATE TABLE IF NOT EXISTS matches (
+          fixture_id INTEGER PRIMARY KEY,
+          league_id INTEGER,
+          season INTEGER,
+          kickoff_iso TEXT,
+          home_name TEXT,
+          away_name TEXT,
+          home_id INTEGER,
+          away_id INTEGER,
+          status TEXT,
+          home_goals INTEGER,
+          away_goals INTEGER,
+          raw_json TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS predictions (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          fixture_id INTEGER,
+          created_at_iso TEXT,
+          model TEXT,
+          dossier_json TEXT,
+          report_text TEXT,
+          scoreline TEXT,
+          confidence INTEGER,
+          risk_json TEXT,
+          FOREIGN KEY (fixture_id) REFERENCES matches(fixture_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS backtest_runs (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          created_at_iso TEXT,
+          league_id INTEGER,
+          season INTEGER,
+          from_date TEXT,
+          to_date TEXT,
+          metrics_json TEXT
+        )
+        """,
+    ]),
+    (2, "query_indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_predictions_fixture ON predictions(fixture_id)",
+        "CREATE INDEX IF NOT EXISTS idx_predictions_created ON predictions(created_at_iso)",
+        "CREATE INDEX IF NOT EXISTS idx_matches_league_season_kickoff ON matches(league_id, season, kickoff_iso)",
+    ]),
+    (3, "fixture_index", [
+        # kickoff_ts: epoch UTC (kickoff_iso mistura fusos); fixture_json: objeto /fixtures da API
+        "ALTER TABLE matches ADD COLUMN kickoff_ts INTEGER",
+        "ALTER TABLE matches ADD COLUMN fixture_json TEXT",
+        lambda c: _backfill_kickoff_ts(c),
+        "CREATE INDEX IF NOT EXISTS idx_matches_teams_kickoff ON matches(home_id, away_id, kickoff_ts)",
+    ]),
+    (4, "team_catalog", [
+        """
+        CREATE TABLE IF NOT EXISTS teams (
+          id INTEGER PRIMARY KEY,
+          name TEXT NOT NULL,
+          folded TEXT NOT NULL,
+          code TEXT,
+          country TEXT,
+          logo TEXT,
+          updated_at_iso TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_teams_folded ON teams(folded)",
+        # apelidos: texto digitado pelo usuário (já normalizado) -> time
+        """
+        CREATE TABLE IF NOT EXISTS team_aliases (
+          alias TEXT PRIMARY KEY,
+          team_id INTEGER NOT NULL REFERENCES teams(id)
+        )
+        """,
+    ]),
+    (5, "leases", [
+        # lease de single-flight entre workers (app/singleflight.py)
+        """
+        CREATE TABLE IF NOT EXISTS leases (
+          k TEXT PRIMARY KEY,
+          owner TEXT NOT NULL,
+          expires_at REAL NOT NULL
+        )
+        """,
+    ]),
+    (6, "jobs", [
+        # fila de jobs (app/jobs.py); stages_json: {"queued": ts, "started": ts, "dossier": ts, ...}
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+          id TEXT PRIMARY KEY,
+          kind TEXT NOT NULL,
+          payload_json TEXT NOT NULL,
+          status TEXT NOT NULL,
+          priority INTEGER NOT NULL DEFAULT 50,
+          attempts INTEGER NOT NULL DEFAULT 0,
+          max_attempts INTEGER NOT NULL DEFAULT 3,
+          callback_url TEXT,
+          worker TEXT,
+          result_json TEXT,
+          error TEXT,
+          created_at REAL NOT NULL,
+          next_run_at REAL NOT NULL,
+          started_at REAL,
+          finished_at REAL,
+          stages_json TEXT NOT NULL DEFAULT '{}'
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs(status, priority DESC, created_at)",
+    ]),
+    (7, "blobs", [
+        # conteúdo comprimido endereçado por sha256 do texto original (app/blobs.py)
+        """
+        CREATE TABLE IF NOT EXISTS blobs (
+          hash TEXT PRIMARY KEY,
+          codec TEXT NOT NULL,
+          size INTEGER NOT NULL,
+          data BLOB NOT NULL
+        )
+        """,
+        "ALTER TABLE matches ADD COLUMN raw_hash TEXT",
+        "ALTER TABLE predictions ADD COLUMN dossier_hash TEXT",
+        "ALTER TABLE predictions ADD COLUMN report_hash TEXT",
+        lambda c: _move_to_blobs(c),
+    ]),
+    (8, "prediction_fingerprint", [
+        # sha256(modelo|mode|versão do prompt|dossiê compacto): reaproveita respostas do LLM
+        "ALTER TABLE predictions ADD COLUMN fingerprint TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_predictions_fingerprint ON predictions(fingerprint, created_at_iso)",
+    ]),
+    (9, "prediction_probabilities", [
+        # 1X2 dos modelos que dão probabilidade (poisson); NULL para o LLM
+        "ALTER TABLE predictions ADD COLUMN p_home REAL",
+        "ALTER TABLE predictions ADD COLUMN p_draw REAL",
+        "ALTER TABLE predictions ADD COLUMN p_away REAL",
+    ]),
+    (10, "ingest_state", [
+        # ingestão de resultados (app/ingest.py): high_water = última data (YYYY-MM-DD)
+        # em que todos os jogos da liga/season já estavam encerrados
+        """
+        CREATE TABLE IF NOT EXISTS ingest_state (
+          league_id INTEGER NOT NULL,
+          season INTEGER NOT NULL,
+          high_water TEXT NOT NULL,
+          last_run_iso TEXT,
+          last_seen INTEGER,
+          last_changed INTEGER,
+          last_error TEXT,
+          PRIMARY KEY (league_id, season)
+        )
+        """,
+    ]),
+    (11, "backtest_run_state", [
+        # backtest em segundo plano (app/backtest.py): checkpoint = último dia concluído,
+        # partial_json = somas acumuladas até ele; updated_at serve de heartbeat
+        "ALTER TABLE backtest_runs ADD COLUMN model TEXT",
+        "ALTER TABLE backtest_runs ADD COLUMN status TEXT NOT NULL DEFAULT 'done'",
+        "ALTER TABLE backtest_runs ADD COLUMN progress REAL NOT NULL DEFAULT 1",
+        "ALTER TABLE backtest_runs ADD COLUMN checkpoint TEXT",
+        "ALTER TABLE backtest_runs ADD COLUMN partial_json TEXT",
+        "ALTER TABLE backtest_runs ADD COLUMN error TEXT",
+        "ALTER TABLE backtest_runs ADD COLUMN worker TEXT",
+        "ALTER TABLE backtest_runs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE backtest_runs ADD COLUMN updated_at REAL",
+        "CREATE INDEX IF NOT EXISTS idx_backtest_runs_status ON backtest_runs(status, updated_at)",
+        "CREATE INDEX IF NOT EXISTS idx_matches_league_season_ts ON matches(league_id, season, kickoff_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_matches_kickoff_ts ON matches(kickoff_ts)",
+    ]),
+    (12, "dashboard_rollup", [
+        # placar previsto separado na gravação + agregados mantidos por triggers (app/rollup.py)
+        "ALTER TABLE predictions ADD COLUMN pred_home_goals INTEGER",
+        "ALTER TABLE predictions ADD COLUMN pred_away_goals INTEGER",
+        """
+        CREATE TABLE IF NOT EXISTS prediction_rollup (
+          model TEXT NOT NULL,
+          league_id INTEGER NOT NULL,
+          predictions INTEGER NOT NULL DEFAULT 0,
+          finished INTEGER NOT NULL DEFAULT 0,
+          exact INTEGER NOT NULL DEFAULT 0,
+          outcome_hits INTEGER NOT NULL DEFAULT 0,
+          confidence_sum REAL NOT NULL DEFAULT 0,
+          PRIMARY KEY (model, league_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS data_version (
+          k TEXT PRIMARY KEY,
+          version INTEGER NOT NULL
+        )
+        """,
+        "INSERT OR IGNORE INTO data_version(k, version) VALUES('dashboard', 0)",
+        # páginas do dashboard filtradas por modelo (ORDER BY id vem de graça no índice)
+        "CREATE INDEX IF NOT EXISTS idx_predictions_model ON predictions(model)",
+        lambda c: _install_rollup(c),
+    ]),
+    (13, "prefetch", [
+        # pré-aquecimento antes do jogo (app/prefetch.py): ligas acompanhadas e
+        # o que já foi feito por fixture (dossiê, partes voláteis, relatório do LLM)
+        """
+        CREATE TABLE IF NOT EXISTS prefetch_watchlist (
+          league_id INTEGER NOT NULL,
+          season INTEGER NOT NULL,
+          enabled INTEGER NOT NULL DEFAULT 1,
+          lead_hours REAL,
+          lineup_minutes REAL,
+          llm INTEGER NOT NULL DEFAULT 0,
+          mode TEXT NOT NULL DEFAULT 'full',
+          recent_n INTEGER NOT NULL DEFAULT 5,
+          h2h_n INTEGER NOT NULL DEFAULT 10,
+          updated_at_iso TEXT,
+          PRIMARY KEY (league_id, season)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS prefetch_state (
+          fixture_id INTEGER PRIMARY KEY,
+          league_id INTEGER NOT NULL,
+          season INTEGER NOT NULL,
+          kickoff_ts INTEGER NOT NULL,
+          dossier_at REAL,
+          volatile_at REAL,
+          lineups_ready INTEGER NOT NULL DEFAULT 0,
+          llm_at REAL,
+          error TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_prefetch_state_league_ts ON prefetch_state(league_id, kickoff_ts)",
+    ]),
+]
+
+def _backfill_kickoff_ts(c: sqlite3.Connection):
+    rows = c.execute("SELECT fixture_id, kickoff_iso FROM matches WHERE kickoff_iso IS NOT NULL").fetchall()
+    upd = []
+    for r in rows:
+        try:
+            upd.append((int(datetime.fromisoformat(r["kickoff_iso"]).timestamp()), r["fixture_id"]))
+        except ValueError:
+            continue
+    c.executemany("UPDATE matches SET kickoff_ts=? WHERE fixture_id=?", upd)
+
+def _move_to_blobs(c: sqlite3.Connection):
+    from .blobs import migrate_inline
+    migrate_inline(c)
+
+def _install_rollup(c: sqlite3.Connection):
+    from . import rollup
+    rollup.backfill_pred_goals(c)
+    for sql in rollup.TRIGGERS:
+        c.execute(sql)
+    rollup.rebuild(c)
 
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS backtest_runs (
-      id INTEGER PRIMARY KEY AUTOINCREMENT,
-      created_at_iso TEXT,
-      league_id INTEGER,
-      season INTEGER,
-      from_date TEXT,
-      to_date TEXT,
-      metrics_json TEXT
+def vacuum():
+    """Devolve ao disco as páginas liberadas (ex.: depois da migração de blobs)."""
+    c = _connect()
+    try:
+        c.execute("VACUUM")
+    finally:
+        c.close()
+
+def schema_version(c: sqlite3.Connection) -> int:
+    return c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def migrate(c: sqlite3.Connection) -> int:
+    """
+    Aplica as migrações pendentes, em ordem, sem apagar dados.
+    BEGIN IMMEDIATE serializa workers que sobem ao mesmo tempo.
+    """
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+      version INTEGER PRIMARY KEY,
+      name TEXT,
+      applied_at_iso TEXT
     )
     """)
-
     c.commit()
-    c.close()
+
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        current = schema_version(c)
+        for version, name, steps in MIGRATIONS:
+            if version <= current:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(c)
+                else:
+                    c.execute(step)
+            c.execute(
+                "INSERT INTO schema_version(version, name, applied_at_iso) VALUES(?,?,?)",
+                (version, name, datetime.utcnow().isoformat()),
+            )
+            current = version
+        c.commit()
+    except BaseException:
+        c.rollback()
+        raise
+    return current
+
+def explain(c: sqlite3.Connection, sql: str, params=()) -> List[str]:
+    """Linhas do EXPLAIN QUERY PLAN (coluna detail)."""
+    return [r["detail"] for r in c.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
@@ -1,28 +1,39 @@
+import json
+import time
+import asyncio
+import hashlib
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-from typing import Any, Dict, Optional
+from typing import Any, Awaitable, Callable, Dict, Iterable, NamedTuple, Optional
 
-from .cache import cache_get, cache_set
-from .providers.apifootball import APIFootball
+from .cache import cache_get_async, cache_set_async
+from .providers.apifootball import AsyncAPIFootball, FINISHED, HOUR, MINUTE, fetch_scope
 from .providers.xg_stub import XGStub
-from .config import APP_TZ
+from .http_pool import POOL
+from .teams import resolve_team_async
+from .fixtures_index import index_fixtures, lookup_fixture, mark_plan_limited, plan_limited
+from .config import APP_TZ, DOSSIER_CONCURRENCY, DOSSIER_COMPONENT_GRACE_SECONDS
 
 
 def _key(*parts) -> str:
     return " | ".join(map(str, parts))
 
 
-def find_fixture(api: APIFootball, home_id: int, away_id: int, kickoff_local: datetime, season: int, tz: str):
+async def find_fixture(api: AsyncAPIFootball, home_id: int, away_id: int, kickoff_local: datetime, season: int, tz: str):
     """
-    Tenta achar o fixture real procurando em D-1, D, D+1.
+    Tenta achar o fixture real procurando em D-1, D, D+1 (as 3 consultas saem juntas).
     """
     days = [
         kickoff_local.date() - timedelta(days=1),
         kickoff_local.date(),
         kickoff_local.date() + timedelta(days=1),
     ]
-    for d in days:
-        fixtures = api.fixtures_by_team_date(home_id, d.isoformat(), season, tz)
+    results = await asyncio.gather(*[
+        api.fixtures_by_team_date(home_id, d.isoformat(), season, tz) for d in days
+    ])
+    # tudo que veio da rede alimenta o índice local (próximas buscas não saem daqui)
+    index_fixtures(fx for fixtures in results for fx in fixtures)
+    for fixtures in results:
         for fx in fixtures:
             th = fx.get("teams", {}).get("home", {}).get("id")
             ta = fx.get("teams", {}).get("away", {}).get("id")
@@ -31,6 +42,49 @@ def find_fixture(api: APIFootball, home_id: int, away_id: int, kickoff_local: da
     raise RuntimeError("FIXTURE_NOT_FOUND")
 
 
+async def resolve_fixture(api: AsyncAPIFootball, home_id: int, away_id: int, kickoff_local: datetime, season: int, tz: str):
+    """
+    Acha o fixture: primeiro no índice local (1 consulta indexada), depois na rede
+    com fallback de season. Seasons recusadas pelo plano ficam marcadas e não são
+    sondadas de novo. Devolve (fixture, season usada).
+    """
+    fixture = lookup_fixture(home_id, away_id, kickoff_local)
+    if fixture:
+        used_season = fixture.get("league", {}).get("season") or season
+        if plan_limited(used_season):
+            # fixture conhecido, mas forma/tabela precisam de uma season liberada
+            used_season = next((s for s in _season_fallbacks(season) if not plan_limited(s)), used_season)
+        return fixture, used_season
+
+    last_error = None
+
+    # tenta achar fixture com fallback de season (por limite do plano free)
+    for s in _season_fallbacks(season):
+        limited = plan_limited(s)
+        if limited:
+            last_error = limited
+            continue
+        try:
+            return await find_fixture(api, home_id, away_id, kickoff_local, s, tz), s
+        except RuntimeError as e:
+            msg = str(e)
+            # plano free bloqueou season
+            if "APIFOOTBALL_PLAN_LIMIT" in msg:
+                mark_plan_limited(s, msg)
+                last_error = msg
+                continue
+            # fixture não encontrado (pode acontecer)
+            if msg == "FIXTURE_NOT_FOUND":
+                last_error = msg
+                continue
+            raise  # erro inesperado: sobe
+
+    # mensagem amigável
+    if last_error and "APIFOOTBALL_PLAN_LIMIT" in last_error:
+        raise RuntimeError("Seu plano da API-Football não permite essa season. Use 2021–2023 ou faça upgrade.")
+    raise RuntimeError("Não encontrei o jogo (fixture) para essa data/times. Pode ser jogo futuro ou dados indisponíveis no plano free.")
+
+
 def summarize_recent(fixtures, team_id: int):
     out = []
     W = D = L = GF = GA = 0
@@ -99,113 +153,350 @@ def _season_fallbacks(requested: int):
     return uniq
 
 
-def build_dossier(
-    home: str,
-    away: str,
-    kickoff: str,              # "YYYY-MM-DD HH:MM"
-    tz: Optional[str],
+def match_info(
+    fixture: Dict[str, Any],
+    used_season: int,
+    home_team: Dict[str, Any],
+    away_team: Dict[str, Any],
+    kickoff_local: datetime,
+    tz: str,
+    season: int,
+) -> Dict[str, Any]:
+    """Seção "match" do dossiê (é tudo que o modelo Poisson precisa)."""
+    return {
+        "fixture_id": fixture.get("fixture", {}).get("id"),
+        "kickoff_local": kickoff_local.isoformat(),
+        "timezone": tz,
+        "season_requested": season,
+        "season_used": used_season,
+        "league": fixture.get("league", {}),
+        "venue": fixture.get("fixture", {}).get("venue"),
+        "home": {"id": home_team["id"], "name": home_team.get("name")},
+        "away": {"id": away_team["id"], "name": away_team.get("name")},
+    }
+
+
+# ---------------- componentes com cache próprio ----------------
+# Cada parte do dossiê fica no cache separada, com a própria validade (regras
+# em _fresh_for) e um carimbo {v, at, fresh_until, hash}. Montar o dossiê só
+# recalcula o que venceu; o resto sai do cache. Se a coleta falhar e houver
+# cópia vencida (guardada por DOSSIER_COMPONENT_GRACE_SECONDS), ela é usada.
+# Sobe a versão de um componente quando o formato dele mudar: invalida o cache.
+# "at" é quando a resposta mais velha usada saiu da API (não a hora da montagem):
+# componente feito do cache de respostas herda a idade dele. Os voláteis
+# (VOLATILE) vencidos vão direto à rede, senão o TTL do cache de respostas
+# (injuries: 1h + janela stale) esconderia a validade curta deles.
+
+COMPONENT_VERSIONS = {
+    "standings": 1,
+    "recent_form": 1,
+    "head_to_head": 1,
+    "lineups": 1,
+    "injuries": 1,
+    "fixture_statistics": 1,
+    "xg": 1,
+}
+
+VOLATILE = {"lineups", "injuries", "fixture_statistics"}
+
+
+def _fresh_for(kind: str, data: Any, kickoff_ts: Optional[int], status: Optional[str], now: float) -> float:
+    """Por quantos segundos o componente recém-calculado vale."""
+    to_kickoff = (kickoff_ts - now) if kickoff_ts else None
+    if kind in ("standings", "recent_form", "xg"):
+        # só mudam quando alguém joga
+        return 6 * HOUR
+    if kind == "head_to_head":
+        return 24 * HOUR
+    if kind == "lineups":
+        if data:
+            return 24 * HOUR  # oficial não muda mais
+        # ainda não saiu: nem adianta olhar antes de ~T-90min
+        if to_kickoff is not None and to_kickoff > 90 * MINUTE:
+            return to_kickoff - 90 * MINUTE
+        return 5 * MINUTE
+    if kind == "injuries":
+        return 15 * MINUTE if to_kickoff is not None and to_kickoff < 3 * HOUR else 1 * HOUR
+    if kind == "fixture_statistics":
+        if status in FINISHED:
+            return 30 * 24 * HOUR
+        if to_kickoff is not None and to_kickoff > 0:
+            return max(5 * MINUTE, to_kickoff)  # sem estatística antes do apito
+        return 10 * MINUTE
+    return 1 * HOUR
+
+
+def _digest(data: Any) -> str:
+    raw = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()[:12]
+
+
+def _stamp(entry: Dict[str, Any], now: float, refreshed: bool, error: Optional[str] = None) -> Dict[str, Any]:
+    out = {
+        "refreshed": refreshed,
+        "age_s": int(now - entry["at"]),
+        "fresh_for_s": int(entry["fresh_until"] - now),
+        "version": entry["v"],
+        "hash": entry["hash"],
+    }
+    if error:
+        out["error"] = error
+    return out
+
+
+async def _component(
+    name: str,
+    kind: str,
+    key_parts: tuple,
+    make: Callable[[], Awaitable[Any]],
+    default: Any,
+    ctx: Dict[str, Any],
+) -> Any:
+    """
+    Componente do cache se ainda valer (e não estiver em ctx["refresh"]);
+    senão recalcula com make(). Registra o carimbo em ctx["freshness"][name].
+    """
+    now = time.time()
+    key = _key("dc", kind, COMPONENT_VERSIONS[kind], *key_parts)
+    entry = await cache_get_async(key)
+    forced = name in ctx["refresh"] or kind in ctx["refresh"]
+    if entry is not None and entry["fresh_until"] > now and not forced:
+        ctx["freshness"][name] = _stamp(entry, now, refreshed=False)
+        return entry["data"]
+    # forçado: quem forçou já atualizou as respostas (prefetch), lê do cache delas
+    bypass = kind in VOLATILE and entry is not None and not forced
+    try:
+        with fetch_scope(bypass_cache=bypass) as seen:
+            data = await make()
+    except Exception as e:
+        if entry is not None:
+            # vencido, mas melhor que nada: segue com a cópia e registra o erro
+            ctx["freshness"][name] = _stamp(entry, now, refreshed=False, error=str(e))
+            return entry["data"]
+        ctx["degraded"][name] = str(e)
+        ctx["freshness"][name] = {"refreshed": False, "error": str(e)}
+        return default
+    at = min(seen, default=now)
+    fresh = _fresh_for(kind, data, ctx["kickoff_ts"], ctx["status"], now)
+    entry = {"data": data, "v": COMPONENT_VERSIONS[kind], "at": at, "fresh_until": at + fresh, "hash": _digest(data)}
+    await cache_set_async(key, entry, max(0, int(at + fresh - now)) + DOSSIER_COMPONENT_GRACE_SECONDS)
+    ctx["freshness"][name] = _stamp(entry, now, refreshed=True)
+    return data
+
+
+async def assemble_dossier(
+    api: AsyncAPIFootball,
+    fixture: Dict[str, Any],
+    used_season: int,
+    home_team: Dict[str, Any],
+    away_team: Dict[str, Any],
+    kickoff_local: datetime,
+    tz: str,
     season: int,
     league_id: Optional[int],
     recent_n: int,
     h2h_n: int,
+    standings: Optional[list] = None,
+    refresh: Iterable[str] = (),
 ) -> Dict[str, Any]:
+    """
+    Monta o dossiê de um fixture já resolvido, componente a componente.
+    standings: tabela da liga já baixada (lote); None/vazia = usa o cache ou busca.
+    refresh: componentes recalculados mesmo se ainda válidos (ex.: "lineups"), a
+    partir do cache de respostas: quem força atualiza as respostas antes.
+    dossier["freshness"] diz o que foi recalculado e a idade de cada parte;
+    seções que falharam sem cópia no cache ficam em dossier["degraded"].
+    """
+    xg = XGStub()
+    # tabela vazia = o lote não conseguiu baixar: não serve de substituta
+    shared_standings = standings if standings else None
+    home_id, away_id = home_team["id"], away_team["id"]
+    fx = fixture.get("fixture", {})
+    fixture_id = fx.get("id")
+
+    league = fixture.get("league", {})
+    resolved_league_id = league_id or league.get("id")
+
+    ctx = {
+        "refresh": set(refresh),
+        "freshness": {},
+        "degraded": {},
+        "kickoff_ts": fx.get("timestamp"),
+        "status": (fx.get("status") or {}).get("short"),
+    }
+
+    async def table_rows():
+        # standings pode vir pronto (lote de jogos da mesma liga)
+        payload = shared_standings
+        if payload is None:
+            payload = await api.standings(resolved_league_id, season=used_season) if resolved_league_id else []
+        return {"home_row": extract_table_row(payload, home_id), "away_row": extract_table_row(payload, away_id)}
+
+    async def recent(team_id: int):
+        # forma recente: usa used_season (evita bloquear)
+        return summarize_recent(await api.last_fixtures(team_id, season=used_season, last=recent_n), team_id)
 
+    async def xg_context():
+        return xg.get_match_xg_context(
+            home=home_team.get("name"),
+            away=away_team.get("name"),
+            kickoff_iso=fx.get("date"),
+        )
+
+    if shared_standings is not None:
+        ctx["refresh"].add("standings")  # tabela nova já em mãos: não custa nada
+
+    # Componentes vencidos saem juntos (limitados pelo semáforo do api);
+    # falha em um deles degrada só a própria seção.
+    (
+        table,
+        home_recent,
+        away_recent,
+        h2h,
+        lineups,
+        injuries,
+        stats,
+        xg_ctx,
+    ) = await asyncio.gather(
+        _component("standings", "standings", (resolved_league_id, used_season, home_id, away_id),
+                   table_rows, {"home_row": None, "away_row": None}, ctx),
+        _component("recent_form.home", "recent_form", (home_id, used_season, recent_n),
+                   lambda: recent(home_id), summarize_recent([], home_id), ctx),
+        _component("recent_form.away", "recent_form", (away_id, used_season, recent_n),
+                   lambda: recent(away_id), summarize_recent([], away_id), ctx),
+        _component("head_to_head", "head_to_head", (home_id, away_id, h2h_n),
+                   lambda: api.h2h(home_id, away_id, last=h2h_n), [], ctx),
+        _component("lineups", "lineups", (fixture_id,), lambda: api.lineups(fixture_id), [], ctx),
+        _component("injuries", "injuries", (fixture_id,), lambda: api.injuries(fixture_id), [], ctx),
+        _component("fixture_statistics", "fixture_statistics", (fixture_id,),
+                   lambda: api.statistics(fixture_id), [], ctx),
+        _component("xg", "xg", (fixture_id,), xg_context, {"enabled": False}, ctx),
+    )
+
+    # meta do jogo: montada do fixture a cada vez (sem rede, não vai para o cache)
+    match = match_info(fixture, used_season, home_team, away_team, kickoff_local, tz, season)
+    ctx["freshness"]["match"] = {"refreshed": True, "age_s": 0, "hash": _digest(match)}
+
+    dossier = {
+        "match": match,
+        "standings": table,
+        "recent_form": {"home": home_recent, "away": away_recent},
+        "head_to_head": {"last_n": h2h_n, "fixtures": h2h},
+        "lineups": {"raw": lineups, "note": "Se vazio, lineup oficial ainda não saiu ou plano não fornece."},
+        "injuries": injuries,
+        "fixture_statistics": stats,
+        "xg": xg_ctx,
+        "freshness": ctx["freshness"],
+    }
+
+    if ctx["degraded"]:
+        dossier["degraded"] = ctx["degraded"]
+    return dossier
+
+
+class Resolved(NamedTuple):
+    """Times + fixture de um pedido, antes das coletas do dossiê."""
+    fixture: Dict[str, Any]
+    used_season: int
+    home_team: Dict[str, Any]
+    away_team: Dict[str, Any]
+    kickoff_local: datetime
+    tz: str
+
+    @property
+    def fixture_id(self) -> Optional[int]:
+        return self.fixture.get("fixture", {}).get("id")
+
+
+async def _resolve(api: AsyncAPIFootball, home: str, away: str, kickoff: str, tz: Optional[str], season: int) -> Resolved:
+    # times e fixture saem do catálogo/índice locais (rede só se faltarem)
     tz = tz or APP_TZ
     kickoff_local = datetime.strptime(kickoff, "%Y-%m-%d %H:%M").replace(tzinfo=ZoneInfo(tz))
+    home_team, away_team = await asyncio.gather(
+        resolve_team_async(api, home),
+        resolve_team_async(api, away),
+    )
+    fixture, used_season = await resolve_fixture(api, home_team["id"], away_team["id"], kickoff_local, season, tz)
+    return Resolved(fixture, used_season, home_team, away_team, kickoff_local, tz)
 
-    api = APIFootball()
-    xg = XGStub()
 
+async def resolve_match_async(
+    home: str,
+    away: str,
+    kickoff: str,              # "YYYY-MM-DD HH:MM"
+    tz: Optional[str],
+    season: int,
+) -> Resolved:
+    """Só resolve times + fixture; o resultado pode ir para build_dossier_async(resolved=...)."""
+    api = AsyncAPIFootball(max_concurrency=DOSSIER_CONCURRENCY)
     try:
-        home_team = api.team_search(home)
-        away_team = api.team_search(away)
-        home_id, away_id = home_team["id"], away_team["id"]
-
-        # cache key inclui season solicitada (não a usada), pra não confundir chamadas
-        ck = _key("dossier", home_id, away_id, kickoff_local.isoformat(), season, league_id, recent_n, h2h_n)
-        cached = cache_get(ck)
-        if cached:
-            return cached
-
-        used_season = None
-        fixture = None
-        last_error = None
-
-        # tenta achar fixture com fallback de season (por limite do plano free)
-        for s in _season_fallbacks(season):
-            try:
-                fixture = find_fixture(api, home_id, away_id, kickoff_local, s, tz)
-                used_season = s
-                break
-            except RuntimeError as e:
-                msg = str(e)
-                # plano free bloqueou season
-                if "APIFOOTBALL_PLAN_LIMIT" in msg:
-                    last_error = msg
-                    continue
-                # fixture não encontrado (pode acontecer)
-                if msg == "FIXTURE_NOT_FOUND":
-                    last_error = msg
-                    continue
-                raise  # erro inesperado: sobe
-
-        if not fixture:
-            # mensagem amigável
-            if last_error and "APIFOOTBALL_PLAN_LIMIT" in last_error:
-                raise RuntimeError("Seu plano da API-Football não permite essa season. Use 2021–2023 ou faça upgrade.")
-            raise RuntimeError("Não encontrei o jogo (fixture) para essa data/times. Pode ser jogo futuro ou dados indisponíveis no plano free.")
-
-        fixture_id = fixture.get("fixture", {}).get("id")
-
-        league = fixture.get("league", {})
-        resolved_league_id = league_id or league.get("id")
-
-        # Coletas (algumas podem vir vazias)
-        lineups = api.lineups(fixture_id)
-        injuries = api.injuries(fixture_id)
-        stats = api.statistics(fixture_id)
-        h2h = api.h2h(home_id, away_id, last=h2h_n)
+        return await _resolve(api, home, away, kickoff, tz, season)
+    finally:
+        await api.close()
 
-        # forma recente: usa used_season (evita bloquear)
-        home_recent = api.last_fixtures(home_id, season=used_season, last=recent_n)
-        away_recent = api.last_fixtures(away_id, season=used_season, last=recent_n)
 
-        standings = api.standings(resolved_league_id, season=used_season) if resolved_league_id else []
-        home_row = extract_table_row(standings, home_id)
-        away_row = extract_table_row(standings, away_id)
+async def build_dossier_async(
+    home: str,
+    away: str,
+    kickoff: str,              # "YYYY-MM-DD HH:MM"
+    tz: Optional[str],
+    season: int,
+    league_id: Optional[int],
+    recent_n: int,
+    h2h_n: int,
+    resolved: Optional[Resolved] = None,
+) -> Dict[str, Any]:
+    """resolved: times + fixture já resolvidos (resolve_match_async); None = resolve aqui."""
+    api = AsyncAPIFootball(max_concurrency=DOSSIER_CONCURRENCY)
 
-        xg_ctx = xg.get_match_xg_context(
-            home=home_team.get("name"),
-            away=away_team.get("name"),
-            kickoff_iso=fixture.get("fixture", {}).get("date"),
+    try:
+        r = resolved or await _resolve(api, home, away, kickoff, tz, season)
+        # cada componente do dossiê tem o próprio cache (assemble_dossier)
+        return await assemble_dossier(
+            api, r.fixture, r.used_season, r.home_team, r.away_team, r.kickoff_local, r.tz,
+            season, league_id, recent_n, h2h_n,
         )
 
-        dossier = {
-            "match": {
-                "fixture_id": fixture_id,
-                "kickoff_local": kickoff_local.isoformat(),
-                "timezone": tz,
-                "season_requested": season,
-                "season_used": used_season,
-                "league": league,
-                "venue": fixture.get("fixture", {}).get("venue"),
-                "home": {"id": home_id, "name": home_team.get("name")},
-                "away": {"id": away_id, "name": away_team.get("name")},
-            },
-            "standings": {"home_row": home_row, "away_row": away_row},
-            "recent_form": {
-                "home": summarize_recent(home_recent, home_id),
-                "away": summarize_recent(away_recent, away_id),
-            },
-            "head_to_head": {"last_n": h2h_n, "fixtures": h2h},
-            "lineups": {"raw": lineups, "note": "Se vazio, lineup oficial ainda não saiu ou plano não fornece."},
-            "injuries": injuries,
-            "fixture_statistics": stats,
-            "xg": xg_ctx,
-        }
-
-        cache_set(ck, dossier)
-        return dossier
-
     finally:
-        api.close()
+        await api.close()
+
+
+async def build_match_async(
+    home: str,
+    away: str,
+    kickoff: str,              # "YYYY-MM-DD HH:MM"
+    tz: Optional[str],
+    season: int,
+) -> Dict[str, Any]:
+    """
+    Só resolve times + fixture, sem as coletas do dossiê: {"match": {...}}.
+    Usado pelos modelos locais, que não leem lineups/lesões/etc.
+    """
+    r = await resolve_match_async(home, away, kickoff, tz, season)
+    return {"match": match_info(r.fixture, r.used_season, r.home_team, r.away_team, r.kickoff_local, r.tz, season)}
+
+
+def build_dossier(
+    home: str,
+    away: str,
+    kickoff: str,              # "YYYY-MM-DD HH:MM"
+    tz: Optional[str],
+    season: int,
+    league_id: Optional[int],
+    recent_n: int,
+    h2h_n: int,
+) -> Dict[str, Any]:
+    """
+    Versão síncrona (scripts/dashboard). Dentro do FastAPI use build_dossier_async.
+    """
+    async def run():
+        try:
+            return await build_dossier_async(
+                home=home, away=away, kickoff=kickoff, tz=tz, season=season,
+                league_id=league_id, recent_n=recent_n, h2h_n=h2h_n,
+            )
+        finally:
+            # loop descartável: fecha os clientes assíncronos presos a ele
+            await POOL.aclose()
+
+    return asyncio.run(run())
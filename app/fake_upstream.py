@@ -0,0 +1,478 @@
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
+
+from .cassette import Cassette, normalize_query
+
+# Upstream falso e local (API-Football + The Odds API + OpenAI) para testar a
+# camada de resiliência e medir o pipeline sem gastar cota: dados
+# determinísticos (uma liga, turno e returno semanais), relatório sintético do
+# LLM e falhas/latência injetáveis em POST /_fake/faults.
+#
+#   python -m app.fake_upstream --port 8765 [--cassette ./data/cassettes/x.sqlite]
+#   APIFOOTBALL_BASE_URL=http://127.0.0.1:8765 ODDS_BASE_URL=http://127.0.0.1:8765 \
+#   OPENAI_BASE_URL=http://127.0.0.1:8765 ...
+#
+# Com --cassette, o que foi gravado (app/cassette.py) tem precedência: a mesma
+# requisição devolve as respostas gravadas, na ordem. O que não estiver no
+# cassete cai nos dados sintéticos (ou 404 com --strict). replay_timing=1
+# reproduz os tempos gravados (útil para repetir um incidente); as falhas e a
+# latência de Faults valem por cima de tudo.
+
+LEAGUE_ID = 71
+TEAM_NAMES = [
+    "Palmeiras", "Flamengo", "Botafogo", "Fortaleza", "Internacional", "Sao Paulo",
+    "Corinthians", "Bahia", "Cruzeiro", "Vasco DA Gama", "Vitoria", "Atletico-MG",
+    "Fluminense", "Gremio", "Juventude", "Bragantino", "Athletico-PR", "Criciuma",
+    "Atletico Goianiense", "Cuiaba",
+]
+TEAMS = [{"id": 100 + i, "name": n, "logo": None} for i, n in enumerate(TEAM_NAMES)]
+DAILY_LIMIT = 7500
+
+
+class Faults(BaseModel):
+    latency_ms: float = 0       # atraso fixo de toda resposta
+    jitter_ms: float = 0        # + sorteio em [0, jitter_ms]
+    slow_rate: float = 0        # fração das respostas com atraso extra (cauda)
+    slow_ms: float = 0
+    error_rate: float = 0       # fração das respostas com erro
+    error_status: int = 503
+    rate_limit_rate: float = 0  # fração com errors.rateLimit (como a API-Football faz, HTTP 200)
+    path_prefix: str = ""       # só aplica nos paths com esse prefixo ("" = todos)
+    stream_chunk_ms: float = 0  # atraso entre eventos de stream do LLM sintético
+    replay_timing: float = 0    # cassete: fração dos tempos gravados reproduzida (0 = não espera, 1 = igual)
+
+
+class _State:
+    def __init__(self):
+        self.faults = Faults()
+        self.requests = 0
+        self.day_used = 0
+        self.minute: List[float] = []
+        self.rng = random.Random(0)
+        self.cassette: Optional[Cassette] = None
+        self.strict = False
+        self.replay = {"exact": 0, "loose": 0, "miss": 0}
+
+
+STATE = _State()
+
+
+# ---------------- dados ----------------
+
+def _schedule(season: int) -> List[Dict[str, Any]]:
+    """Turno e returno (método do círculo), uma rodada por semana desde 1º de abril."""
+    ids = [t["id"] for t in TEAMS]
+    n = len(ids)
+    rounds = []
+    rot = ids[1:]
+    for _ in range(n - 1):
+        line = [ids[0]] + rot
+        rounds.append([(line[i], line[n - 1 - i]) for i in range(n // 2)])
+        rot = rot[-1:] + rot[:-1]
+    rounds += [[(a, h) for h, a in rnd] for rnd in rounds]
+
+    start = datetime(season, 4, 1, 19, 0, tzinfo=timezone.utc)
+    now = datetime.now(timezone.utc)
+    out = []
+    for r, rnd in enumerate(rounds):
+        for k, (home, away) in enumerate(rnd):
+            fid = season * 10000 + r * 100 + k
+            kickoff = start + timedelta(weeks=r, hours=2 * (k % 3))
+            done = kickoff + timedelta(hours=2) < now
+            rng = random.Random(fid)
+            goals = {"home": rng.choice([0, 1, 1, 2, 2, 3]), "away": rng.choice([0, 0, 1, 1, 2])} if done \
+                else {"home": None, "away": None}
+            out.append({
+                "fixture": {"id": fid, "date": kickoff.isoformat(), "timestamp": int(kickoff.timestamp()),
+                            "status": {"short": "FT" if done else "NS"}, "venue": {"name": "Estádio"}},
+                "league": {"id": LEAGUE_ID, "season": season, "name": "Serie A", "round": f"Regular Season - {r + 1}"},
+                "teams": {"home": _team(home), "away": _team(away)},
+                "goals": goals,
+            })
+    return out
+
+
+_SCHEDULES: Dict[int, List[Dict[str, Any]]] = {}
+
+
+def _fixtures(season: int) -> List[Dict[str, Any]]:
+    if season not in _SCHEDULES:
+        _SCHEDULES[season] = _schedule(season)
+    return _SCHEDULES[season]
+
+
+def _team(team_id: int) -> Dict[str, Any]:
+    return next(t for t in TEAMS if t["id"] == team_id)
+
+
+def _fixture(fixture_id: int) -> Optional[Dict[str, Any]]:
+    season = int(fixture_id) // 10000
+    return next((fx for fx in _fixtures(season) if fx["fixture"]["id"] == int(fixture_id)), None)
+
+
+def _day(fx: Dict[str, Any]) -> str:
+    return fx["fixture"]["date"][:10]
+
+
+def _involves(fx: Dict[str, Any], team_id: int) -> bool:
+    return team_id in (fx["teams"]["home"]["id"], fx["teams"]["away"]["id"])
+
+
+def _standings(season: int) -> List[Dict[str, Any]]:
+    rows = {t["id"]: {"team": t, "points": 0, "goalsDiff": 0,
+                      "all": {"played": 0, "win": 0, "draw": 0, "lose": 0, "goals": {"for": 0, "against": 0}}}
+            for t in TEAMS}
+    for fx in _fixtures(season):
+        hg, ag = fx["goals"]["home"], fx["goals"]["away"]
+        if hg is None:
+            continue
+        for side, gf, ga in (("home", hg, ag), ("away", ag, hg)):
+            row = rows[fx["teams"][side]["id"]]
+            a = row["all"]
+            a["played"] += 1
+            a["goals"]["for"] += gf
+            a["goals"]["against"] += ga
+            key = "win" if gf > ga else "draw" if gf == ga else "lose"
+            a[key] += 1
+            row["points"] += {"win": 3, "draw": 1, "lose": 0}[key]
+            row["goalsDiff"] += gf - ga
+    table = sorted(rows.values(), key=lambda r: (-r["points"], -r["goalsDiff"]))
+    for i, row in enumerate(table, 1):
+        row["rank"] = i
+    return [{"league": {"id": LEAGUE_ID, "season": season, "standings": [table]}}]
+
+
+# ---------------- app ----------------
+
+app = FastAPI(title="MatchLab fake upstream")
+
+
+def _envelope(response: List[Any], errors: Any = None) -> Dict[str, Any]:
+    return {"errors": errors or [], "results": len(response), "response": response}
+
+
+def _limit_headers() -> Dict[str, str]:
+    now = time.time()
+    STATE.minute = [t for t in STATE.minute if now - t < 60]
+    return {
+        "x-ratelimit-requests-limit": str(DAILY_LIMIT),
+        "x-ratelimit-requests-remaining": str(max(0, DAILY_LIMIT - STATE.day_used)),
+        "X-RateLimit-Limit": "300",
+        "X-RateLimit-Remaining": str(max(0, 300 - len(STATE.minute))),
+    }
+
+
+async def _sse_replay(body: bytes, delay: float):
+    # um evento SSE por vez, espaçados como na gravação
+    for event in body.split(b"\n\n"):
+        if event.strip():
+            if delay:
+                await asyncio.sleep(delay)
+            yield event + b"\n\n"
+
+
+# registrado antes de _inject: roda por dentro dele (falhas/latência valem no replay)
+@app.middleware("http")
+async def _replay(request: Request, call_next):
+    cassette = STATE.cassette
+    if cassette is None or request.url.path.startswith("/_fake"):
+        return await call_next(request)
+    found = cassette.lookup(request.method, request.url.path, normalize_query(request.query_params.multi_items()),
+                            await request.body(), loose=not STATE.strict)
+    if found is None:
+        STATE.replay["miss"] += 1
+        if STATE.strict:
+            return JSONResponse({"message": f"fake upstream: {request.method} {request.url.path} fora do cassete"},
+                                status_code=404)
+        return await call_next(request)
+    hit, kind = found
+    STATE.replay[kind] += 1
+    scale = STATE.faults.replay_timing
+    if scale:
+        await asyncio.sleep(hit.latency_ms * scale / 1000)
+    headers = {k: v for k, v in hit.headers.items() if k != "content-type"}
+    headers["x-cassette"] = kind
+    media_type = hit.headers.get("content-type")
+    if media_type and media_type.startswith("text/event-stream"):
+        events = max(1, hit.body.count(b"\n\n"))
+        delay = max(0.0, hit.duration_ms - hit.latency_ms) * scale / 1000 / events
+        return StreamingResponse(_sse_replay(hit.body, delay), status_code=hit.status,
+                                 headers=headers, media_type=media_type)
+    return Response(hit.body, status_code=hit.status, headers=headers, media_type=media_type)
+
+
+@app.middleware("http")
+async def _inject(request: Request, call_next):
+    f = STATE.faults
+    path = request.url.path
+    if path.startswith("/_fake") or not path.startswith(f.path_prefix or "/"):
+        return await call_next(request)
+
+    STATE.requests += 1
+    STATE.day_used += 1
+    STATE.minute.append(time.time())
+    rng = STATE.rng
+    delay = f.latency_ms + rng.uniform(0, f.jitter_ms)
+    if f.slow_rate and rng.random() < f.slow_rate:
+        delay += f.slow_ms
+    if delay:
+        await asyncio.sleep(delay / 1000)
+    if f.error_rate and rng.random() < f.error_rate:
+        return JSONResponse({"message": "fake upstream error"}, status_code=f.error_status, headers=_limit_headers())
+    if f.rate_limit_rate and rng.random() < f.rate_limit_rate:
+        body = _envelope([], {"rateLimit": "Too many requests. You have exceeded the limit of requests per minute."})
+        return JSONResponse(body, headers=_limit_headers())
+    response = await call_next(request)
+    for k, v in _limit_headers().items():
+        response.headers[k] = v
+    return response
+
+
+@app.post("/_fake/faults")
+def set_faults(faults: Faults):
+    STATE.faults = faults
+    return {"faults": faults.model_dump()}
+
+
+@app.get("/_fake/stats")
+def fake_stats():
+    out = {"requests": STATE.requests, "day_used": STATE.day_used, "faults": STATE.faults.model_dump()}
+    if STATE.cassette is not None:
+        out["replay"] = dict(STATE.replay)
+    return out
+
+
+@app.post("/_fake/rewind")
+def rewind():
+    """Volta o cassete ao início (cada requisição recomeça da 1ª resposta gravada)."""
+    if STATE.cassette is not None:
+        STATE.cassette.rewind()
+    STATE.replay = {"exact": 0, "loose": 0, "miss": 0}
+    return {"ok": True}
+
+
+@app.get("/teams")
+def teams(search: Optional[str] = None, id: Optional[int] = None):
+    q = (search or "").lower()
+    found = [t for t in TEAMS if (id is None or t["id"] == id) and q in t["name"].lower()]
+    return _envelope([{"team": t, "venue": {}} for t in found])
+
+
+@app.get("/fixtures")
+def fixtures(season: int, team: Optional[int] = None, league: Optional[int] = None,
+             day: Optional[str] = Query(None, alias="date"), last: Optional[int] = None,
+             date_from: Optional[str] = Query(None, alias="from"), date_to: Optional[str] = Query(None, alias="to")):
+    # timezone é aceito e ignorado: datas sempre em UTC
+    return _envelope(_select_fixtures(season, team, league, day, last, date_from, date_to))
+
+
+@app.get("/fixtures/headtohead")
+def headtohead(h2h: str, last: int = 10):
+    a, b = (int(x) for x in h2h.split("-"))
+    seasons = range(datetime.now(timezone.utc).year - 2, datetime.now(timezone.utc).year + 1)
+    games = [fx for s in seasons for fx in _fixtures(s)
+             if _involves(fx, a) and _involves(fx, b) and fx["goals"]["home"] is not None]
+    return _envelope(sorted(games, key=lambda fx: fx["fixture"]["timestamp"], reverse=True)[:last])
+
+
+@app.get("/fixtures/lineups")
+def lineups(fixture: int):
+    fx = _fixture(fixture)
+    # como na API real: escalação só sai ~1h antes do apito
+    if fx is None or fx["fixture"]["timestamp"] - time.time() > 3600:
+        return _envelope([])
+    return _envelope([
+        {"team": fx["teams"][side], "formation": "4-3-3",
+         "startXI": [{"player": {"id": fx["teams"][side]["id"] * 100 + i, "name": f"Jogador {i}", "pos": pos}}
+                     for i, pos in enumerate("GDDDDMMMFFF", 1)],
+         "substitutes": []}
+        for side in ("home", "away")
+    ])
+
+
+@app.get("/injuries")
+def injuries(fixture: int):
+    return _envelope([])
+
+
+@app.get("/fixtures/statistics")
+def statistics(fixture: int):
+    fx = _fixture(fixture)
+    if fx is None or fx["goals"]["home"] is None:
+        return _envelope([])
+    rng = random.Random(fixture)
+    return _envelope([
+        {"team": fx["teams"][side], "statistics": [
+            {"type": "Total Shots", "value": rng.randint(5, 20)},
+            {"type": "Ball Possession", "value": f"{rng.randint(35, 65)}%"},
+        ]}
+        for side in ("home", "away")
+    ])
+
+
+@app.get("/leagues")
+def leagues(id: Optional[int] = None, season: Optional[int] = None):
+    if id is not None and id != LEAGUE_ID:
+        return _envelope([])
+    years = [season] if season else range(datetime.now(timezone.utc).year - 2, datetime.now(timezone.utc).year + 1)
+    seasons = [{"year": y, "start": _day(_fixtures(y)[0]), "end": max(_day(fx) for fx in _fixtures(y)),
+                "current": y == datetime.now(timezone.utc).year} for y in years]
+    return _envelope([{"league": {"id": LEAGUE_ID, "name": "Serie A", "type": "League"},
+                       "country": {"name": "Brazil"}, "seasons": seasons}])
+
+
+@app.get("/standings")
+def standings(league: int, season: int):
+    return _envelope(_standings(season) if league == LEAGUE_ID else [])
+
+
+@app.get("/sports/{sport_key}/odds")
+def odds(sport_key: str):
+    now = datetime.now(timezone.utc)
+    upcoming = [fx for fx in _fixtures(now.year) if fx["goals"]["home"] is None][:10]
+    return [
+        {"id": str(fx["fixture"]["id"]), "sport_key": sport_key, "commence_time": fx["fixture"]["date"],
+         "home_team": fx["teams"]["home"]["name"], "away_team": fx["teams"]["away"]["name"],
+         "bookmakers": [{"key": "fake", "markets": [{"key": "h2h", "outcomes": [
+             {"name": fx["teams"]["home"]["name"], "price": 2.1},
+             {"name": fx["teams"]["away"]["name"], "price": 3.4},
+             {"name": "Draw", "price": 3.2}]}]}]}
+        for fx in upcoming
+    ]
+
+
+# ---------------- OpenAI (Responses API) ----------------
+
+_DOSSIER_RE = re.compile(r"DOSSIÊ JSON:\n(.*)\nmode=(\w+)", re.DOTALL)
+
+
+def _team_name(team: Any) -> Optional[str]:
+    # dossiê compacto (compact.project) traz o nome direto; o bruto, {"id", "name", ...}
+    if isinstance(team, dict):
+        team = team.get("name")
+    return team if isinstance(team, str) else None
+
+
+def _fake_report(body: Dict[str, Any]) -> str:
+    """Relatório curto e determinístico (por fixture) no formato que predictors.py lê."""
+    text = ""
+    for item in body.get("input") or []:
+        for part in item.get("content") or []:
+            text += part.get("text", "")
+    home, away, seed = "Casa", "Fora", text
+    m = _DOSSIER_RE.search(text)
+    if m:
+        try:
+            dossier = json.loads(m.group(1))
+        except ValueError:
+            dossier = None
+        match = dossier.get("match") if isinstance(dossier, dict) else None
+        if isinstance(match, dict):
+            home = _team_name(match.get("home")) or home
+            away = _team_name(match.get("away")) or away
+            seed = str(match.get("fixture_id") or seed)
+    rng = random.Random(seed)
+    hg, ag = rng.choice([0, 1, 1, 2, 2, 3]), rng.choice([0, 0, 1, 1, 2])
+    return (
+        f"1) Jogador por jogador: DADO AUSENTE (upstream falso).\n"
+        f"2) Por equipe: {home} e {away} sem dados reais.\n"
+        f"3) Time x time: roteiro sintético.\n"
+        f"4) Previsão:\nPLACAR_MAIS_PROVAVEL: {home} {hg}–{ag} {away}\n"
+        f"Risco: - dados sintéticos\n- sem escalação\nConfiança: 10"
+    )
+
+
+def _response_object(body: Dict[str, Any], text: str, rid: str) -> Dict[str, Any]:
+    return {
+        "id": rid, "object": "response", "created_at": int(time.time()), "status": "completed",
+        "model": body.get("model"), "instructions": body.get("instructions"),
+        "error": None, "incomplete_details": None, "metadata": {}, "parallel_tool_calls": True,
+        "temperature": 1.0, "top_p": 1.0, "tool_choice": "auto", "tools": [],
+        "output": [{"type": "message", "id": f"msg_{rid}", "role": "assistant", "status": "completed",
+                    "content": [{"type": "output_text", "text": text, "annotations": []}]}],
+        "usage": {"input_tokens": len(json.dumps(body.get("input"))) // 4, "output_tokens": len(text) // 4,
+                  "total_tokens": (len(json.dumps(body.get("input"))) + len(text)) // 4},
+    }
+
+
+def _sse_event(seq: int, event: Dict[str, Any]) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps({**event, 'sequence_number': seq}, ensure_ascii=False)}\n\n"
+
+
+async def _stream_report(body: Dict[str, Any], text: str, rid: str):
+    done = _response_object(body, text, rid)
+    seq = 0
+    yield _sse_event(seq, {"type": "response.created", "response": {**done, "status": "in_progress", "output": []}})
+    for i in range(0, len(text), 24):
+        if STATE.faults.stream_chunk_ms:
+            await asyncio.sleep(STATE.faults.stream_chunk_ms / 1000)
+        seq += 1
+        yield _sse_event(seq, {"type": "response.output_text.delta", "item_id": f"msg_{rid}",
+                               "output_index": 0, "content_index": 0, "delta": text[i:i + 24]})
+    seq += 1
+    yield _sse_event(seq, {"type": "response.completed", "response": done})
+
+
+@app.post("/responses")
+async def responses(request: Request):
+    body = await request.json()
+    text = _fake_report(body)
+    rid = f"resp_fake{STATE.requests}"
+    if body.get("stream"):
+        return StreamingResponse(_stream_report(body, text, rid), media_type="text/event-stream")
+    return _response_object(body, text, rid)
+
+
+def _select_fixtures(season: int, team: Optional[int], league: Optional[int], day: Optional[str],
+                     last: Optional[int], date_from: Optional[str], date_to: Optional[str]) -> List[Dict[str, Any]]:
+    games = _fixtures(season)
+    if league is not None and league != LEAGUE_ID:
+        return []
+    if team is not None:
+        games = [fx for fx in games if _involves(fx, team)]
+    if day:
+        games = [fx for fx in games if _day(fx) == day]
+    if date_from:
+        games = [fx for fx in games if _day(fx) >= date_from]
+    if date_to:
+        games = [fx for fx in games if _day(fx) <= date_to]
+    if last:
+        done = [fx for fx in games if fx["goals"]["home"] is not None]
+        games = sorted(done, key=lambda fx: fx["fixture"]["timestamp"], reverse=True)[:last]
+    return games
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Upstream falso (API-Football + The Odds API + OpenAI)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--cassette", help="cassete gravado com CASSETTE_RECORD (app/cassette.py)")
+    parser.add_argument("--strict", action="store_true", help="fora do cassete: 404 em vez de dados sintéticos")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--replay-timing", type=float, default=0, help="fração dos tempos gravados (1 = igual)")
+    args = parser.parse_args()
+    if args.cassette:
+        if not Path(args.cassette).exists():
+            raise SystemExit(f"Cassete não encontrado: {args.cassette}")
+        STATE.cassette = Cassette(args.cassette)
+        STATE.strict = args.strict
+    STATE.faults = Faults(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, replay_timing=args.replay_timing)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import json
+from datetime import datetime, time, timedelta
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from .cache import cache_get, cache_set
+from .db import reader, transaction
+from .teams import TEAMS
+
+# Índice local de fixtures (tabela matches), alimentado por cargas em lote
+# (liga + intervalo de datas) e por tudo que passa pela busca na rede.
+
+PLAN_LIMIT_TTL = 7 * 24 * 3600  # plano pode mudar: reavalia semanalmente
+
+
+def _row(fx: Dict[str, Any]) -> Optional[tuple]:
+    f = fx.get("fixture") or {}
+    league = fx.get("league") or {}
+    teams = fx.get("teams") or {}
+    goals = fx.get("goals") or {}
+    if not f.get("id"):
+        return None
+    return (
+        f.get("id"),
+        league.get("id"),
+        league.get("season"),
+        f.get("date"),
+        f.get("timestamp"),
+        (teams.get("home") or {}).get("name"),
+        (teams.get("away") or {}).get("name"),
+        (teams.get("home") or {}).get("id"),
+        (teams.get("away") or {}).get("id"),
+        (f.get("status") or {}).get("short"),
+        goals.get("home"),
+        goals.get("away"),
+        json.dumps(fx, ensure_ascii=False),
+    )
+
+
+def upsert_fixtures(fixtures: Iterable[Dict[str, Any]]) -> Tuple[int, int]:
+    """
+    Upsert em lote de objetos /fixtures da API em matches: (vistos, gravados).
+    Linha igual à que já está no banco não é reescrita.
+    Não mexe em raw_hash (dossiê gravado pelas previsões).
+    """
+    fixtures = list(fixtures)
+    rows = [r for r in map(_row, fixtures) if r]
+    if not rows:
+        return 0, 0
+    with transaction() as c:
+        changed = c.executemany("""
+        INSERT INTO matches(fixture_id, league_id, season, kickoff_iso, kickoff_ts, home_name, away_name,
+                            home_id, away_id, status, home_goals, away_goals, fixture_json)
+        VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?)
+        ON CONFLICT(fixture_id) DO UPDATE SET
+          league_id=excluded.league_id,
+          season=excluded.season,
+          kickoff_iso=excluded.kickoff_iso,
+          kickoff_ts=excluded.kickoff_ts,
+          home_name=excluded.home_name,
+          away_name=excluded.away_name,
+          home_id=excluded.home_id,
+          away_id=excluded.away_id,
+          status=excluded.status,
+          home_goals=excluded.home_goals,
+          away_goals=excluded.away_goals,
+          fixture_json=excluded.fixture_json
+        WHERE matches.status IS NOT excluded.status
+           OR matches.home_goals IS NOT excluded.home_goals
+           OR matches.away_goals IS NOT excluded.away_goals
+           OR matches.kickoff_ts IS NOT excluded.kickoff_ts
+           OR matches.fixture_json IS NOT excluded.fixture_json
+        """, rows).rowcount
+    # os times dos jogos também alimentam o catálogo (resolução sem rede)
+    TEAMS.add(t for fx in fixtures for t in (fx.get("teams") or {}).values() if t)
+    return len(rows), changed
+
+
+def index_fixtures(fixtures: Iterable[Dict[str, Any]]) -> int:
+    return upsert_fixtures(fixtures)[0]
+
+
+_LOOKUP_FIXTURE = """
+  SELECT fixture_json FROM matches
+  WHERE home_id=? AND away_id=? AND kickoff_ts >= ? AND kickoff_ts < ?
+    AND fixture_json IS NOT NULL
+  ORDER BY ABS(kickoff_ts - ?) LIMIT 1
+"""
+
+
+def lookup_fixture(home_id: int, away_id: int, kickoff_local: datetime) -> Optional[Dict[str, Any]]:
+    """
+    Mesma janela da busca na rede (D-1 até D+1 no fuso do kickoff), numa consulta
+    indexada em (home_id, away_id, kickoff_ts). Devolve o objeto /fixtures ou None.
+    """
+    tz = kickoff_local.tzinfo
+    start = datetime.combine(kickoff_local.date() - timedelta(days=1), time.min, tzinfo=tz)
+    end = datetime.combine(kickoff_local.date() + timedelta(days=2), time.min, tzinfo=tz)
+    with reader() as c:
+        row = c.execute(_LOOKUP_FIXTURE, (home_id, away_id, int(start.timestamp()), int(end.timestamp()),
+              int(kickoff_local.timestamp()))).fetchone()
+    return json.loads(row["fixture_json"]) if row else None
+
+
+def sync_league_range(api, league_id: int, season: int, date_from: str, date_to: str) -> int:
+    """Carga em lote (APIFootball síncrono): uma chamada para a liga inteira no intervalo."""
+    return index_fixtures(api.fixtures_by_league_range(league_id, season, date_from, date_to))
+
+
+# ---------- seasons bloqueadas pelo plano (APIFOOTBALL_PLAN_LIMIT) ----------
+
+def _plan_key(season: int) -> str:
+    return f"af | plan_limit | {season}"
+
+
+def mark_plan_limited(season: int, msg: str) -> None:
+    cache_set(_plan_key(season), msg, PLAN_LIMIT_TTL)
+
+
+def plan_limited(season: int) -> Optional[str]:
+    return cache_get(_plan_key(season))
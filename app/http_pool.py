@@ -0,0 +1,206 @@
+import time
+import asyncio
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+
+from .config import (
+    HTTP_HTTP2,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_POOL_TIMEOUT,
+)
+from .cassette import AsyncRecordingTransport, RecordingTransport, recorder
+
+try:
+    import h2  # noqa: F401  (httpx[http2])
+    _HAS_H2 = True
+except ImportError:
+    _HAS_H2 = False
+
+# eventos do httpcore que marcam "conexão nova" vs "conexão reaproveitada"
+_CONNECT_EVENTS = ("connection.connect_tcp.started", "connection.connect_unix_socket.started")
+_SEND_EVENTS = ("http11.send_request_headers.started", "http2.send_request_headers.started")
+
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.reused = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, wait: float, new: bool):
+        with self._lock:
+            self.requests += 1
+            if new:
+                self.new_connections += 1
+            else:
+                self.reused += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            n = self.requests
+            return {
+                "requests": n,
+                "new_connections": self.new_connections,
+                "reuse_ratio": (self.reused / n) if n else 0.0,
+                "queue_wait_avg_ms": (self.wait_total / n * 1000) if n else 0.0,
+                "queue_wait_max_ms": self.wait_max * 1000,
+            }
+
+
+def _tracer(stats: _Stats):
+    """
+    Trace do httpcore por requisição: mede quanto tempo a requisição esperou
+    por uma conexão do pool e se precisou abrir uma nova.
+    """
+    t0 = time.perf_counter()
+    done = [False]
+
+    def trace(event: str, info: dict):
+        if done[0]:
+            return
+        if event in _CONNECT_EVENTS:
+            done[0] = True
+            stats.record(time.perf_counter() - t0, new=True)
+        elif event in _SEND_EVENTS:
+            done[0] = True
+            stats.record(time.perf_counter() - t0, new=False)
+
+    return trace
+
+
+def _open_connections(client) -> int:
+    try:
+        return len(client._transport._pool.connections)
+    except Exception:
+        return 0
+
+
+class HTTPPool:
+    """
+    Clientes httpx compartilhados pelo processo inteiro, um por provider (name).
+    Os síncronos são globais; os assíncronos ficam presos ao event loop que os criou.
+    Dono: o app FastAPI (fecha tudo no shutdown).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync: Dict[str, httpx.Client] = {}
+        self._async: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+        self._stats: Dict[str, _Stats] = {}
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+
+    def _transport(self, name: str, base_url: str, is_async: bool) -> Dict[str, Any]:
+        """Kwargs de transporte do cliente: o padrão do httpx, ou embrulhado pelo cassete se gravando."""
+        http2 = HTTP_HTTP2 and _HAS_H2
+        cassette = recorder()
+        if cassette is None:
+            return {"limits": self._limits(), "http2": http2}
+        # com transport= o httpx ignora limits/http2: monta o transporte aqui
+        if is_async:
+            inner = httpx.AsyncHTTPTransport(limits=self._limits(), http2=http2)
+            return {"transport": AsyncRecordingTransport(cassette, name, base_url, inner)}
+        inner = httpx.HTTPTransport(limits=self._limits(), http2=http2)
+        return {"transport": RecordingTransport(cassette, name, base_url, inner)}
+
+    def _stat(self, name: str) -> _Stats:
+        if name not in self._stats:
+            self._stats[name] = _Stats()
+        return self._stats[name]
+
+    def client(self, name: str, base_url: str = "", headers: Optional[dict] = None, timeout: float = 30.0) -> httpx.Client:
+        with self._lock:
+            c = self._sync.get(name)
+            if c is None or c.is_closed:
+                stats = self._stat(name)
+
+                def on_request(request: httpx.Request):
+                    request.extensions["trace"] = _tracer(stats)
+
+                c = httpx.Client(
+                    base_url=base_url,
+                    headers=headers,
+                    timeout=httpx.Timeout(timeout, pool=HTTP_POOL_TIMEOUT),
+                    event_hooks={"request": [on_request]},
+                    **self._transport(name, base_url, is_async=False),
+                )
+                self._sync[name] = c
+            return c
+
+    def async_client(self, name: str, base_url: str = "", headers: Optional[dict] = None, timeout: float = 30.0) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            per_loop = self._async.setdefault(loop, {})
+            c = per_loop.get(name)
+            if c is None or c.is_closed:
+                stats = self._stat(name)
+
+                async def on_request(request: httpx.Request):
+                    trace = _tracer(stats)
+
+                    async def atrace(event: str, info: dict):
+                        trace(event, info)
+
+                    request.extensions["trace"] = atrace
+
+                c = httpx.AsyncClient(
+                    base_url=base_url,
+                    headers=headers,
+                    timeout=httpx.Timeout(timeout, pool=HTTP_POOL_TIMEOUT),
+                    event_hooks={"request": [on_request]},
+                    **self._transport(name, base_url, is_async=True),
+                )
+                per_loop[name] = c
+            return c
+
+    def close(self):
+        with self._lock:
+            clients = list(self._sync.values())
+            self._sync.clear()
+        for c in clients:
+            try:
+                c.close()
+            except Exception:
+                pass
+
+    async def aclose(self):
+        """Fecha os clientes assíncronos do event loop atual."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = list(self._async.pop(loop, {}).values())
+        for c in clients:
+            try:
+                await c.aclose()
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {}
+            for name, st in self._stats.items():
+                item = st.snapshot()
+                opened = _open_connections(self._sync[name]) if name in self._sync else 0
+                for per_loop in self._async.values():
+                    if name in per_loop:
+                        opened += _open_connections(per_loop[name])
+                item["open_connections"] = opened
+                out[name] = item
+            return {"http2": HTTP_HTTP2 and _HAS_H2, "clients": out}
+
+
+POOL = HTTPPool()
@@ -0,0 +1,188 @@
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import (
+    TRACKED_LEAGUES, INGEST_INTERVAL_SECONDS, INGEST_CHUNK_DAYS, INGEST_LOOKBACK_DAYS,
+)
+from .db import reader, transaction
+from .fixtures_index import upsert_fixtures
+from .providers.apifootball import APIFootball, fetch_scope
+from .quota import INGEST
+from .singleflight import SF
+
+log = logging.getLogger("matchlab.ingest")
+
+# Ingestão incremental de resultados: para cada liga/season acompanhada, puxa
+# /fixtures por intervalo de datas a partir da marca d'água (última data em que
+# tudo já estava encerrado) até hoje ou o fim da season, e grava status/placar
+# em matches. Só linhas que mudaram são escritas (ver upsert_fixtures).
+# As buscas de /fixtures vão direto à rede: o cache de respostas (30 min +
+# janela stale) devolveria placar velho como novo.
+
+# encerrados (com ou sem placar): não mudam mais
+DONE_STATUSES = {"FT", "AET", "PEN", "CANC", "ABD", "AWD", "WO"}
+
+
+def parse_tracked(spec: str) -> List[Tuple[int, int]]:
+    """'71:2024,39:2024' -> [(71, 2024), (39, 2024)]"""
+    out = []
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        league, _, season = part.partition(":")
+        out.append((int(league), int(season)))
+    return out
+
+
+def get_state(league_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    with reader() as c:
+        if league_id is None:
+            rows = c.execute("SELECT * FROM ingest_state ORDER BY league_id, season").fetchall()
+        else:
+            rows = c.execute("SELECT * FROM ingest_state WHERE league_id=? ORDER BY season", (league_id,)).fetchall()
+    return [dict(r) for r in rows]
+
+
+def _high_water(league_id: int, season: int) -> Optional[str]:
+    with reader() as c:
+        row = c.execute("SELECT high_water FROM ingest_state WHERE league_id=? AND season=?",
+                        (league_id, season)).fetchone()
+    return row["high_water"] if row else None
+
+
+def _save_state(league_id: int, season: int, high_water: str, seen: int, changed: int,
+                error: Optional[str] = None) -> None:
+    with transaction() as c:
+        c.execute("""
+        INSERT INTO ingest_state(league_id, season, high_water, last_run_iso, last_seen, last_changed, last_error)
+        VALUES(?,?,?,?,?,?,?)
+        ON CONFLICT(league_id, season) DO UPDATE SET
+          high_water=excluded.high_water,
+          last_run_iso=excluded.last_run_iso,
+          last_seen=excluded.last_seen,
+          last_changed=excluded.last_changed,
+          last_error=excluded.last_error
+        """, (league_id, season, high_water, datetime.utcnow().isoformat(), seen, changed, error))
+
+
+def _chunks(start: date, end: date, days: int):
+    cur = start
+    while cur <= end:
+        stop = min(end, cur + timedelta(days=days - 1))
+        yield cur, stop
+        cur = stop + timedelta(days=1)
+
+
+def _first_open_date(fixtures: List[Dict[str, Any]]) -> Optional[date]:
+    """Data do jogo mais antigo ainda não encerrado (adiado, em andamento, a jogar)."""
+    open_dates = [
+        datetime.fromtimestamp(fx["fixture"]["timestamp"]).date()
+        for fx in fixtures
+        if (fx.get("fixture") or {}).get("timestamp")
+        and ((fx["fixture"].get("status") or {}).get("short") not in DONE_STATUSES)
+    ]
+    return min(open_dates) if open_dates else None
+
+
+def _season_dates(api: APIFootball, league_id: int, season: int) -> Tuple[date, date]:
+    """
+    Início e fim da season segundo /leagues. Sem essa informação (liga fora do
+    plano, provider fora): do 1º de janeiro ao fim do ano seguinte, que cobre
+    tanto season de ano civil quanto europeia (ago-mai).
+    """
+    try:
+        for league in api.league_season(league_id, season):
+            for s in league.get("seasons") or []:
+                if s.get("year") == season and s.get("start") and s.get("end"):
+                    return date.fromisoformat(s["start"]), date.fromisoformat(s["end"])
+    except Exception as e:
+        log.warning("Datas da season %s/%s indisponíveis: %s", league_id, season, e)
+    return date(season, 1, 1), date(season + 1, 12, 31)
+
+
+def ingest_league(api: APIFootball, league_id: int, season: int, today: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Sincroniza uma liga/season da marca d'água (menos INGEST_LOOKBACK_DAYS; sem
+    marca, do início da season) até hoje ou o fim da season, o que vier antes.
+    A nova marca é o dia anterior ao primeiro jogo ainda aberto.
+    """
+    today = today or date.today()
+    hw = _high_water(league_id, season)
+    season_start, season_end = _season_dates(api, league_id, season)
+    start = (date.fromisoformat(hw) - timedelta(days=INGEST_LOOKBACK_DAYS)) if hw else season_start
+    end = min(today, season_end)
+    seen = changed = 0
+    first_open: Optional[date] = None
+    error = None
+
+    try:
+        with fetch_scope(bypass_cache=True):
+            for d_from, d_to in _chunks(start, end, INGEST_CHUNK_DAYS):
+                fixtures = api.fixtures_by_league_range(league_id, season, d_from.isoformat(), d_to.isoformat())
+                s, ch = upsert_fixtures(fixtures)
+                seen += s
+                changed += ch
+                open_day = _first_open_date(fixtures)
+                if open_day and first_open is None:
+                    first_open = open_day
+    except Exception as e:
+        # plano/chave, provider fora, rede: registra e segue com as outras ligas;
+        # a marca não passa do que já foi visto
+        error = f"{type(e).__name__}: {e}"
+        log.warning("Ingestão %s/%s falhou: %s", league_id, season, e)
+
+    if error and first_open is None:
+        new_hw = hw or (start - timedelta(days=1)).isoformat()
+    else:
+        limit = first_open - timedelta(days=1) if first_open else end
+        new_hw = max(limit, date.fromisoformat(hw)).isoformat() if hw else limit.isoformat()
+    _save_state(league_id, season, new_hw, seen, changed, error)
+    return {"league_id": league_id, "season": season, "from": start.isoformat(), "high_water": new_hw,
+            "seen": seen, "changed": changed, "error": error}
+
+
+def run_ingest(leagues: Optional[List[Tuple[int, int]]] = None) -> List[Dict[str, Any]]:
+    """
+    Roda a ingestão das ligas (padrão: TRACKED_LEAGUES). Entre workers, a
+    mesma liga/season roda uma vez só (single-flight por lease).
+    """
+    api = APIFootball(priority=INGEST)
+    out = []
+    for league_id, season in leagues if leagues is not None else parse_tracked(TRACKED_LEAGUES):
+        out.append(SF.do(f"ingest | {league_id} | {season}", lambda: ingest_league(api, league_id, season)))
+    return out
+
+
+# ---------------- agendamento ----------------
+
+_scheduler: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+def start_ingest_scheduler(interval: int = INGEST_INTERVAL_SECONDS) -> None:
+    global _scheduler
+    if not parse_tracked(TRACKED_LEAGUES) or interval <= 0:
+        return
+    if _scheduler is not None and _scheduler.is_alive():
+        return
+    _stop.clear()
+
+    def loop():
+        # primeira rodada logo ao subir, depois a cada interval
+        while True:
+            try:
+                run_ingest()
+            except Exception:
+                log.exception("Falha na ingestão agendada")
+            if _stop.wait(interval):
+                return
+
+    _scheduler = threading.Thread(target=loop, name="ingest", daemon=True)
+    _scheduler.start()
+
+
+def stop_ingest_scheduler() -> None:
+    _stop.set()
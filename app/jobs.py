@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from .config import JOBS_WORKERS, JOBS_MAX_ATTEMPTS, JOBS_RETRY_BASE_SECONDS, JOBS_STALE_SECONDS
+from .db import reader, transaction
+from .http_pool import POOL
+from .pipeline import run_prediction
+from .quota import INTERACTIVE, PREFETCH, priority
+from .resilience import TransientError
+
+log = logging.getLogger("matchlab.jobs")
+
+# Fila persistente de previsões (tabela jobs) + pool de workers (threads).
+# Qualquer worker de qualquer processo pode pegar um job: o claim é um UPDATE atômico.
+
+PRIORITY_INTERACTIVE = 100
+PRIORITY_DEFAULT = 50
+PRIORITY_BACKGROUND = 10
+
+_HANDLERS = {
+    "predict": run_prediction,
+}
+
+
+def _now() -> float:
+    return time.time()
+
+
+def _to_dict(row) -> Dict[str, Any]:
+    d = dict(row)
+    d["payload"] = json.loads(d.pop("payload_json") or "{}")
+    d["result"] = json.loads(d.pop("result_json")) if d.get("result_json") else None
+    d["stages"] = json.loads(d.pop("stages_json") or "{}")
+    return d
+
+
+def submit(kind: str, payload: Dict[str, Any], priority: int = PRIORITY_DEFAULT,
+           callback_url: Optional[str] = None, max_attempts: int = JOBS_MAX_ATTEMPTS) -> str:
+    if kind not in _HANDLERS:
+        raise RuntimeError(f"Tipo de job desconhecido: {kind}")
+    job_id = uuid.uuid4().hex
+    now = _now()
+    with transaction() as c:
+        c.execute("""
+        INSERT INTO jobs(id, kind, payload_json, status, priority, attempts, max_attempts,
+                         callback_url, created_at, next_run_at, stages_json)
+        VALUES(?,?,?,'queued',?,0,?,?,?,?,?)
+        """, (job_id, kind, json.dumps(payload, ensure_ascii=False), priority, max_attempts,
+              callback_url, now, now, json.dumps({"queued": now})))
+    _wake.set()
+    return job_id
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    with reader() as c:
+        row = c.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+    return _to_dict(row) if row else None
+
+
+_CLAIM = """
+UPDATE jobs
+SET status='running', worker=?, attempts=attempts+1, started_at=?,
+    stages_json=json_set(stages_json, '$.started', ?)
+WHERE id = (
+  SELECT id FROM jobs
+  WHERE status='queued' AND next_run_at <= ?
+  ORDER BY priority DESC, created_at
+  LIMIT 1
+)
+RETURNING *
+"""
+
+
+def _claim(worker: str) -> Optional[Dict[str, Any]]:
+    now = _now()
+    with transaction() as c:
+        row = c.execute(_CLAIM, (worker, now, now, now)).fetchone()
+    return _to_dict(row) if row else None
+
+
+def _mark_stage(job_id: str, stage: str) -> None:
+    with transaction() as c:
+        c.execute("UPDATE jobs SET stages_json=json_set(stages_json, ?, ?) WHERE id=?",
+                  (f"$.{stage}", _now(), job_id))
+
+
+def _finish(job: Dict[str, Any], result: Any = None, error: Optional[str] = None, retry: bool = False) -> None:
+    now = _now()
+    with transaction() as c:
+        if retry:
+            # backoff exponencial: base, 2*base, 4*base...
+            delay = JOBS_RETRY_BASE_SECONDS * (2 ** (job["attempts"] - 1))
+            c.execute("""
+            UPDATE jobs SET status='queued', error=?, next_run_at=?,
+                   stages_json=json_set(stages_json, '$.retry_at', ?)
+            WHERE id=?
+            """, (error, now + delay, now + delay, job["id"]))
+            return
+        c.execute("""
+        UPDATE jobs SET status=?, result_json=?, error=?, finished_at=?,
+               stages_json=json_set(stages_json, '$.finished', ?)
+        WHERE id=?
+        """, ("failed" if error else "done",
+              json.dumps(result, ensure_ascii=False) if result is not None else None,
+              error, now, now, job["id"]))
+
+
+def _callback(job_id: str) -> None:
+    job = get_job(job_id)
+    if not job or not job.get("callback_url"):
+        return
+    try:
+        POOL.client("callbacks", timeout=10.0).post(job["callback_url"], json=job)
+    except Exception as e:
+        log.warning("Callback do job %s falhou: %s", job_id, e)
+
+
+def requeue_stale(older_than: int = JOBS_STALE_SECONDS) -> int:
+    """
+    Jobs 'running' de um worker que morreu voltam pra fila, com o backoff de
+    _finish. Tentativas esgotadas: o job falha (um job que derruba o worker não
+    fica voltando para sempre).
+    """
+    now = _now()
+    with transaction() as c:
+        failed = [r["id"] for r in c.execute("""
+        UPDATE jobs SET status='failed', error=?, finished_at=?,
+               stages_json=json_set(stages_json, '$.finished', ?)
+        WHERE status='running' AND started_at < ? AND attempts >= max_attempts
+        RETURNING id
+        """, ("worker parou durante o job; tentativas esgotadas", now, now, now - older_than)).fetchall()]
+        requeued = c.execute("""
+        UPDATE jobs SET status='queued',
+               next_run_at=? + ? * (1 << (attempts - 1)),
+               stages_json=json_set(stages_json, '$.retry_at', ? + ? * (1 << (attempts - 1)))
+        WHERE status='running' AND started_at < ? AND attempts < max_attempts
+        """, (now, JOBS_RETRY_BASE_SECONDS, now, JOBS_RETRY_BASE_SECONDS, now - older_than)).rowcount
+    for job_id in failed:
+        _callback(job_id)
+    return requeued + len(failed)
+
+
+def queue_stats() -> Dict[str, Any]:
+    with reader() as c:
+        rows = c.execute("SELECT status, COUNT(*) n FROM jobs GROUP BY status").fetchall()
+    return {r["status"]: r["n"] for r in rows}
+
+
+# ---------------- workers ----------------
+
+_wake = threading.Event()
+_stop = threading.Event()
+_threads: List[threading.Thread] = []
+
+
+def _run_one(loop: asyncio.AbstractEventLoop, job: Dict[str, Any]) -> None:
+    handler = _HANDLERS[job["kind"]]
+    # job interativo disputa a cota da API-Football como /predict; o resto vem depois
+    quota_class = INTERACTIVE if job["priority"] >= PRIORITY_INTERACTIVE else PREFETCH
+    try:
+        with priority(quota_class):
+            result = loop.run_until_complete(handler(job["payload"], on_stage=lambda st: _mark_stage(job["id"], st)))
+    except TransientError as e:
+        # breaker aberto/sem cota: passa com o tempo, volta pra fila com backoff
+        retry = job["attempts"] < job["max_attempts"]
+        _finish(job, error=str(e), retry=retry)
+        if retry:
+            return
+    except RuntimeError as e:
+        # erro de dado/configuração (time não encontrado, plano, chave): não adianta repetir
+        _finish(job, error=str(e))
+    except Exception as e:
+        retry = job["attempts"] < job["max_attempts"]
+        _finish(job, error=f"{type(e).__name__}: {e}", retry=retry)
+        if retry:
+            return
+    else:
+        _finish(job, result=result)
+    _callback(job["id"])
+
+
+def _worker(name: str) -> None:
+    # event loop próprio e persistente: reaproveita os clientes async do POOL
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        while not _stop.is_set():
+            try:
+                job = _claim(name)
+            except Exception:
+                log.exception("Falha ao buscar job")
+                job = None
+            if job is None:
+                _wake.wait(1.0)
+                _wake.clear()
+                continue
+            _run_one(loop, job)
+    finally:
+        loop.run_until_complete(POOL.aclose())
+        loop.close()
+
+
+def start_workers(n: int = JOBS_WORKERS) -> None:
+    if _threads:
+        return
+    _stop.clear()
+    requeue_stale()
+    for i in range(n):
+        t = threading.Thread(target=_worker, args=(f"{os.getpid()}:w{i}",), name=f"jobs-w{i}", daemon=True)
+        t.start()
+        _threads.append(t)
+
+
+def stop_workers() -> None:
+    _stop.set()
+    _wake.set()
+    _threads.clear()
@@ -0,0 +1,164 @@
+import json
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+from .dossier import build_dossier_async, build_match_async, resolve_match_async
+from .poisson import MODEL_NAME as POISSON, predict_dossiers
+from .predictors import (
+    find_reusable, predict_and_store, predict_key, prepare_prompt, result_from_report, save_match_if_needed,
+    store_predictions,
+)
+from .providers.openai_client import stream_with_openai
+from .singleflight import SF
+
+# Fluxo completo de uma previsão (dossiê -> LLM -> gravação), usado pelas rotas
+# /predict e /predict/stream e pelos workers de jobs.
+
+DOSSIER_FIELDS = ("home", "away", "kickoff", "tz", "season", "league_id", "recent_n", "h2h_n")
+MATCH_FIELDS = ("home", "away", "kickoff", "tz", "season")
+
+
+# SF.do fica num pool próprio: os seguidores esperam bloqueados numa thread, e
+# o líder precisa do executor padrão (asyncio.to_thread do cache) para montar
+# o dossiê. No mesmo pool, N seguidores o esgotariam e o líder nunca andaria.
+_SF_POOL = ThreadPoolExecutor(max_workers=32, thread_name_prefix="predict-sf")
+
+
+def _predict_poisson(dossier: Dict[str, Any]) -> Dict[str, Any]:
+    result = predict_dossiers([dossier])[0]
+    store_predictions([(dossier, result)])
+    return result
+
+
+async def run_prediction(req: Dict[str, Any], on_stage: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """
+    req: mesmos campos do PredictReq. on_stage(nome) é chamado a cada etapa
+    concluída ("dossier", "analysis"). req["model"] == "poisson": modelo local,
+    sem dossiê completo nem LLM.
+    """
+    if req.get("model") == POISSON:
+        dossier = await build_match_async(**{k: req.get(k) for k in MATCH_FIELDS})
+        if on_stage:
+            on_stage("dossier")
+        result = await asyncio.to_thread(_predict_poisson, dossier)
+        if on_stage:
+            on_stage("analysis")
+        return result
+
+    # times + fixture primeiro (catálogo/índice locais): a chave sai do jogo
+    resolved = await resolve_match_async(**{k: req.get(k) for k in MATCH_FIELDS})
+    mode = req.get("mode") or "full"
+    force = bool(req.get("force"))
+    fields = {k: req.get(k) for k in DOSSIER_FIELDS}
+    # Pedidos simultâneos do mesmo jogo/mode/tamanhos compartilham uma única
+    # execução de dossiê + análise (os seguidores não montam dossiê nenhum).
+    # A chamada OpenAI é bloqueante: roda numa thread; a montagem do dossiê
+    # volta ao event loop, onde vivem os clientes assíncronos.
+    league_id = fields["league_id"] or (resolved.fixture.get("league") or {}).get("id")
+    key = predict_key(resolved.fixture_id, mode, league_id, fields["recent_n"], fields["h2h_n"], force)
+    loop = asyncio.get_running_loop()
+
+    def run() -> Dict[str, Any]:
+        dossier = asyncio.run_coroutine_threadsafe(build_dossier_async(**fields, resolved=resolved), loop).result()
+        if on_stage:
+            on_stage("dossier")
+        return predict_and_store(dossier, mode=mode, force=force)
+
+    result = await loop.run_in_executor(_SF_POOL, contextvars.copy_context().run, SF.do, key, run)
+    if on_stage:
+        on_stage("analysis")
+    return result
+
+
+_END = object()
+
+
+async def _iter_in_thread(make_iter: Callable[[], Iterator[str]]) -> AsyncIterator[str]:
+    """
+    Consome um iterador bloqueante numa thread, repassando os itens ao event loop.
+    Se o consumidor desistir (cliente caiu), a thread para no próximo item.
+    """
+    loop = asyncio.get_running_loop()
+    q: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def run():
+        try:
+            for item in make_iter():
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(q.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(q.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(q.put_nowait, _END)
+
+    loop.run_in_executor(None, run)
+    try:
+        while True:
+            item = await q.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+async def stream_prediction(req: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Eventos: status -> meta -> token* -> done (ou error). O primeiro sai antes de
+    qualquer I/O; no fim o relatório completo é gravado como no /predict.
+    """
+    yield {"event": "status", "data": {"stage": "dossier"}}
+    try:
+        poisson = req.get("model") == POISSON
+        if poisson:
+            dossier = await build_match_async(**{k: req.get(k) for k in MATCH_FIELDS})
+        else:
+            dossier = await build_dossier_async(**{k: req.get(k) for k in DOSSIER_FIELDS})
+            await asyncio.to_thread(save_match_if_needed, dossier)
+        m = dossier["match"]
+        yield {"event": "meta", "data": {
+            "fixture_id": m["fixture_id"],
+            "home": m["home"]["name"],
+            "away": m["away"]["name"],
+            "kickoff_local": m["kickoff_local"],
+        }}
+
+        if poisson:
+            result = await asyncio.to_thread(_predict_poisson, dossier)
+            yield {"event": "token", "data": {"text": result["report"]}}
+            yield {"event": "done", "data": {k: v for k, v in result.items() if k != "report"}}
+            return
+
+        mode = req.get("mode") or "full"
+        payload, prompt, fp = prepare_prompt(dossier, mode)
+        hit = None if req.get("force") else await asyncio.to_thread(find_reusable, dossier, fp)
+        if hit:
+            # mesma resposta já gravada: manda o relatório inteiro num token só
+            yield {"event": "token", "data": {"text": hit["report"]}}
+            yield {"event": "done", "data": {k: v for k, v in hit.items() if k != "report"}}
+            return
+
+        parts = []
+        async for delta in _iter_in_thread(lambda: stream_with_openai(payload, mode=mode)):
+            parts.append(delta)
+            yield {"event": "token", "data": {"text": delta}}
+
+        result = result_from_report(dossier, "".join(parts), prompt)
+        result["fingerprint"] = fp
+        await asyncio.to_thread(store_predictions, [(dossier, result)])
+        yield {"event": "done", "data": {k: v for k, v in result.items() if k != "report"}}
+    except Exception as e:
+        yield {"event": "error", "data": {"error": str(e)}}
+
+
+async def sse(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    async for ev in events:
+        data = json.dumps(ev["data"], ensure_ascii=False)
+        yield f"event: {ev['event']}\ndata: {data}\n\n".encode("utf-8")
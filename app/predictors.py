@@ -1,31 +1,91 @@
-import json
 import re
-from datetime import datetime
-from .providers.openai_client import analyze_with_openai
-from .db import conn
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from .providers.openai_client import analyze_with_openai, PROMPT_VERSION
+from .compact import prompt_payload
+from .config import OPENAI_MODEL, REUSE_MAX_AGE_SECONDS
+from .db import reader, transaction
+from .blobs import Blob, load_text, pack_json, pack_text, store
+from .rollup import score_goals
 
 PLACAR_RE = re.compile(r"PLACAR_MAIS_PROVAVEL:\s*(.+)", re.IGNORECASE)
 
-def save_match_if_needed(dossier: dict):
+_UPSERT_MATCH = """
+INSERT INTO matches(fixture_id, league_id, season, kickoff_iso, kickoff_ts, home_name, away_name, home_id, away_id, raw_hash)
+VALUES(?,?,?,?,?,?,?,?,?,?)
+ON CONFLICT(fixture_id) DO UPDATE SET
+  league_id=COALESCE(matches.league_id, excluded.league_id),
+  season=COALESCE(matches.season, excluded.season),
+  kickoff_iso=COALESCE(matches.kickoff_iso, excluded.kickoff_iso),
+  kickoff_ts=COALESCE(matches.kickoff_ts, excluded.kickoff_ts),
+  home_name=excluded.home_name,
+  away_name=excluded.away_name,
+  home_id=excluded.home_id,
+  away_id=excluded.away_id,
+  raw_hash=COALESCE(excluded.raw_hash, matches.raw_hash)
+"""
+
+_INSERT_PREDICTION = """
+INSERT INTO predictions(fixture_id, created_at_iso, model, dossier_hash, report_hash, scoreline, confidence, risk_json, fingerprint,
+                        p_home, p_draw, p_away, pred_home_goals, pred_away_goals)
+VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+"""
+
+def _match_row(dossier: dict, dossier_blob: Blob) -> tuple:
+    # upsert: preserva status/placar/fixture_json vindos do índice de fixtures;
+    # o dossiê em si vai pra tabela blobs (mesmo hash do predictions.dossier_hash);
+    # dossiê só com "match" (modelo poisson) não substitui o dossiê completo já apontado
     m = dossier["match"]
-    c = conn()
-    c.execute("""
-    INSERT OR REPLACE INTO matches(fixture_id, league_id, season, kickoff_iso, home_name, away_name, home_id, away_id, status, raw_json)
-    VALUES(?,?,?,?,?,?,?,?,?,?)
-    """, (
+    return (
         m["fixture_id"],
         m["league"].get("id"),
-        m["season"],
+        m["league"].get("season") or m.get("season_used"),
         m["kickoff_local"],
+        int(datetime.fromisoformat(m["kickoff_local"]).timestamp()),
         m["home"]["name"],
         m["away"]["name"],
         m["home"]["id"],
         m["away"]["id"],
-        None,
-        json.dumps(dossier, ensure_ascii=False),
-    ))
-    c.commit()
-    c.close()
+        dossier_blob.hash if set(dossier) - {"match"} else None,
+    )
+
+def _prediction_row(dossier: dict, result: dict, dossier_blob: Blob, report_blob: Blob) -> tuple:
+    return (
+        dossier["match"]["fixture_id"],
+        datetime.utcnow().isoformat(),
+        result.get("model", "openai"),
+        dossier_blob.hash,
+        report_blob.hash,
+        result["scoreline"],
+        result["confidence"],
+        "[]",
+        result.get("fingerprint"),
+        result.get("p_home"),
+        result.get("p_draw"),
+        result.get("p_away"),
+        *score_goals(result["scoreline"]),
+    )
+
+def save_match_if_needed(dossier: dict):
+    blob = pack_json(dossier)
+    with transaction() as c:
+        store(c, [blob])
+        c.execute(_UPSERT_MATCH, _match_row(dossier, blob))
+
+def store_predictions(items: List[Tuple[dict, dict]]) -> None:
+    """
+    Grava (dossiê, resultado) em lote: blobs + matches + predictions numa transação só.
+    Compressão fora da transação, pra não segurar o lock de escrita.
+    """
+    if not items:
+        return
+    packed = [(d, r, pack_json(d), pack_text(r["report"])) for d, r in items]
+    with transaction() as c:
+        store(c, [b for _, _, db, rb in packed for b in (db, rb)])
+        c.executemany(_UPSERT_MATCH, [_match_row(d, db) for d, _, db, _ in packed])
+        c.executemany(_INSERT_PREDICTION, [_prediction_row(d, r, db, rb) for d, r, db, rb in packed])
 
 def extract_scoreline(report: str) -> str:
     m = PLACAR_RE.search(report)
@@ -37,36 +97,92 @@ def extract_confidence(report: str) -> int:
     v = int(m[-1])
     return max(0, min(100, v))
 
-def predict_and_store(dossier: dict, mode: str = "full") -> dict:
-    save_match_if_needed(dossier)
-
-    report = analyze_with_openai(json.dumps(dossier, ensure_ascii=False), mode=mode)
-    scoreline = extract_scoreline(report)
-    confidence = extract_confidence(report)
-
-    c = conn()
-    c.execute("""
-    INSERT INTO predictions(fixture_id, created_at_iso, model, dossier_json, report_text, scoreline, confidence, risk_json)
-    VALUES(?,?,?,?,?,?,?,?)
-    """, (
-        dossier["match"]["fixture_id"],
-        datetime.utcnow().isoformat(),
-        "openai",
-        json.dumps(dossier, ensure_ascii=False),
-        report,
-        scoreline,
-        confidence,
-        "[]",
-    ))
-    c.commit()
-    c.close()
-
-    return {
+def result_from_report(dossier: dict, report: str, prompt: dict = None) -> dict:
+    result = {
         "fixture_id": dossier["match"]["fixture_id"],
         "home": dossier["match"]["home"]["name"],
         "away": dossier["match"]["away"]["name"],
         "kickoff_local": dossier["match"]["kickoff_local"],
         "report": report,
-        "scoreline": scoreline,
-        "confidence": confidence,
+        "scoreline": extract_scoreline(report),
+        "confidence": extract_confidence(report),
     }
+    if prompt:
+        result["prompt_tokens"] = {"before": prompt["tokens_before"], "after": prompt["tokens_after"]}
+    return result
+
+# ---------------- reaproveitamento por fingerprint ----------------
+# Mesmo dossiê compacto + modelo + mode + versão do prompt => mesma resposta.
+# Se já existe uma previsão com esse fingerprint dentro da janela, devolve ela.
+
+_reuse_lock = threading.Lock()
+REUSE_STATS = {"hits": 0, "misses": 0, "forced": 0}
+
+def _count(name: str):
+    with _reuse_lock:
+        REUSE_STATS[name] += 1
+
+def reuse_stats() -> dict:
+    with _reuse_lock:
+        s = dict(REUSE_STATS)
+    looked = s["hits"] + s["misses"]
+    s["hit_rate"] = round(s["hits"] / looked, 3) if looked else None
+    return s
+
+def prompt_fingerprint(payload: str, mode: str) -> str:
+    return hashlib.sha256(f"{OPENAI_MODEL}|{mode}|{PROMPT_VERSION}|{payload}".encode("utf-8")).hexdigest()
+
+def prepare_prompt(dossier: dict, mode: str = "full") -> Tuple[str, dict, str]:
+    """(payload do prompt, relatório de tokens, fingerprint)."""
+    payload, prompt = prompt_payload(dossier, mode)
+    return payload, prompt, prompt_fingerprint(payload, mode)
+
+def find_reusable(dossier: dict, fingerprint: str, max_age: int = REUSE_MAX_AGE_SECONDS) -> Optional[dict]:
+    if max_age <= 0:
+        return None
+    since = (datetime.utcnow() - timedelta(seconds=max_age)).isoformat()
+    with reader() as c:
+        row = c.execute("""
+          SELECT id, created_at_iso, report_hash FROM predictions
+          WHERE fingerprint=? AND created_at_iso >= ?
+          ORDER BY created_at_iso DESC LIMIT 1
+        """, (fingerprint, since)).fetchone()
+        report = load_text(c, row["report_hash"]) if row else None
+    if report is None:
+        _count("misses")
+        return None
+    _count("hits")
+    result = result_from_report(dossier, report)
+    result.update(fingerprint=fingerprint, reused_from=row["id"], reused_created_at=row["created_at_iso"])
+    return result
+
+def analyze_dossier(dossier: dict, mode: str = "full", prepared: Optional[Tuple[str, dict, str]] = None) -> dict:
+    """Só a análise (OpenAI) + extração; não grava nada."""
+    payload, prompt, fp = prepared or prepare_prompt(dossier, mode)
+    report = analyze_with_openai(payload, mode=mode)
+    result = result_from_report(dossier, report, prompt)
+    result["fingerprint"] = fp
+    return result
+
+def predict_key(fixture_id: int, mode: str, league_id: Optional[int], recent_n: int, h2h_n: int,
+                force: bool = False) -> str:
+    """
+    Chave de single-flight de uma previsão: mesmo jogo e mesmo dossiê. /predict,
+    jobs e prefetch usam a mesma, então um espera o outro em vez de repetir.
+    league_id: a liga da tabela no dossiê (a pedida ou a do fixture).
+    """
+    return (f"predict | {fixture_id} | {mode} | league={league_id} | recent={recent_n} | h2h={h2h_n}"
+            + (" | force" if force else ""))
+
+def predict_and_store(dossier: dict, mode: str = "full", force: bool = False) -> dict:
+    save_match_if_needed(dossier)
+    prepared = prepare_prompt(dossier, mode)
+    if force:
+        _count("forced")
+    else:
+        hit = find_reusable(dossier, prepared[2])
+        if hit:
+            return hit
+    result = analyze_dossier(dossier, mode=mode, prepared=prepared)
+    store_predictions([(dossier, result)])
+    return result
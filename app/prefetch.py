@@ -0,0 +1,308 @@
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import (
+    APP_TZ, DOSSIER_CONCURRENCY, PREFETCH_LEAGUES, PREFETCH_INTERVAL_SECONDS, PREFETCH_LEAD_HOURS,
+    PREFETCH_LINEUP_MINUTES, PREFETCH_VOLATILE_REFRESH_MINUTES, PREFETCH_LLM,
+)
+from .db import reader, transaction
+from .dossier import assemble_dossier
+from .fixtures_index import index_fixtures
+from .http_pool import POOL
+from .ingest import parse_tracked
+from .predictors import predict_and_store, predict_key
+from .providers.apifootball import AsyncAPIFootball
+from .quota import PREFETCH, QuotaExceeded
+from .resilience import CircuitOpen
+from .singleflight import SF
+
+log = logging.getLogger("matchlab.prefetch")
+
+# Pré-aquecimento antes do jogo: para cada liga da watchlist, lê os jogos das
+# próximas lead_hours e monta o dossiê de cada um (enche o cache de respostas
+# da API-Football, o índice de fixtures e os componentes do dossiê). Na janela de
+# lineup_minutes antes do apito, rebusca só as partes voláteis (escalações e
+# lesões) até a escalação sair; com llm=1 grava também o relatório, que o
+# /predict reaproveita pelo fingerprint do dossiê (app/predictors.py).
+# Tudo na classe PREFETCH da fila de cota: nunca passa na frente do /predict.
+
+UPCOMING = ("NS", "TBD")
+# contadores do processo: tick do agendador e rodadas da API mexem ao mesmo tempo
+_stats_lock = threading.Lock()
+STATS = {"runs": 0, "dossiers": 0, "volatile_refreshes": 0, "lineups_ready": 0,
+         "llm_reports": 0, "errors": 0, "last_run_iso": None}
+
+
+def _count(name: str, n: int = 1) -> None:
+    with _stats_lock:
+        STATS[name] += n
+
+_FIELDS = ("enabled", "lead_hours", "lineup_minutes", "llm", "mode", "recent_n", "h2h_n")
+
+
+# ---------------- watchlist ----------------
+
+def seed_watchlist() -> None:
+    """Entradas de PREFETCH_LEAGUES que ainda não estão na watchlist (padrões da config)."""
+    rows = [(league_id, season, int(PREFETCH_LLM), datetime.utcnow().isoformat())
+            for league_id, season in parse_tracked(PREFETCH_LEAGUES)]
+    if not rows:
+        return
+    with transaction() as c:
+        c.executemany("""
+        INSERT OR IGNORE INTO prefetch_watchlist(league_id, season, llm, updated_at_iso) VALUES(?,?,?,?)
+        """, rows)
+
+
+def get_watchlist(enabled_only: bool = False) -> List[Dict[str, Any]]:
+    sql = "SELECT * FROM prefetch_watchlist" + (" WHERE enabled=1" if enabled_only else "") + " ORDER BY league_id, season"
+    with reader() as c:
+        return [dict(r) for r in c.execute(sql).fetchall()]
+
+
+def set_watchlist_entry(league_id: int, season: int, **fields: Any) -> Dict[str, Any]:
+    """Cria/ajusta uma liga; campos None mantêm o valor atual (ou o padrão da config)."""
+    values = {k: fields.get(k) for k in _FIELDS}
+    with transaction() as c:
+        c.execute("""
+        INSERT INTO prefetch_watchlist(league_id, season, updated_at_iso) VALUES(?,?,?)
+        ON CONFLICT(league_id, season) DO UPDATE SET updated_at_iso=excluded.updated_at_iso
+        """, (league_id, season, datetime.utcnow().isoformat()))
+        sets = [(k, v) for k, v in values.items() if v is not None]
+        if sets:
+            c.execute(f"UPDATE prefetch_watchlist SET {', '.join(f'{k}=?' for k, _ in sets)} "
+                      "WHERE league_id=? AND season=?", [v for _, v in sets] + [league_id, season])
+        row = c.execute("SELECT * FROM prefetch_watchlist WHERE league_id=? AND season=?",
+                        (league_id, season)).fetchone()
+    return dict(row)
+
+
+def remove_watchlist_entry(league_id: int, season: int) -> bool:
+    with transaction() as c:
+        return c.execute("DELETE FROM prefetch_watchlist WHERE league_id=? AND season=?",
+                         (league_id, season)).rowcount > 0
+
+
+def get_state(league_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    with reader() as c:
+        if league_id is None:
+            rows = c.execute("SELECT * FROM prefetch_state ORDER BY kickoff_ts").fetchall()
+        else:
+            rows = c.execute("SELECT * FROM prefetch_state WHERE league_id=? ORDER BY kickoff_ts",
+                             (league_id,)).fetchall()
+    return [dict(r) for r in rows]
+
+
+def prefetch_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        return dict(STATS)
+
+
+# ---------------- estado por fixture ----------------
+
+def _states(fixture_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    if not fixture_ids:
+        return {}
+    with reader() as c:
+        rows = c.execute(f"SELECT * FROM prefetch_state WHERE fixture_id IN ({','.join('?' * len(fixture_ids))})",
+                         fixture_ids).fetchall()
+    return {r["fixture_id"]: dict(r) for r in rows}
+
+
+def _save(st: Dict[str, Any]) -> None:
+    with transaction() as c:
+        c.execute("""
+        INSERT INTO prefetch_state(fixture_id, league_id, season, kickoff_ts, dossier_at, volatile_at,
+                                   lineups_ready, llm_at, error)
+        VALUES(:fixture_id, :league_id, :season, :kickoff_ts, :dossier_at, :volatile_at,
+               :lineups_ready, :llm_at, :error)
+        ON CONFLICT(fixture_id) DO UPDATE SET
+          kickoff_ts=excluded.kickoff_ts,
+          dossier_at=excluded.dossier_at,
+          volatile_at=excluded.volatile_at,
+          lineups_ready=excluded.lineups_ready,
+          llm_at=excluded.llm_at,
+          error=excluded.error
+        """, st)
+
+
+def _forget_past(now: float) -> None:
+    # jogo começou há mais de um dia: nada mais a aquecer
+    with transaction() as c:
+        c.execute("DELETE FROM prefetch_state WHERE kickoff_ts < ?", (int(now) - 86400,))
+
+
+# ---------------- rodada ----------------
+
+def _stops_league(exc: BaseException) -> bool:
+    """Provider fora ou sem cota para PREFETCH: não adianta seguir com os outros jogos."""
+    return isinstance(exc, (CircuitOpen, QuotaExceeded))
+
+
+def _teams(fx: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    teams = fx.get("teams") or {}
+    return ({"id": teams["home"]["id"], "name": teams["home"].get("name")},
+            {"id": teams["away"]["id"], "name": teams["away"].get("name")})
+
+
+async def _build(api: AsyncAPIFootball, fx: Dict[str, Any], entry: Dict[str, Any], standings: Optional[list],
+                 refresh: Tuple[str, ...] = ()) -> dict:
+    """Dossiê do fixture: cada componente vai para o cache que o /predict lê."""
+    home, away = _teams(fx)
+    season = (fx.get("league") or {}).get("season") or entry["season"]
+    kickoff_local = datetime.fromtimestamp(fx["fixture"]["timestamp"], ZoneInfo(APP_TZ))
+    return await assemble_dossier(
+        api, fx, season, home, away, kickoff_local, APP_TZ, season, None,
+        entry["recent_n"], entry["h2h_n"], standings=standings, refresh=refresh,
+    )
+
+
+async def _league_tick(entry: Dict[str, Any], now: float) -> Dict[str, Any]:
+    league_id, season = entry["league_id"], entry["season"]
+    lead = (entry["lead_hours"] or PREFETCH_LEAD_HOURS) * 3600
+    window = (entry["lineup_minutes"] or PREFETCH_LINEUP_MINUTES) * 60
+    refresh_every = PREFETCH_VOLATILE_REFRESH_MINUTES * 60
+    out = {"league_id": league_id, "season": season, "upcoming": 0, "dossiers": 0,
+           "volatile_refreshes": 0, "llm_reports": 0, "errors": 0, "stopped": None}
+
+    api = AsyncAPIFootball(max_concurrency=DOSSIER_CONCURRENCY, priority=PREFETCH)
+    day = lambda ts: datetime.fromtimestamp(ts, timezone.utc).date().isoformat()
+    try:
+        fixtures = await api.fixtures_by_league_range(league_id, season, day(now), day(now + lead))
+    except Exception as e:
+        out["stopped"] = str(e)
+        return out
+    index_fixtures(fixtures)
+
+    upcoming = [
+        fx for fx in fixtures
+        if ((fx.get("fixture") or {}).get("status") or {}).get("short") in UPCOMING
+        and now < (fx["fixture"].get("timestamp") or 0) <= now + lead
+    ]
+    out["upcoming"] = len(upcoming)
+    states = _states([fx["fixture"]["id"] for fx in upcoming])
+    standings: Optional[list] = None
+    standings_tried = False
+
+    for fx in sorted(upcoming, key=lambda f: f["fixture"]["timestamp"]):
+        fid, ts = fx["fixture"]["id"], fx["fixture"]["timestamp"]
+        st = states.get(fid) or {"fixture_id": fid, "league_id": league_id, "season": season, "dossier_at": None,
+                                 "volatile_at": None, "lineups_ready": 0, "llm_at": None, "error": None}
+        st["kickoff_ts"] = ts
+        in_window = ts - now <= window
+        need_dossier = st["dossier_at"] is None
+        need_volatile = in_window and not st["lineups_ready"] and now - (st["volatile_at"] or 0) >= refresh_every
+        # relatório quando a escalação saiu (ou, sem ela, na metade final da janela)
+        want_llm = bool(entry["llm"]) and st["llm_at"] is None and in_window
+        llm_ready = lambda: bool(st["lineups_ready"]) or ts - now <= window / 2
+        if not (need_dossier or need_volatile or (want_llm and llm_ready())):
+            continue
+
+        try:
+            if need_volatile:
+                lineups = await api.refresh("/fixtures/lineups", {"fixture": fid})
+                await api.refresh("/injuries", {"fixture": fid})
+                st["volatile_at"] = now
+                st["lineups_ready"] = int(bool(lineups))
+                out["volatile_refreshes"] += 1
+                _count("volatile_refreshes")
+                _count("lineups_ready", st["lineups_ready"])
+            if not standings_tried:
+                standings_tried = True  # uma tentativa por rodada
+                try:
+                    standings = await api.standings(league_id, season=season)
+                except Exception:
+                    standings = None  # sem tabela nova: o dossiê usa a do cache (ou degrada)
+            dossier = await _build(api, fx, entry, standings,
+                                   refresh=("lineups", "injuries") if need_volatile else ())
+            if need_dossier:
+                st["dossier_at"] = now
+                out["dossiers"] += 1
+                _count("dossiers")
+            if want_llm and llm_ready() and "degraded" not in dossier:
+                mode = entry["mode"] or "full"
+                # mesma chave do /predict: pedido simultâneo do usuário espera este
+                key = predict_key(fid, mode, (fx.get("league") or {}).get("id"), entry["recent_n"], entry["h2h_n"])
+                await asyncio.to_thread(SF.do, key, lambda: predict_and_store(dossier, mode=mode))
+                st["llm_at"] = time.time()
+                out["llm_reports"] += 1
+                _count("llm_reports")
+            st["error"] = None
+        except Exception as e:
+            st["error"] = f"{type(e).__name__}: {e}"
+            out["errors"] += 1
+            _count("errors")
+            if _stops_league(e):
+                out["stopped"] = str(e)
+                _save(st)
+                break
+            log.warning("Prefetch do fixture %s falhou: %s", fid, e)
+        _save(st)
+    return out
+
+
+def prefetch_league(entry: Dict[str, Any], now: Optional[float] = None) -> Dict[str, Any]:
+    async def run():
+        try:
+            return await _league_tick(entry, now or time.time())
+        finally:
+            # loop descartável: fecha os clientes assíncronos presos a ele
+            await POOL.aclose()
+
+    return asyncio.run(run())
+
+
+def run_prefetch(league_id: Optional[int] = None, season: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Uma rodada para as ligas habilitadas da watchlist (ou só a pedida). Entre
+    workers, a mesma liga/season roda uma vez só (single-flight por lease).
+    """
+    now = time.time()
+    out = []
+    for entry in get_watchlist(enabled_only=True):
+        if (league_id is not None and entry["league_id"] != league_id) or (season is not None and entry["season"] != season):
+            continue
+        out.append(SF.do(f"prefetch | {entry['league_id']} | {entry['season']}",
+                         lambda: prefetch_league(entry, now)))
+    _forget_past(now)
+    with _stats_lock:
+        STATS["runs"] += 1
+        STATS["last_run_iso"] = datetime.utcnow().isoformat()
+    return out
+
+
+# ---------------- agendamento ----------------
+
+_scheduler: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+def start_prefetch_scheduler(interval: int = PREFETCH_INTERVAL_SECONDS) -> None:
+    global _scheduler
+    seed_watchlist()
+    if interval <= 0 or not get_watchlist(enabled_only=True):
+        return
+    if _scheduler is not None and _scheduler.is_alive():
+        return
+    _stop.clear()
+
+    def loop():
+        while True:
+            try:
+                run_prefetch()
+            except Exception:
+                log.exception("Falha no prefetch agendado")
+            if _stop.wait(interval):
+                return
+
+    _scheduler = threading.Thread(target=loop, name="prefetch", daemon=True)
+    _scheduler.start()
+
+
+def stop_prefetch_scheduler() -> None:
+    _stop.set()
@@ -1,57 +1,201 @@
 import os
-import httpx
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional
+from urllib.parse import urlencode
 
+from ..cache import cache_get, cache_get_async, cache_set
+from ..config import APIFOOTBALL_STALE_SECONDS, PROVIDER_FALLBACK_SECONDS
+from ..http_pool import POOL
+from ..quota import QUOTA, PREFETCH, QuotaExceeded, priority
+from ..resilience import provider, unavailable
 
-class APIFootball:
-    def __init__(self):
-        self.base_url = os.getenv("APIFOOTBALL_BASE_URL", "https://v3.football.api-sports.io")
-        self.key = os.getenv("APIFOOTBALL_KEY")
-        if not self.key:
-            raise RuntimeError("APIFOOTBALL_KEY não definido no ambiente (.env).")
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+FOREVER = 3650 * DAY
 
-        self.client = httpx.Client(
-            base_url=self.base_url,
-            timeout=30.0,
-            headers={
-                "x-apisports-key": self.key,
-                "Accept": "application/json",
-            },
-        )
+FINISHED = ("FT", "AET", "PEN")
 
-    def close(self):
-        try:
-            self.client.close()
-        except Exception:
-            pass
+# recusas por limite (429 / errors.rateLimit): volta para a fila até N vezes
+RATE_LIMIT_RETRIES = 3
 
-    def _get(self, path: str, params: dict):
-        r = self.client.get(path, params=params)
-        r.raise_for_status()
-        data = r.json()
+# retry/backoff, breaker e hedge (app/resilience.py)
+AF = provider("apifootball")
 
-        errors = data.get("errors") or {}
-        if errors:
-            # Detecta erro típico do plano Free: season fora do range
-            if isinstance(errors, dict) and "plan" in errors:
-                raise RuntimeError(f"APIFOOTBALL_PLAN_LIMIT: {errors.get('plan')}")
-            raise RuntimeError(f"APIFOOTBALL_ERROR: {errors}")
 
-        return data.get("response", [])
+def _unwrap(data: dict):
+    errors = data.get("errors") or {}
+    if errors:
+        # Detecta erro típico do plano Free: season fora do range
+        if isinstance(errors, dict) and "plan" in errors:
+            raise RuntimeError(f"APIFOOTBALL_PLAN_LIMIT: {errors.get('plan')}")
+        raise RuntimeError(f"APIFOOTBALL_ERROR: {errors}")
 
-    # --------- Endpoints usados pelo projeto ---------
+    return data.get("response", [])
+
+
+def _payload(r) -> Optional[dict]:
+    """JSON da resposta, ou None se a API recusou por limite de requisições."""
+    if r.status_code == 429:
+        return None
+    r.raise_for_status()
+    data = r.json()
+    errors = data.get("errors")
+    if isinstance(errors, dict) and "rateLimit" in errors:
+        return None
+    return data
+
+
+def _rate_limited(path: str) -> QuotaExceeded:
+    return QuotaExceeded(f"APIFOOTBALL_RATE_LIMIT: {path} recusado {RATE_LIMIT_RETRIES + 1}x pelo limite do plano")
+
+
+def _can_fall_back(exc: BaseException) -> bool:
+    """Falha que justifica servir a resposta velha do cache (provider fora ou sem cota)."""
+    return unavailable(exc) or isinstance(exc, QuotaExceeded)
+
+
+# ---------------- cache de respostas por endpoint ----------------
+
+def _cache_key(path: str, params: dict) -> str:
+    # params normalizados: ordem fixa e tudo string (1 == "1")
+    norm = sorted((k, str(v)) for k, v in (params or {}).items() if v is not None)
+    return f"af | {path}?{urlencode(norm)}"
+
+
+def _finished_key(fixture_id) -> str:
+    return f"af | finished | {fixture_id}"
+
+
+def _ttl_for(path: str, params: dict, resp: list) -> int:
+    """
+    Quanto tempo (s) uma resposta continua fresca, de acordo com o endpoint.
+    """
+    if path == "/teams":
+        return 7 * DAY
+    if path == "/standings":
+        return 6 * HOUR
+    if path == "/leagues":
+        return 1 * DAY
+    if path == "/fixtures/headtohead":
+        return 12 * HOUR
+    if path == "/injuries":
+        return 1 * HOUR
+    if path == "/fixtures/lineups":
+        # escalação oficial sai ~1h antes do jogo e não muda depois
+        return 1 * DAY if resp else 5 * MINUTE
+    if path == "/fixtures/statistics":
+        # estatística de jogo encerrado não muda mais
+        return FOREVER if cache_get(_finished_key(params.get("fixture"))) else 10 * MINUTE
+    if path == "/fixtures":
+        statuses = [(fx.get("fixture", {}).get("status") or {}).get("short") for fx in resp]
+        if resp and all(st in FINISHED for st in statuses):
+            return 7 * DAY
+        if "last" in params:
+            return 1 * HOUR
+        return 30 * MINUTE
+    return 10 * MINUTE
+
+
+def _store(path: str, params: dict, resp: list) -> None:
+    if path == "/fixtures":
+        # guarda quais fixtures já terminaram (usado no TTL de /fixtures/statistics)
+        for fx in resp:
+            f = fx.get("fixture", {})
+            if (f.get("status") or {}).get("short") in FINISHED:
+                cache_set(_finished_key(f.get("id")), True, FOREVER)
+
+    ttl = _ttl_for(path, params, resp)
+    # stale-while-revalidate: depois de fresh_until ainda serve por mais um tempo
+    # enquanto atualiza em background
+    stale = min(ttl, APIFOOTBALL_STALE_SECONDS)
+    now = time.time()
+    # depois de stale_until a entrada só volta se o provider estiver fora (_get)
+    entry = {"data": resp, "at": now, "fresh_until": now + ttl, "stale_until": now + ttl + stale}
+    cache_set(_cache_key(path, params), entry, ttl + stale + PROVIDER_FALLBACK_SECONDS)
+
+
+def _stale_until(entry: dict) -> float:
+    return entry.get("stale_until", entry["fresh_until"] + APIFOOTBALL_STALE_SECONDS)
+
+
+# Escopo de busca (componentes do dossiê): _get anota quando foi baixada cada
+# resposta que serviu e, com bypass_cache, vai sempre à rede.
+_scope: ContextVar[Optional[dict]] = ContextVar("apifootball_fetch_scope", default=None)
+
+
+@contextmanager
+def fetch_scope(bypass_cache: bool = False) -> Iterator[List[float]]:
+    """Dentro do bloco, a lista recebe o instante de download de cada resposta usada."""
+    seen: List[float] = []
+    token = _scope.set({"seen": seen, "bypass": bypass_cache})
+    try:
+        yield seen
+    finally:
+        _scope.reset(token)
+
+
+def _bypass() -> bool:
+    scope = _scope.get()
+    return bool(scope and scope["bypass"])
+
+
+def _seen(at: Optional[float]) -> None:
+    scope = _scope.get()
+    if scope is not None and at is not None:
+        scope["seen"].append(at)
+
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+_bg_tasks = set()
+
+
+def _claim_refresh(key: str) -> bool:
+    with _refreshing_lock:
+        if key in _refreshing:
+            return False
+        _refreshing.add(key)
+        return True
 
-    def team_search(self, name: str) -> dict:
-        resp = self._get("/teams", {"search": name})
-        if not resp:
-            raise RuntimeError(f"Time não encontrado na API-Football: {name}")
-        # primeiro match
-        return resp[0].get("team") or resp[0].get("teams") or resp[0]
+
+def _release_refresh(key: str) -> None:
+    with _refreshing_lock:
+        _refreshing.discard(key)
+
+
+def _pick_team(resp: list, name: str) -> dict:
+    if not resp:
+        raise RuntimeError(f"Time não encontrado na API-Football: {name}")
+    # primeiro match
+    return resp[0].get("team") or resp[0].get("teams") or resp[0]
+
+
+class _Endpoints:
+    """
+    Endpoints usados pelo projeto. Cada método só monta path/params e devolve
+    self._get(...): no cliente síncrono vira a lista, no assíncrono vira coroutine.
+    """
+
+    def teams_search(self, name: str):
+        return self._get("/teams", {"search": name})
 
     def fixtures_by_team_date(self, team_id: int, date_iso: str, season: int, tz: str):
         # date_iso: YYYY-MM-DD
         p = {"team": team_id, "date": date_iso, "season": season, "timezone": tz}
         return self._get("/fixtures", p)
 
+    def fixtures_by_league_range(self, league_id: int, season: int, date_from: str, date_to: str, tz: Optional[str] = None):
+        # carga em lote: todos os jogos da liga entre date_from e date_to (YYYY-MM-DD)
+        p = {"league": league_id, "season": season, "from": date_from, "to": date_to}
+        if tz:
+            p["timezone"] = tz
+        return self._get("/fixtures", p)
+
     def last_fixtures(self, team_id: int, season: int, last: int = 5):
         p = {"team": team_id, "season": season, "last": last}
         return self._get("/fixtures", p)
@@ -71,3 +215,157 @@ class APIFootball:
 
     def standings(self, league_id: int, season: int):
         return self._get("/standings", {"league": league_id, "season": season})
+
+    def league_season(self, league_id: int, season: int):
+        # datas de início/fim da season (seasons[].start/end)
+        return self._get("/leagues", {"id": league_id, "season": season})
+
+
+def _settings():
+    base_url = os.getenv("APIFOOTBALL_BASE_URL", "https://v3.football.api-sports.io")
+    key = os.getenv("APIFOOTBALL_KEY")
+    if not key:
+        raise RuntimeError("APIFOOTBALL_KEY não definido no ambiente (.env).")
+    headers = {"x-apisports-key": key, "Accept": "application/json"}
+    return base_url, key, headers
+
+
+class APIFootball(_Endpoints):
+    def __init__(self, priority: Optional[int] = None):
+        self.base_url, self.key, headers = _settings()
+        # cliente emprestado do pool do processo (keep-alive entre requisições)
+        self.client = POOL.client("apifootball", base_url=self.base_url, headers=headers, timeout=30.0)
+        # classe na fila de cota (app/quota.py); None = a do contexto
+        self.priority = priority
+
+    def close(self):
+        # o cliente pertence ao POOL (fechado no shutdown do app)
+        pass
+
+    def _attempt(self, path: str, params: dict) -> dict:
+        for _ in range(RATE_LIMIT_RETRIES + 1):
+            QUOTA.acquire(self.priority)
+            r = self.client.get(path, params=params, timeout=AF.policy.timeout)
+            QUOTA.observe(r.headers)
+            data = _payload(r)
+            if data is not None:
+                return data
+            QUOTA.throttle()
+        raise _rate_limited(path)
+
+    def _fetch(self, path: str, params: dict):
+        resp = _unwrap(AF.call(lambda: self._attempt(path, params)))
+        _store(path, params, resp)
+        _seen(time.time())
+        return resp
+
+    def _refresh(self, key: str, path: str, params: dict):
+        try:
+            # revalidação em background não é a chamada que o usuário espera
+            with priority(PREFETCH):
+                self._fetch(path, params)
+        except Exception:
+            pass  # mantém a versão velha até o fim da janela stale
+        finally:
+            _release_refresh(key)
+
+    def _get(self, path: str, params: dict):
+        if _bypass():
+            return self._fetch(path, params)
+        key = _cache_key(path, params)
+        entry = cache_get(key)
+        now = time.time()
+        if entry is None or _stale_until(entry) <= now:
+            try:
+                return self._fetch(path, params)
+            except Exception as e:
+                if entry is None or not _can_fall_back(e):
+                    raise
+                AF.stale_served()
+                _seen(entry.get("at"))
+                return entry["data"]
+        if entry["fresh_until"] < now:
+            if _claim_refresh(key):
+                threading.Thread(target=self._refresh, args=(key, path, params), daemon=True).start()
+        _seen(entry.get("at"))
+        return entry["data"]
+
+    def team_search(self, name: str) -> dict:
+        return _pick_team(self.teams_search(name), name)
+
+
+class AsyncAPIFootball(_Endpoints):
+    def __init__(self, max_concurrency: Optional[int] = None, priority: Optional[int] = None):
+        self.base_url, self.key, headers = _settings()
+        self.client = POOL.async_client("apifootball", base_url=self.base_url, headers=headers, timeout=30.0)
+        # limita quantas requisições ficam em voo ao mesmo tempo (None = sem limite)
+        self._sem = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.priority = priority
+
+    async def close(self):
+        # o cliente pertence ao POOL (fechado no shutdown do app)
+        pass
+
+    async def _attempt(self, path: str, params: dict) -> dict:
+        for _ in range(RATE_LIMIT_RETRIES + 1):
+            # espera a cota fora do semáforo: fila não ocupa vaga de conexão
+            await QUOTA.acquire_async(self.priority)
+            if self._sem is None:
+                r = await self.client.get(path, params=params, timeout=AF.policy.timeout)
+            else:
+                async with self._sem:
+                    r = await self.client.get(path, params=params, timeout=AF.policy.timeout)
+            QUOTA.observe(r.headers)
+            data = _payload(r)
+            if data is not None:
+                return data
+            QUOTA.throttle()
+        raise _rate_limited(path)
+
+    async def _fetch(self, path: str, params: dict):
+        resp = _unwrap(await AF.acall(lambda: self._attempt(path, params)))
+        # gravação no SQLite fora do event loop
+        await asyncio.to_thread(_store, path, params, resp)
+        _seen(time.time())
+        return resp
+
+    async def _refresh(self, key: str, path: str, params: dict):
+        _scope.set(None)  # task com contexto copiado: não anota no escopo de quem a criou
+        try:
+            with priority(PREFETCH):
+                await self._fetch(path, params)
+        except Exception:
+            pass  # mantém a versão velha até o fim da janela stale
+        finally:
+            _release_refresh(key)
+
+    async def _get(self, path: str, params: dict):
+        if _bypass():
+            return await self._fetch(path, params)
+        key = _cache_key(path, params)
+        # acerto em memória na hora; só a leitura do SQLite vai para uma thread
+        entry = await cache_get_async(key)
+        now = time.time()
+        if entry is None or _stale_until(entry) <= now:
+            try:
+                return await self._fetch(path, params)
+            except Exception as e:
+                if entry is None or not _can_fall_back(e):
+                    raise
+                AF.stale_served()
+                _seen(entry.get("at"))
+                return entry["data"]
+        if entry["fresh_until"] < now:
+            if _claim_refresh(key):
+                task = asyncio.create_task(self._refresh(key, path, params))
+                _bg_tasks.add(task)
+                task.add_done_callback(_bg_tasks.discard)
+        _seen(entry.get("at"))
+        return entry["data"]
+
+    async def refresh(self, path: str, params: dict):
+        """Busca ignorando o cache e regrava a entrada (prefetch das partes voláteis)."""
+        return await self._fetch(path, params)
+
+    async def team_search(self, name: str) -> dict:
+        return _pick_team(await self.teams_search(name), name)
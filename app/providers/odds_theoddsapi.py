@@ -1,16 +1,21 @@
-import httpx
 from typing import Any, Dict, Optional
-from ..config import ODDS_API_KEY, ODDS_REGION, ODDS_MARKETS, ODDS_ODDS_FORMAT
+from ..cache import cache_get, cache_set
+from ..config import ODDS_API_KEY, ODDS_BASE_URL, ODDS_REGION, ODDS_MARKETS, ODDS_ODDS_FORMAT, PROVIDER_FALLBACK_SECONDS
+from ..http_pool import POOL
+from ..resilience import provider, unavailable
+
+ODDS = provider("theoddsapi")
 
 class TheOddsAPI:
-    BASE = "https://api.the-odds-api.com/v4"
+    BASE = ODDS_BASE_URL
 
     def __init__(self):
         self.key = ODDS_API_KEY
-        self.client = httpx.Client(timeout=20.0)
+        self.client = POOL.client("theoddsapi", base_url=self.BASE, timeout=20.0)
 
     def close(self):
-        self.client.close()
+        # o cliente pertence ao POOL (fechado no shutdown do app)
+        pass
 
     def enabled(self) -> bool:
         return bool(self.key)
@@ -18,7 +23,7 @@ class TheOddsAPI:
     def odds_soccer(self, sport_key: str, date_format: str = "iso") -> Dict[str, Any]:
         if not self.key:
             return {"enabled": False}
-        url = f"{self.BASE}/sports/{sport_key}/odds"
+        url = f"/sports/{sport_key}/odds"
         params = {
             "apiKey": self.key,
             "regions": ODDS_REGION,
@@ -26,9 +31,24 @@ class TheOddsAPI:
             "oddsFormat": ODDS_ODDS_FORMAT,
             "dateFormat": date_format,
         }
-        r = self.client.get(url, params=params)
-        r.raise_for_status()
-        return {"enabled": True, "data": r.json()}
+
+        def get():
+            r = self.client.get(url, params=params, timeout=ODDS.policy.timeout)
+            r.raise_for_status()
+            return r.json()
+
+        # última resposta boa fica guardada: provider fora -> serve ela marcada como stale
+        key = f"odds | {sport_key} | {ODDS_REGION} | {ODDS_MARKETS} | {ODDS_ODDS_FORMAT} | {date_format}"
+        try:
+            data = ODDS.call(get)
+        except Exception as e:
+            last = cache_get(key) if unavailable(e) else None
+            if last is None:
+                raise
+            ODDS.stale_served()
+            return {"enabled": True, "data": last, "stale": True}
+        cache_set(key, data, PROVIDER_FALLBACK_SECONDS)
+        return {"enabled": True, "data": data}
 
     def find_best_h2h(self, odds_payload: Dict[str, Any], home: str, away: str) -> Optional[Dict[str, Any]]:
         if not odds_payload.get("enabled"):
@@ -1,34 +1,66 @@
 import os
+import hashlib
+from typing import Iterator
 from openai import OpenAI
-from ..config import OPENAI_API_KEY, OPENAI_MODEL
+from ..config import OPENAI_API_KEY, OPENAI_MODEL, OPENAI_BASE_URL
+from ..http_pool import POOL
+from ..resilience import provider
 
-def analyze_with_openai(dossier: dict, mode: str = "full") -> str:
+# retry/timeout/breaker ficam com app/resilience.py (o SDK não repete sozinho)
+LLM = provider("openai")
+
+INSTRUCTIONS = (
+    "Você é um analista profissional de futebol.\n"
+    "Regra ABSOLUTA: use SOMENTE os dados do DOSSIÊ JSON. "
+    "Se algo não existir no dossiê, escreva 'DADO AUSENTE' e faça suposição conservadora.\n\n"
+    "Formato obrigatório:\n"
+    "1) Jogador por jogador (provável XI vs provável XI) por setores.\n"
+    "2) Por equipe (ataque/meio/defesa/bolas paradas/momento).\n"
+    "3) Time x time (roteiro + 3 chaves táticas).\n"
+    "4) Previsão com UM ÚNICO placar mais provável no final:\n"
+    "PLACAR_MAIS_PROVAVEL: TimeCasa X–Y TimeFora\n"
+    "Depois: Risco (2 bullets) e Confiança (0-100).\n\n"
+    "Se mode=compact: curto, mas mantendo o PLACAR_MAIS_PROVAVEL."
+)
+
+# muda sozinho quando as instruções mudam: invalida respostas reaproveitadas
+PROMPT_VERSION = hashlib.sha256(INSTRUCTIONS.encode("utf-8")).hexdigest()[:12]
+
+def _client() -> OpenAI:
     if not OPENAI_API_KEY:
         raise RuntimeError("OPENAI_API_KEY não definido.")
     os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
-    client = OpenAI()
+    # cliente httpx do POOL: keep-alive entre chamadas e gravação de cassete (app/cassette.py)
+    http_client = POOL.client("openai", base_url=OPENAI_BASE_URL, timeout=LLM.policy.timeout)
+    return OpenAI(base_url=OPENAI_BASE_URL, max_retries=0, timeout=LLM.policy.timeout, http_client=http_client)
 
-    instructions = (
-        "Você é um analista profissional de futebol.\n"
-        "Regra ABSOLUTA: use SOMENTE os dados do DOSSIÊ JSON. "
-        "Se algo não existir no dossiê, escreva 'DADO AUSENTE' e faça suposição conservadora.\n\n"
-        "Formato obrigatório:\n"
-        "1) Jogador por jogador (provável XI vs provável XI) por setores.\n"
-        "2) Por equipe (ataque/meio/defesa/bolas paradas/momento).\n"
-        "3) Time x time (roteiro + 3 chaves táticas).\n"
-        "4) Previsão com UM ÚNICO placar mais provável no final:\n"
-        "PLACAR_MAIS_PROVAVEL: TimeCasa X–Y TimeFora\n"
-        "Depois: Risco (2 bullets) e Confiança (0-100).\n\n"
-        "Se mode=compact: curto, mas mantendo o PLACAR_MAIS_PROVAVEL."
-    )
-
-    resp = client.responses.create(
+def _request(dossier: str, mode: str) -> dict:
+    # instruções fixas + dossiê antes do mode: prefixo estável pro cache de prompt do provedor
+    return dict(
         model=OPENAI_MODEL,
         reasoning={"effort": "medium"},
-        instructions=instructions,
+        instructions=INSTRUCTIONS,
         input=[{
             "role": "user",
-            "content": [{"type": "text", "text": f"mode={mode}\nDOSSIÊ JSON:\n{dossier}"}]
+            "content": [{"type": "text", "text": f"DOSSIÊ JSON:\n{dossier}\nmode={mode}"}]
         }]
     )
+
+def analyze_with_openai(dossier: str, mode: str = "full") -> str:
+    client = _client()
+    resp = LLM.call(lambda: client.responses.create(**_request(dossier, mode)))
     return resp.output_text
+
+def stream_with_openai(dossier: str, mode: str = "full") -> Iterator[str]:
+    """Mesma análise, devolvendo os pedaços de texto conforme o modelo gera."""
+    # retry só até abrir o stream: depois do 1º token não dá para repetir
+    client = _client()
+    stream = LLM.call(lambda: client.responses.create(stream=True, **_request(dossier, mode)))
+    try:
+        for event in stream:
+            if event.type == "response.output_text.delta":
+                yield event.delta
+            elif event.type in ("response.failed", "error"):
+                raise RuntimeError(f"OPENAI_STREAM_ERROR: {getattr(event, 'error', None) or getattr(event, 'message', '')}")
+    finally:
+        stream.close()
@@ -0,0 +1,280 @@
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .config import (
+    APIFOOTBALL_RATE_PER_MINUTE, APIFOOTBALL_BURST, APIFOOTBALL_DAILY_LIMIT,
+    APIFOOTBALL_QUOTA_RESERVE, APIFOOTBALL_QUEUE_MAX_WAIT,
+)
+from .resilience import TransientError
+
+# Agendador de cota da API-Football: toda chamada passa por QUOTA.acquire().
+#  - balde de tokens no ritmo por minuto do plano (config ou X-RateLimit-Limit)
+#  - cota diária lida dos cabeçalhos x-ratelimit-requests-*; classes de menor
+#    prioridade param antes, deixando uma reserva para as de cima
+#  - fila por prioridade: quem não tem token espera a vez em vez de tomar 429
+# A classe vem do client (AsyncAPIFootball(priority=...)) ou do contexto
+# (with priority(INGEST): ...), herdado pelas tasks asyncio criadas dentro dele.
+# O balde é por processo; os cabeçalhos (contadores globais do upstream)
+# corrigem o saldo de todos os workers.
+
+INTERACTIVE, PREFETCH, INGEST, BACKTEST = 0, 1, 2, 3
+CLASS_NAMES = {INTERACTIVE: "interactive", PREFETCH: "prefetch", INGEST: "ingest", BACKTEST: "backtest"}
+
+_current: ContextVar[int] = ContextVar("apifootball_priority", default=INTERACTIVE)
+
+_ASYNC_POLL = 0.05  # s entre checagens de quem espera na fila sem ser o primeiro
+
+
+class QuotaExceeded(TransientError):
+    """Sem cota agora (fila estourou, reserva diária, 429 repetido): passa com o tempo."""
+
+
+def current_priority() -> int:
+    return _current.get()
+
+
+@contextmanager
+def priority(cls: int) -> Iterator[None]:
+    token = _current.set(cls)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def _utc_day() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def _header_int(headers, name: str) -> Optional[int]:
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+class QuotaScheduler:
+    def __init__(self, per_minute: float = APIFOOTBALL_RATE_PER_MINUTE, burst: int = APIFOOTBALL_BURST,
+                 daily_limit: int = APIFOOTBALL_DAILY_LIMIT, reserve: float = APIFOOTBALL_QUOTA_RESERVE,
+                 max_wait: float = APIFOOTBALL_QUEUE_MAX_WAIT):
+        self._cond = threading.Condition()
+        self._configured_rate = float(per_minute)
+        self._burst = int(burst)
+        self.rate = float(per_minute)
+        self.capacity = float(burst or per_minute or 1)
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self._tokens = self.capacity
+        self._refilled = time.monotonic()
+        self._heap: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+
+        # cota diária: cabeçalho mais recente + o que saiu depois dele
+        self.day_limit: Optional[int] = daily_limit or None
+        self.day_remaining: Optional[int] = None
+        self.minute_limit: Optional[int] = None
+        self.minute_remaining: Optional[int] = None
+        self._since_header = 0
+        self._used_today = 0
+        self._day = _utc_day()
+        self.throttled = 0
+
+        self._stats = {c: {"granted": 0, "rejected": 0, "timeouts": 0, "wait_total": 0.0, "wait_max": 0.0}
+                       for c in CLASS_NAMES}
+
+    # ---------------- estado (sempre com self._cond) ----------------
+
+    def _refill(self, now: float) -> None:
+        if self.rate > 0:
+            self._tokens = min(self.capacity, self._tokens + (now - self._refilled) * self.rate / 60.0)
+        self._refilled = now
+
+    def _roll_day(self) -> None:
+        # a cota diária do plano zera à meia-noite UTC
+        day = _utc_day()
+        if day != self._day:
+            self._day = day
+            self._used_today = self._since_header = 0
+            self.day_remaining = None
+
+    def _day_left(self) -> Optional[int]:
+        self._roll_day()
+        if self.day_remaining is not None:
+            return self.day_remaining - self._since_header
+        if self.day_limit:
+            return self.day_limit - self._used_today
+        return None
+
+    def _reserve_for(self, cls: int) -> int:
+        # interactive usa tudo; cada classe abaixo deixa mais `reserve` da cota para as de cima
+        return int((self.day_limit or 0) * self.reserve * cls)
+
+    def _check_daily(self, cls: int) -> None:
+        left = self._day_left()
+        if left is not None and left <= self._reserve_for(cls):
+            self._stats[cls]["rejected"] += 1
+            raise QuotaExceeded(
+                f"APIFOOTBALL_QUOTA: cota diária ({left} restantes) reservada para classes acima de {CLASS_NAMES[cls]}"
+            )
+
+    def _grant(self, ticket: Tuple[int, int]) -> float:
+        """0 se o ticket levou um token; senão, segundos até valer a pena tentar de novo."""
+        if self._heap[0] != ticket:
+            return -1.0  # não é a vez dele: espera o da frente
+        self._check_daily(ticket[0])
+        self._refill(time.monotonic())
+        if self._tokens >= 1:
+            heapq.heappop(self._heap)
+            self._tokens -= 1
+            self._used_today += 1
+            self._since_header += 1
+            self._cond.notify_all()
+            return 0.0
+        return (1 - self._tokens) * 60.0 / self.rate if self.rate > 0 else self.max_wait
+
+    def _enqueue(self, cls: int) -> Tuple[int, int]:
+        self._check_daily(cls)
+        ticket = (cls, next(self._seq))
+        heapq.heappush(self._heap, ticket)
+        return ticket
+
+    def _drop(self, ticket: Tuple[int, int]) -> None:
+        try:
+            self._heap.remove(ticket)
+        except ValueError:
+            return
+        heapq.heapify(self._heap)
+        self._cond.notify_all()
+
+    def _timeout(self, ticket: Tuple[int, int], waited: float) -> QuotaExceeded:
+        self._stats[ticket[0]]["timeouts"] += 1
+        return QuotaExceeded(
+            f"APIFOOTBALL_QUOTA: {waited:.1f}s na fila ({CLASS_NAMES[ticket[0]]}) sem vaga no limite por minuto"
+        )
+
+    def _record(self, cls: int, waited: float) -> None:
+        with self._cond:
+            s = self._stats[cls]
+            s["granted"] += 1
+            s["wait_total"] += waited
+            s["wait_max"] = max(s["wait_max"], waited)
+
+    # ---------------- uso ----------------
+
+    def acquire(self, cls: Optional[int] = None) -> float:
+        """Bloqueia até haver token para a classe; devolve a espera (s)."""
+        cls = current_priority() if cls is None else cls
+        start = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue(cls)
+            try:
+                while True:
+                    wait = self._grant(ticket)
+                    if wait == 0:
+                        break
+                    waited = time.monotonic() - start
+                    if waited >= self.max_wait:
+                        raise self._timeout(ticket, waited)
+                    left = self.max_wait - waited
+                    self._cond.wait(left if wait < 0 else min(wait, left))
+            except BaseException:
+                self._drop(ticket)
+                raise
+        waited = time.monotonic() - start
+        self._record(cls, waited)
+        return waited
+
+    async def acquire_async(self, cls: Optional[int] = None) -> float:
+        """Igual a acquire, sem bloquear o event loop."""
+        cls = current_priority() if cls is None else cls
+        start = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue(cls)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._grant(ticket)
+                if wait == 0:
+                    break
+                waited = time.monotonic() - start
+                if waited >= self.max_wait:
+                    with self._cond:
+                        raise self._timeout(ticket, waited)
+                await asyncio.sleep(_ASYNC_POLL if wait < 0 else min(wait, self.max_wait - waited))
+        except BaseException:
+            with self._cond:
+                self._drop(ticket)
+            raise
+        waited = time.monotonic() - start
+        self._record(cls, waited)
+        return waited
+
+    def observe(self, headers) -> None:
+        """Atualiza limites/saldos com os cabeçalhos de uma resposta."""
+        day_limit = _header_int(headers, "x-ratelimit-requests-limit")
+        day_left = _header_int(headers, "x-ratelimit-requests-remaining")
+        minute_limit = _header_int(headers, "X-RateLimit-Limit")
+        minute_left = _header_int(headers, "X-RateLimit-Remaining")
+        with self._cond:
+            self._roll_day()
+            if day_limit:
+                self.day_limit = day_limit
+            if day_left is not None:
+                self.day_remaining = day_left
+                self._since_header = 0
+            if minute_limit:
+                # o plano manda: nunca acima do limite real, mesmo se a config for maior
+                self.minute_limit = minute_limit
+                self.rate = min(self._configured_rate, minute_limit) if self._configured_rate else float(minute_limit)
+                self.capacity = float(min(self._burst or self.rate, minute_limit))
+                self._tokens = min(self._tokens, self.capacity)
+            if minute_left is not None:
+                self.minute_remaining = minute_left
+                self._refill(time.monotonic())
+                self._tokens = min(self._tokens, float(minute_left))
+            self._cond.notify_all()
+
+    def throttle(self) -> None:
+        """O upstream recusou por limite (429/rateLimit): zera o balde."""
+        with self._cond:
+            self.throttled += 1
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            self._refill(time.monotonic())
+            queued = {name: 0 for name in CLASS_NAMES.values()}
+            for cls, _ in self._heap:
+                queued[CLASS_NAMES[cls]] += 1
+            classes = {}
+            for cls, s in self._stats.items():
+                classes[CLASS_NAMES[cls]] = {
+                    "granted": s["granted"],
+                    "rejected": s["rejected"],
+                    "timeouts": s["timeouts"],
+                    "wait_avg_ms": round(1000 * s["wait_total"] / s["granted"], 1) if s["granted"] else 0.0,
+                    "wait_max_ms": round(1000 * s["wait_max"], 1),
+                }
+            return {
+                "rate_per_minute": self.rate,
+                "tokens": round(self._tokens, 2),
+                "minute_limit": self.minute_limit,
+                "minute_remaining": self.minute_remaining,
+                "day_limit": self.day_limit,
+                "day_remaining": self._day_left(),
+                "throttled": self.throttled,
+                "queue_depth": len(self._heap),
+                "queued": queued,
+                "classes": classes,
+            }
+
+
+QUOTA = QuotaScheduler()
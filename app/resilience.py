@@ -0,0 +1,263 @@
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait as wait_futures
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional
+
+import httpx
+from openai import APIConnectionError, APIStatusError
+
+from .config import (
+    RESILIENCE_APIFOOTBALL, RESILIENCE_THEODDSAPI, RESILIENCE_OPENAI,
+    BREAKER_FAILURES, BREAKER_RESET_SECONDS,
+)
+
+# Camada comum de resiliência dos providers (API-Football, The Odds API, OpenAI):
+#  - timeout por provider (sobrepõe o do cliente do POOL)
+#  - retry com backoff exponencial limitado e jitter "full" (sorteio em [0, teto])
+#  - circuit breaker: após N falhas seguidas o provider fica aberto e falha na
+#    hora (CIRCUIT_OPEN); depois de BREAKER_RESET_SECONDS deixa passar uma
+#    chamada de teste (half-open). Quem tem cache serve a cópia velha.
+#  - hedge opcional: se a 1ª tentativa passar de hedge_ms, dispara uma 2ª igual
+#    e fica com a que responder primeiro (custa uma requisição a mais)
+# Só falha de infraestrutura conta (rede, timeout, 5xx, 429); 4xx e erro de
+# dado (RuntimeError dos providers) sobem direto, sem retry.
+# Erros "tente mais tarde" (breaker aberto, cota) são TransientError, fora da
+# árvore de RuntimeError: jobs os repetem com backoff em vez de falhar de vez.
+
+
+class Policy(NamedTuple):
+    attempts: int        # tentativas no total (1 = sem retry)
+    base: float          # s; espera máx. antes da 2ª tentativa
+    cap: float           # s; teto do backoff
+    timeout: float       # s por tentativa
+    hedge_ms: float = 0  # 0 = sem hedge
+
+
+def parse_policy(spec: str) -> Policy:
+    """'attempts,base,cap,timeout[,hedge_ms]' -> Policy"""
+    parts = [float(x) for x in spec.split(",")]
+    return Policy(int(parts[0]), *parts[1:5])
+
+
+POLICIES: Dict[str, Policy] = {
+    "apifootball": parse_policy(RESILIENCE_APIFOOTBALL),
+    "theoddsapi": parse_policy(RESILIENCE_THEODDSAPI),
+    "openai": parse_policy(RESILIENCE_OPENAI),
+}
+
+
+class TransientError(Exception):
+    """Falha passageira do provider: a mesma chamada deve dar certo mais tarde."""
+
+
+class CircuitOpen(TransientError):
+    pass
+
+
+def unavailable(exc: BaseException) -> bool:
+    """O provider está fora/lento (vale retry, conta no breaker, justifica servir cache velho)."""
+    if isinstance(exc, (CircuitOpen, httpx.TransportError, APIConnectionError)):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+    elif isinstance(exc, APIStatusError):
+        status = exc.status_code
+    else:
+        return False
+    return status >= 500 or status == 429
+
+
+def backoff(attempt: int, policy: Policy) -> float:
+    """Espera antes da tentativa attempt+1 (attempt começa em 0)."""
+    return random.uniform(0, min(policy.cap, policy.base * (2 ** attempt)))
+
+
+_hedge_pool: Optional[ThreadPoolExecutor] = None
+_hedge_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _hedge_pool
+    with _hedge_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+        return _hedge_pool
+
+
+class Provider:
+    def __init__(self, name: str, policy: Policy,
+                 failures: int = BREAKER_FAILURES, reset_after: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.policy = policy
+        self.failures = failures
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._stats = {"calls": 0, "retries": 0, "failures": 0, "rejected": 0, "opened": 0,
+                       "hedged": 0, "hedge_wins": 0, "stale_served": 0}
+
+    # ---------------- breaker ----------------
+
+    def _allow(self) -> bool:
+        """Libera a chamada (True se ela é o teste do half-open) ou levanta CircuitOpen."""
+        with self._lock:
+            self._stats["calls"] += 1
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_after:
+                self._state = "half_open"
+            if self._state == "closed":
+                return False
+            if self._state == "half_open" and not self._probing:
+                self._probing = True  # uma chamada de teste por vez
+                return True
+            self._stats["rejected"] += 1
+        raise CircuitOpen(f"CIRCUIT_OPEN: {self.name} indisponível, tentando de novo em até {self.reset_after:.0f}s")
+
+    def _success(self) -> None:
+        with self._lock:
+            self._state, self._consecutive, self._probing = "closed", 0, False
+
+    def _failure(self) -> None:
+        with self._lock:
+            self._stats["failures"] += 1
+            self._consecutive += 1
+            self._probing = False
+            if self._state == "half_open" or self._consecutive >= self.failures:
+                if self._state != "open":
+                    self._stats["opened"] += 1
+                self._state, self._opened_at = "open", time.monotonic()
+
+    def _abort_probe(self) -> None:
+        # teste interrompido (cancelado, KeyboardInterrupt): não diz nada sobre a
+        # saúde, mas libera a vaga e volta a open até o próximo teste
+        with self._lock:
+            self._probing = False
+            if self._state == "half_open":
+                self._state, self._opened_at = "open", time.monotonic()
+
+    def _settle(self, exc: BaseException) -> None:
+        # erro de dado/4xx: o provider respondeu, não é falha de saúde
+        if unavailable(exc):
+            self._failure()
+        else:
+            self._success()
+
+    def stale_served(self) -> None:
+        with self._lock:
+            self._stats["stale_served"] += 1
+
+    # ---------------- chamadas ----------------
+
+    def call(self, fn: Callable[[], Any], retry: bool = True) -> Any:
+        """fn() com breaker, retry (se idempotente) e hedge conforme a política."""
+        attempts = self.policy.attempts if retry else 1
+        for attempt in range(attempts):
+            probe = self._allow()
+            try:
+                result = self._hedged(fn) if self.policy.hedge_ms else fn()
+            except Exception as e:
+                self._settle(e)
+                if attempt + 1 >= attempts or not unavailable(e):
+                    raise
+                with self._lock:
+                    self._stats["retries"] += 1
+                time.sleep(backoff(attempt, self.policy))
+            except BaseException:
+                if probe:
+                    self._abort_probe()
+                raise
+            else:
+                self._success()
+                return result
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], retry: bool = True) -> Any:
+        """Igual a call, para coroutines (fn cria uma coroutine nova a cada tentativa)."""
+        attempts = self.policy.attempts if retry else 1
+        for attempt in range(attempts):
+            probe = self._allow()
+            try:
+                result = await (self._ahedged(fn) if self.policy.hedge_ms else fn())
+            except Exception as e:
+                self._settle(e)
+                if attempt + 1 >= attempts or not unavailable(e):
+                    raise
+                with self._lock:
+                    self._stats["retries"] += 1
+                await asyncio.sleep(backoff(attempt, self.policy))
+            except BaseException:
+                # CancelledError (lote cancelado) não é Exception: sem isso o teste ficava preso
+                if probe:
+                    self._abort_probe()
+                raise
+            else:
+                self._success()
+                return result
+
+    def _hedged(self, fn: Callable[[], Any]) -> Any:
+        pool = _executor()
+        # contexto copiado: a thread do hedge herda a classe de cota (app/quota.py)
+        first = pool.submit(contextvars.copy_context().run, fn)
+        done, _ = wait_futures([first], timeout=self.policy.hedge_ms / 1000)
+        if done:
+            return first.result()
+        with self._lock:
+            self._stats["hedged"] += 1
+        second = pool.submit(contextvars.copy_context().run, fn)
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait_futures(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    if f is second:
+                        with self._lock:
+                            self._stats["hedge_wins"] += 1
+                    return f.result()  # a outra termina sozinha e é descartada
+                error = f.exception()
+        raise error
+
+    async def _ahedged(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        first = asyncio.ensure_future(fn())
+        done, _ = await asyncio.wait({first}, timeout=self.policy.hedge_ms / 1000)
+        if done:
+            return first.result()
+        with self._lock:
+            self._stats["hedged"] += 1
+        second = asyncio.ensure_future(fn())
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        if t is second:
+                            with self._lock:
+                                self._stats["hedge_wins"] += 1
+                        return t.result()
+                    error = t.exception()
+            raise error
+        finally:
+            for t in pending:
+                t.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self._state, "consecutive_failures": self._consecutive,
+                    "policy": self.policy._asdict(), **self._stats}
+
+
+PROVIDERS: Dict[str, Provider] = {name: Provider(name, policy) for name, policy in POLICIES.items()}
+
+
+def provider(name: str) -> Provider:
+    return PROVIDERS[name]
+
+
+def resilience_stats() -> Dict[str, Any]:
+    return {name: p.stats() for name, p in PROVIDERS.items()}
@@ -0,0 +1,143 @@
+import re
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+# Agregados do dashboard mantidos pelo próprio SQLite:
+#  - predictions.pred_home_goals/pred_away_goals: placar previsto já separado
+#  - prediction_rollup: por (modelo, liga) quantas previsões, quantas com jogo
+#    encerrado, acertos de placar/resultado e soma das confianças
+#  - data_version: contador que sobe a cada escrita relevante (cache do dashboard)
+# Triggers aplicam deltas: INSERT em predictions soma a contribuição; mudança de
+# status/placar/liga em matches tira a contribuição antiga e soma a nova.
+
+SCORE_RE = re.compile(r"(\d+)\s*[–-]\s*(\d+)")
+FINISHED = ("FT", "AET", "PEN")
+DASHBOARD = "dashboard"
+
+
+def score_goals(scoreline: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    m = SCORE_RE.search(scoreline or "")
+    return (int(m.group(1)), int(m.group(2))) if m else (None, None)
+
+
+def _terms(p: str, m: str) -> List[str]:
+    """Colunas finished, exact, outcome_hits, confidence_sum de uma previsão p contra o jogo m."""
+    finished = (f"{m}.status IN {FINISHED} AND {m}.home_goals IS NOT NULL AND {m}.away_goals IS NOT NULL "
+                f"AND {p}.pred_home_goals IS NOT NULL")
+    sign_pred = f"(({p}.pred_home_goals > {p}.pred_away_goals) - ({p}.pred_home_goals < {p}.pred_away_goals))"
+    sign_real = f"(({m}.home_goals > {m}.away_goals) - ({m}.home_goals < {m}.away_goals))"
+    return [
+        f"CASE WHEN {finished} THEN 1 ELSE 0 END",
+        f"CASE WHEN {finished} AND {p}.pred_home_goals = {m}.home_goals "
+        f"AND {p}.pred_away_goals = {m}.away_goals THEN 1 ELSE 0 END",
+        f"CASE WHEN {finished} AND {sign_pred} = {sign_real} THEN 1 ELSE 0 END",
+        f"CASE WHEN {finished} THEN COALESCE({p}.confidence, 0) ELSE 0 END",
+    ]
+
+
+_COLS = "model, league_id, predictions, finished, exact, outcome_hits, confidence_sum"
+
+_ON_CONFLICT = """
+ON CONFLICT(model, league_id) DO UPDATE SET
+  predictions=predictions+excluded.predictions,
+  finished=finished+excluded.finished,
+  exact=exact+excluded.exact,
+  outcome_hits=outcome_hits+excluded.outcome_hits,
+  confidence_sum=confidence_sum+excluded.confidence_sum
+"""
+
+_BUMP = f"UPDATE data_version SET version=version+1 WHERE k='{DASHBOARD}';"
+
+
+def _grouped_delta(m: str, sign: str) -> str:
+    # contribuição de todas as previsões do jogo m (OLD/NEW), por modelo
+    sums = ", ".join(f"{sign}SUM({t})" for t in _terms("p", m))
+    return f"""
+    INSERT INTO prediction_rollup({_COLS})
+    SELECT COALESCE(p.model, 'openai'), COALESCE({m}.league_id, 0), {sign}COUNT(*), {sums}
+    FROM predictions p WHERE p.fixture_id = {m}.fixture_id
+    GROUP BY 1, 2
+    {_ON_CONFLICT};
+    """
+
+
+TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_predictions_rollup AFTER INSERT ON predictions
+    BEGIN
+      INSERT INTO prediction_rollup({_COLS})
+      SELECT COALESCE(NEW.model, 'openai'), COALESCE(m.league_id, 0), 1, {", ".join(_terms("NEW", "m"))}
+      FROM (SELECT 1) LEFT JOIN matches m ON m.fixture_id = NEW.fixture_id
+      WHERE true
+      {_ON_CONFLICT};
+      {_BUMP}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_matches_rollup AFTER UPDATE OF status, home_goals, away_goals, league_id ON matches
+    WHEN OLD.status IS NOT NEW.status OR OLD.home_goals IS NOT NEW.home_goals
+      OR OLD.away_goals IS NOT NEW.away_goals OR OLD.league_id IS NOT NEW.league_id
+    BEGIN
+      {_grouped_delta("OLD", "-")}
+      {_grouped_delta("NEW", "")}
+      {_BUMP}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_matches_insert_rollup AFTER INSERT ON matches
+    BEGIN
+      -- previsões gravadas antes do jogo existir estavam em league_id 0, sem resultado
+      INSERT INTO prediction_rollup({_COLS})
+      SELECT COALESCE(p.model, 'openai'), 0, -COUNT(*), 0, 0, 0, 0
+      FROM predictions p WHERE p.fixture_id = NEW.fixture_id
+      GROUP BY 1
+      {_ON_CONFLICT};
+      {_grouped_delta("NEW", "")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_backtest_runs_insert AFTER INSERT ON backtest_runs
+    BEGIN {_BUMP} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_backtest_runs_status AFTER UPDATE OF status ON backtest_runs
+    WHEN OLD.status IS NOT NEW.status
+    BEGIN {_BUMP} END
+    """,
+]
+
+
+def backfill_pred_goals(c: sqlite3.Connection, batch: int = 5000) -> None:
+    last = 0
+    while True:
+        rows = c.execute("SELECT id, scoreline FROM predictions WHERE id > ? ORDER BY id LIMIT ?",
+                         (last, batch)).fetchall()
+        if not rows:
+            return
+        c.executemany("UPDATE predictions SET pred_home_goals=?, pred_away_goals=? WHERE id=?",
+                      [(*score_goals(r["scoreline"]), r["id"]) for r in rows])
+        last = rows[-1]["id"]
+
+
+def rebuild(c: sqlite3.Connection) -> None:
+    """Recalcula o rollup do zero (migração ou conferência)."""
+    sums = ", ".join(f"SUM({t})" for t in _terms("p", "m"))
+    c.execute("DELETE FROM prediction_rollup")
+    c.execute(f"""
+      INSERT INTO prediction_rollup({_COLS})
+      SELECT COALESCE(p.model, 'openai'), COALESCE(m.league_id, 0), COUNT(*), {sums}
+      FROM predictions p LEFT JOIN matches m ON m.fixture_id = p.fixture_id
+      GROUP BY 1, 2
+    """)
+    c.execute(_BUMP)
+
+
+def data_version(c: sqlite3.Connection) -> int:
+    row = c.execute("SELECT version FROM data_version WHERE k=?", (DASHBOARD,)).fetchone()
+    return row[0] if row else 0
+
+
+def read_rollup(c: sqlite3.Connection) -> List[Dict[str, Any]]:
+    # linhas zeradas (previsões que mudaram de liga) ficam na tabela; não aparecem
+    rows = c.execute(f"SELECT {_COLS} FROM prediction_rollup WHERE predictions > 0 ORDER BY model, league_id").fetchall()
+    return [dict(r) for r in rows]
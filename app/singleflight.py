@@ -0,0 +1,120 @@
+import os
+import time
+import uuid
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from .cache import cache_get, cache_set
+from .config import SINGLEFLIGHT_LEASE_SECONDS, SINGLEFLIGHT_POLL_SECONDS
+from .db import reader, transaction
+
+# Coalescência de chamadas idênticas e simultâneas (ex.: /predict do mesmo jogo).
+#  - dentro do processo: threads com a mesma chave esperam a primeira (Event)
+#  - entre workers: lease na tabela `leases`; quem não tem o lease espera o
+#    resultado que o dono publica no cache com a chave do lease.
+
+RESULT_TTL = 120  # só precisa durar até os seguidores lerem
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+def _result_key(key: str, owner: str) -> str:
+    return f"sf | {key} | {owner}"
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.stats = {"leader": 0, "follower": 0, "remote_follower": 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.stats["follower"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_across_workers(key, fn)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    # ---------------- lease entre processos ----------------
+
+    def _acquire(self, key: str, owner: str) -> Optional[str]:
+        """Tenta pegar o lease. Devolve o dono atual (== owner se conseguiu)."""
+        now = time.time()
+        with transaction() as c:
+            c.execute("""
+            INSERT INTO leases(k, owner, expires_at) VALUES(?,?,?)
+            ON CONFLICT(k) DO UPDATE SET owner=excluded.owner, expires_at=excluded.expires_at
+            WHERE leases.expires_at < ?
+            """, (key, owner, now + SINGLEFLIGHT_LEASE_SECONDS, now))
+            row = c.execute("SELECT owner FROM leases WHERE k=?", (key,)).fetchone()
+        return row["owner"] if row else None
+
+    def _release(self, key: str, owner: str) -> None:
+        with transaction() as c:
+            c.execute("DELETE FROM leases WHERE k=? AND owner=?", (key, owner))
+
+    def _lease_owner(self, key: str) -> Optional[str]:
+        with reader() as c:
+            row = c.execute("SELECT owner FROM leases WHERE k=? AND expires_at >= ?", (key, time.time())).fetchone()
+        return row["owner"] if row else None
+
+    def _do_across_workers(self, key: str, fn: Callable[[], Any]) -> Any:
+        me = f"{os.getpid()}:{uuid.uuid4().hex}"
+        while True:
+            owner = self._acquire(key, me)
+            if owner == me:
+                break
+
+            # outro worker está calculando: espera o resultado dele
+            self.stats["remote_follower"] += 1
+            while True:
+                # lê o lease antes do resultado: o dono publica e só depois solta
+                still_owner = self._lease_owner(key) == owner
+                published = cache_get(_result_key(key, owner))
+                if published is not None:
+                    if "error" in published:
+                        raise RuntimeError(published["error"])
+                    return published["result"]
+                if not still_owner:
+                    break  # dono morreu/expirou sem publicar: tenta virar dono
+                time.sleep(SINGLEFLIGHT_POLL_SECONDS)
+
+        self.stats["leader"] += 1
+        try:
+            result = fn()
+        except Exception as e:
+            cache_set(_result_key(key, me), {"error": str(e)}, RESULT_TTL)
+            raise
+        else:
+            cache_set(_result_key(key, me), {"result": result}, RESULT_TTL)
+            return result
+        finally:
+            self._release(key, me)
+
+
+SF = SingleFlight()
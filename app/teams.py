@@ -0,0 +1,172 @@
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from .config import TEAM_FUZZY_MIN_SCORE
+from .db import reader, transaction
+
+# Catálogo local de times (tabelas teams/team_aliases) + matcher fuzzy em memória.
+# Só nome exato ou apelido resolve sem rede; o resto passa por /teams?search=, que
+# alimenta o catálogo e grava o nome pedido como apelido do time escolhido.
+# O fuzzy não decide sozinho ("Sporting CP" x "Sporting KC" = 0.75): só sugere
+# um nome quando a busca não acha nada.
+
+_PUNCT = re.compile(r"[^a-z0-9 ]+")
+_SPACES = re.compile(r"\s+")
+
+
+def fold(name: str) -> str:
+    """'Grêmio FBPA' -> 'gremio fbpa' (sem acento, minúsculo, sem pontuação)."""
+    s = unicodedata.normalize("NFKD", name or "")
+    s = "".join(ch for ch in s if not unicodedata.combining(ch)).lower()
+    s = _PUNCT.sub(" ", s)
+    return _SPACES.sub(" ", s).strip()
+
+
+def ngrams(folded: str, n: int = 3) -> Set[str]:
+    s = f"  {folded} "
+    return {s[i:i + n] for i in range(len(s) - n + 1)}
+
+
+def similarity(a: str, b: str) -> float:
+    """Dice sobre trigramas de dois nomes já normalizados (0..1)."""
+    ga, gb = ngrams(a), ngrams(b)
+    if not ga or not gb:
+        return 0.0
+    return 2 * len(ga & gb) / (len(ga) + len(gb))
+
+
+def _team_dict(api_item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # aceita item de /teams ({"team": {...}}) ou time de /fixtures ({"id","name",...})
+    t = api_item.get("team") or api_item
+    if not t.get("id") or not t.get("name"):
+        return None
+    return {
+        "id": t["id"],
+        "name": t["name"],
+        "code": t.get("code"),
+        "country": t.get("country"),
+        "logo": t.get("logo"),
+    }
+
+
+class TeamCatalog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.by_id: Dict[int, Dict[str, Any]] = {}
+        self.exact: Dict[str, int] = {}                 # nome/apelido normalizado -> id
+        self.grams: Dict[str, Set[int]] = defaultdict(set)
+
+    def _index(self, team: Dict[str, Any]) -> None:
+        self.by_id[team["id"]] = team
+        f = fold(team["name"])
+        self.exact.setdefault(f, team["id"])
+        for g in ngrams(f):
+            self.grams[g].add(team["id"])
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        with reader() as c:
+            for r in c.execute("SELECT id, name, code, country, logo FROM teams").fetchall():
+                self._index(dict(r))
+            for r in c.execute("SELECT alias, team_id FROM team_aliases").fetchall():
+                self.exact[r["alias"]] = r["team_id"]
+        self._loaded = True
+
+    def add(self, items: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        teams = [t for t in map(_team_dict, items) if t]
+        if not teams:
+            return []
+        now = datetime.utcnow().isoformat()
+        with transaction() as c:
+            c.executemany("""
+            INSERT INTO teams(id, name, folded, code, country, logo, updated_at_iso)
+            VALUES(?,?,?,?,?,?,?)
+            ON CONFLICT(id) DO UPDATE SET
+              name=excluded.name,
+              folded=excluded.folded,
+              code=COALESCE(excluded.code, teams.code),
+              country=COALESCE(excluded.country, teams.country),
+              logo=COALESCE(excluded.logo, teams.logo),
+              updated_at_iso=excluded.updated_at_iso
+            """, [(t["id"], t["name"], fold(t["name"]), t["code"], t["country"], t["logo"], now) for t in teams])
+        with self._lock:
+            self._load()
+            for t in teams:
+                old = self.by_id.get(t["id"]) or {}
+                self._index({k: (v if v is not None else old.get(k)) for k, v in t.items()})
+        return teams
+
+    def add_alias(self, alias: str, team_id: int) -> None:
+        a = fold(alias)
+        if not a:
+            return
+        with transaction() as c:
+            c.execute("INSERT OR REPLACE INTO team_aliases(alias, team_id) VALUES(?,?)", (a, team_id))
+        with self._lock:
+            self.exact[a] = team_id
+
+    def match(self, name: str, fuzzy: bool = False) -> Optional[Dict[str, Any]]:
+        """Nome exato/apelido; com fuzzy, senão o mais parecido acima de TEAM_FUZZY_MIN_SCORE."""
+        q = fold(name)
+        if not q:
+            return None
+        with self._lock:
+            self._load()
+            tid = self.exact.get(q)
+            if tid is not None and tid in self.by_id:
+                return self.by_id[tid]
+            if not fuzzy:
+                return None
+
+            counts: Dict[int, int] = defaultdict(int)
+            for g in ngrams(q):
+                for tid in self.grams.get(g, ()):
+                    counts[tid] += 1
+            best, best_score = None, 0.0
+            # só os candidatos com mais trigramas em comum
+            for tid, _ in sorted(counts.items(), key=lambda kv: -kv[1])[:20]:
+                score = similarity(q, fold(self.by_id[tid]["name"]))
+                if score > best_score:
+                    best, best_score = self.by_id[tid], score
+            return best if best_score >= TEAM_FUZZY_MIN_SCORE else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._load()
+            return {"teams": len(self.by_id), "keys": len(self.exact)}
+
+
+TEAMS = TeamCatalog()
+
+
+def _best_of(name: str, found: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # em vez de resp[0] às cegas: o resultado com nome mais parecido com o pedido
+    q = fold(name)
+    return max(found, key=lambda t: similarity(q, fold(t["name"])))
+
+
+def _pick(name: str, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    found = TEAMS.add(items)
+    if not found:
+        guess = TEAMS.match(name, fuzzy=True)
+        hint = f" (quis dizer {guess['name']}?)" if guess else ""
+        raise RuntimeError(f"Time não encontrado na API-Football: {name}{hint}")
+    team = _best_of(name, found)
+    TEAMS.add_alias(name, team["id"])
+    return team
+
+
+def resolve_team(api, name: str) -> Dict[str, Any]:
+    """Catálogo local (exato/apelido); na falta, /teams?search= (APIFootball síncrono)."""
+    return TEAMS.match(name) or _pick(name, api.teams_search(name))
+
+
+async def resolve_team_async(api, name: str) -> Dict[str, Any]:
+    """Igual a resolve_team, com AsyncAPIFootball."""
+    return TEAMS.match(name) or _pick(name, await api.teams_search(name))
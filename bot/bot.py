@@ -1,5 +1,6 @@
 import os
 import re
+import asyncio
 import json
 import base64
 import logging
@@ -29,11 +30,13 @@ log = logging.getLogger("matchlab-bot")
 APP_TZ = os.getenv("APP_TZ", "America/Sao_Paulo")
 TZ = ZoneInfo(APP_TZ)
 
-APIFOOTBALL_KEY = os.getenv("APIFOOTBALL_KEY")
-APIFOOTBALL_BASE_URL = os.getenv("APIFOOTBALL_BASE_URL", "https://v3.football.api-sports.io")
-
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 API_BASE = os.getenv("MATCHLAB_API_BASE", "http://api:8000")
+STREAM = os.getenv("MATCHLAB_BOT_STREAM", "1") == "1"
+EDIT_INTERVAL_SECONDS = float(os.getenv("MATCHLAB_EDIT_INTERVAL_SECONDS", "1.5"))
+CHUNK_SIZE = 3800
+JOB_POLL_SECONDS = float(os.getenv("MATCHLAB_JOB_POLL_SECONDS", "2"))
+JOB_WAIT_SECONDS = float(os.getenv("MATCHLAB_JOB_WAIT_SECONDS", "600"))
 
 ASK_INPUT = 1
 
@@ -44,7 +47,7 @@ TEXT_RX = re.compile(
 def now_sp() -> datetime:
     return datetime.now(TZ)
 
-def split_telegram(text: str, chunk_size: int = 3800):
+def split_telegram(text: str, chunk_size: int = CHUNK_SIZE):
     text = text or ""
     for i in range(0, len(text), chunk_size):
         yield text[i:i + chunk_size]
@@ -60,18 +63,12 @@ def parse_text_input(text: str) -> Optional[Tuple[str, str, datetime]]:
     kickoff = datetime.strptime(f"{dmy} {hm}", "%d/%m/%Y %H:%M").replace(tzinfo=TZ)
     return home, away, kickoff
 
-async def apifootball_team_exists(team_name: str) -> bool:
-    if not APIFOOTBALL_KEY:
-        raise RuntimeError("APIFOOTBALL_KEY não definido no ambiente (.env).")
-    async with httpx.AsyncClient(
-        timeout=20.0,
-        base_url=APIFOOTBALL_BASE_URL,
-        headers={"x-apisports-key": APIFOOTBALL_KEY, "Accept": "application/json"},
-    ) as c:
-        r = await c.get("/teams", params={"search": team_name})
+async def team_exists(team_name: str) -> bool:
+    # resolve pelo catálogo de times da API MatchLab (sem ir à API-Football se já conhecido)
+    async with httpx.AsyncClient(timeout=20.0) as c:
+        r = await c.get(f"{API_BASE}/teams/resolve", params={"name": team_name})
         r.raise_for_status()
-        data = r.json()
-        return bool(data.get("response"))
+        return bool(r.json().get("found"))
 
 def _season_for_free_plan(year: int) -> int:
     # plano free costuma aceitar 2021-2023
@@ -81,8 +78,8 @@ def _season_for_free_plan(year: int) -> int:
         return 2021
     return year
 
-async def call_predict_api(home: str, away: str, kickoff_sp: datetime) -> Dict[str, Any]:
-    payload = {
+def _predict_payload(home: str, away: str, kickoff_sp: datetime) -> Dict[str, Any]:
+    return {
         "home": home,
         "away": away,
         "kickoff": kickoff_sp.strftime("%Y-%m-%d %H:%M"),
@@ -94,11 +91,141 @@ async def call_predict_api(home: str, away: str, kickoff_sp: datetime) -> Dict[s
         "h2h_n": 10,
         "mode": "full",
     }
-    async with httpx.AsyncClient(timeout=120.0) as c:
-        r = await c.post(f"{API_BASE}/predict", json=payload)
+
+async def call_predict_api(home: str, away: str, kickoff_sp: datetime) -> Dict[str, Any]:
+    payload = _predict_payload(home, away, kickoff_sp)
+    # job assíncrono: a API responde na hora com o id e o bot acompanha o andamento
+    async with httpx.AsyncClient(timeout=20.0) as c:
+        r = await c.post(f"{API_BASE}/jobs/predict", json=payload)
         if r.status_code != 200:
             return {"error": f"HTTP {r.status_code}", "raw": r.text}
-        return r.json()
+        job_id = r.json()["job_id"]
+
+        deadline = asyncio.get_running_loop().time() + JOB_WAIT_SECONDS
+        while asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            r = await c.get(f"{API_BASE}/jobs/{job_id}")
+            if r.status_code != 200:
+                return {"error": f"HTTP {r.status_code}", "raw": r.text}
+            job = r.json()
+            if job["status"] == "done":
+                return job["result"]
+            if job["status"] == "failed":
+                return {"error": "JOB_FAILED", "raw": job.get("error") or ""}
+        return {"error": "TIMEOUT", "raw": f"job {job_id} ainda em andamento"}
+
+async def stream_predict_api(home: str, away: str, kickoff_sp: datetime):
+    """Gera (evento, dados) do SSE de /predict/stream."""
+    payload = _predict_payload(home, away, kickoff_sp)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(20.0, read=None)) as c:
+        async with c.stream("POST", f"{API_BASE}/predict/stream", json=payload) as r:
+            if r.status_code != 200:
+                yield "unavailable", {"error": f"HTTP {r.status_code}"}
+                return
+            event = "message"
+            async for line in r.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    yield event, json.loads(line[5:].strip())
+                    event = "message"
+
+class ProgressiveReply:
+    """
+    Mostra o texto conforme chega editando a mensagem, no máx. uma edição a cada
+    EDIT_INTERVAL_SECONDS (limite do Telegram). Passou de CHUNK_SIZE: fecha a
+    mensagem atual e continua numa nova. O texto só avança depois que o pedaço
+    fechado aparece na tela (edição ou, se o Telegram recusar, mensagem nova).
+    """
+
+    def __init__(self, message):
+        self.message = message
+        self.text = ""
+        self.shown = ""
+        self.last_edit = 0.0
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    async def _edit(self, text: str) -> bool:
+        if not text or text == self.shown:
+            return True
+        try:
+            await self.message.edit_text(text)
+            self.shown = text
+            return True
+        except Exception as e:  # ex.: flood control, rede
+            if "not modified" in str(e).lower():
+                self.shown = text
+                return True
+            log.warning("Falha ao editar mensagem: %s", e)
+            return False
+        finally:
+            self.last_edit = self._now()
+
+    async def _show(self, text: str):
+        """Garante o texto na tela: edita no ritmo do intervalo; recusou duas vezes, manda numa mensagem nova."""
+        for _ in range(2):
+            delay = self.last_edit + EDIT_INTERVAL_SECONDS - self._now()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if await self._edit(text):
+                return
+        self.message = await self.message.reply_text(text)
+        self.shown = text
+        self.last_edit = self._now()
+
+    async def add(self, delta: str):
+        self.text += delta
+        while len(self.text) > CHUNK_SIZE:
+            await self._show(self.text[:CHUNK_SIZE])
+            self.text = self.text[CHUNK_SIZE:]
+            self.message = await self.message.reply_text(self.text[:CHUNK_SIZE] or "…")
+            self.shown = self.text[:CHUNK_SIZE]
+            self.last_edit = self._now()
+        if self._now() - self.last_edit >= EDIT_INTERVAL_SECONDS:
+            await self._edit(self.text)
+
+    async def finish(self):
+        await self._show(self.text)
+
+async def reply_prediction(update: Update, status_text: str, home: str, away: str, kickoff: datetime):
+    msg = await update.message.reply_text(status_text)
+
+    if STREAM:
+        out = ProgressiveReply(msg)
+        got_tokens = False
+        try:
+            async for event, data in stream_predict_api(home, away, kickoff):
+                if event == "token":
+                    got_tokens = True
+                    await out.add(data.get("text", ""))
+                elif event == "done":
+                    await out.finish()
+                    return
+                elif event == "error":
+                    if got_tokens:
+                        await out.finish()
+                    await update.message.reply_text(f"Erro na API: {data.get('error')}")
+                    return
+                elif event == "unavailable":
+                    break
+        except httpx.HTTPError as e:
+            log.warning("Stream de previsão falhou: %s", e)
+        if got_tokens:
+            await out.finish()
+            await update.message.reply_text("Conexão interrompida; o texto acima pode estar incompleto.")
+            return
+        # stream indisponível antes do primeiro token: segue pelo job
+
+    result = await call_predict_api(home, away, kickoff)
+    if result.get("error"):
+        await update.message.reply_text(f"Erro na API: {result.get('error')}\n{result.get('raw','')}")
+        return
+
+    report = result.get("report") or json.dumps(result, ensure_ascii=False, indent=2)
+    for part in split_telegram(report):
+        await update.message.reply_text(part)
 
 def extract_json_safely(s: str) -> Optional[dict]:
     s = (s or "").strip()
@@ -189,23 +316,14 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Esse horário já passou (fuso São Paulo).")
         return ConversationHandler.END
 
-    if not await apifootball_team_exists(home):
+    if not await team_exists(home):
         await update.message.reply_text(f"Time não encontrado: {home}")
         return ConversationHandler.END
-    if not await apifootball_team_exists(away):
+    if not await team_exists(away):
         await update.message.reply_text(f"Time não encontrado: {away}")
         return ConversationHandler.END
 
-    await update.message.reply_text("Analisando…")
-    result = await call_predict_api(home, away, kickoff)
-    if result.get("error"):
-        await update.message.reply_text(f"Erro na API: {result.get('error')}\n{result.get('raw','')}")
-        return ConversationHandler.END
-
-    report = result.get("report") or json.dumps(result, ensure_ascii=False, indent=2)
-    for part in split_telegram(report):
-        await update.message.reply_text(part)
-
+    await reply_prediction(update, "Analisando…", home, away, kickoff)
     return ConversationHandler.END
 
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -226,23 +344,14 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Esse horário já passou (fuso São Paulo).")
         return ConversationHandler.END
 
-    if not await apifootball_team_exists(home):
+    if not await team_exists(home):
         await update.message.reply_text(f"Time não encontrado: {home}")
         return ConversationHandler.END
-    if not await apifootball_team_exists(away):
+    if not await team_exists(away):
         await update.message.reply_text(f"Time não encontrado: {away}")
         return ConversationHandler.END
 
-    await update.message.reply_text(f"Entendi: {home} x {away} — {hm} — {dmy}\nAnalisando…")
-    result = await call_predict_api(home, away, kickoff)
-    if result.get("error"):
-        await update.message.reply_text(f"Erro na API: {result.get('error')}\n{result.get('raw','')}")
-        return ConversationHandler.END
-
-    report = result.get("report") or json.dumps(result, ensure_ascii=False, indent=2)
-    for part in split_telegram(report):
-        await update.message.reply_text(part)
-
+    await reply_prediction(update, f"Entendi: {home} x {away} — {hm} — {dmy}\nAnalisando…", home, away, kickoff)
     return ConversationHandler.END
 
 async def cmd_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
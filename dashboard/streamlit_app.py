@@ -1,78 +1,109 @@
-import os
-import json
 import pandas as pd
 import streamlit as st
-from datetime import date, timedelta
 
-from app.config import DB_PATH
-from app.db import conn, init_db
+from app.db import reader, init_db
+from app.rollup import data_version, read_rollup
 
 st.set_page_config(page_title="MatchLab Dashboard", layout="wide")
-init_db()
+
+
+@st.cache_resource
+def _migrate():
+    init_db()
+    return True
+
+
+_migrate()
 
 st.title("MatchLab — Predictions & Backtest")
 
+# Tudo que vem do banco é cacheado por data_version: a versão sobe (trigger) a
+# cada previsão gravada, resultado ingerido ou backtest que muda de status.
+# Interação com widget sem escrita nova = nenhuma consulta pesada.
+
+def _version() -> int:
+    with reader() as c:
+        return data_version(c)
+
+
+@st.cache_data(show_spinner=False)
+def load_rollup(version: int) -> pd.DataFrame:
+    with reader() as c:
+        return pd.DataFrame(read_rollup(c))
+
+
+@st.cache_data(show_spinner=False)
+def load_page(version: int, page: int, page_size: int, model: str) -> pd.DataFrame:
+    where, params = ("WHERE p.model = ?", [model]) if model != "todos" else ("", [])
+    with reader() as c:
+        return pd.read_sql_query(f"""
+          SELECT p.id, p.fixture_id, p.created_at_iso, p.model, p.scoreline, p.confidence,
+                 m.kickoff_iso, m.home_name, m.away_name, m.home_goals, m.away_goals
+          FROM predictions p
+          LEFT JOIN matches m ON m.fixture_id = p.fixture_id
+          {where}
+          ORDER BY p.id DESC
+          LIMIT ? OFFSET ?
+        """, c, params=params + [page_size, (page - 1) * page_size])
+
+
+@st.cache_data(show_spinner=False)
+def load_backtests(version: int) -> pd.DataFrame:
+    # métricas principais extraídas no SQL; o JSON completo fica no banco
+    with reader() as c:
+        return pd.read_sql_query("""
+          SELECT id, created_at_iso, league_id, season, from_date, to_date, model, status, progress,
+                 json_extract(metrics_json, '$.n') AS n,
+                 json_extract(metrics_json, '$.outcome_accuracy') AS outcome_accuracy,
+                 json_extract(metrics_json, '$.exact_score_accuracy') AS exact_score_accuracy,
+                 json_extract(metrics_json, '$.brier') AS brier,
+                 json_extract(metrics_json, '$.log_loss') AS log_loss
+          FROM backtest_runs ORDER BY id DESC LIMIT 20
+        """, c)
+
+
+version = _version()
+rollup = load_rollup(version)
+
 st.sidebar.header("Filtros")
-limit = st.sidebar.slider("Últimas previsões", 10, 200, 50)
-
-c = conn()
-preds = pd.read_sql_query("""
-  SELECT p.id, p.fixture_id, p.created_at_iso, p.scoreline, p.confidence,
-         m.kickoff_iso, m.home_name, m.away_name, m.home_goals, m.away_goals
-  FROM predictions p
-  LEFT JOIN matches m ON m.fixture_id = p.fixture_id
-  ORDER BY p.id DESC
-  LIMIT ?
-""", c, params=(limit,))
-bt = pd.read_sql_query("SELECT * FROM backtest_runs ORDER BY id DESC LIMIT 20", c)
-c.close()
+models = ["todos"] + (sorted(rollup["model"].unique()) if not rollup.empty else [])
+model = st.sidebar.selectbox("Modelo", models)
+page_size = st.sidebar.selectbox("Previsões por página", [25, 50, 100, 200], index=1)
+
+view = rollup if model == "todos" or rollup.empty else rollup[rollup["model"] == model]
+total_preds = int(view["predictions"].sum()) if not view.empty else 0
+pages = max(1, -(-total_preds // page_size))
+page = st.sidebar.number_input(f"Página (de {pages})", min_value=1, max_value=pages, value=1, step=1)
 
 col1, col2 = st.columns(2)
 with col1:
-    st.subheader("Últimas previsões")
-    st.dataframe(preds, use_container_width=True)
+    st.subheader(f"Previsões ({total_preds})")
+    st.dataframe(load_page(version, int(page), page_size, model), use_container_width=True)
 
 with col2:
     st.subheader("Backtests recentes")
+    bt = load_backtests(version)
     if not bt.empty:
-        bt2 = bt.copy()
-        bt2["metrics_json"] = bt2["metrics_json"].apply(lambda x: json.loads(x) if isinstance(x, str) else x)
-        st.dataframe(bt2[["created_at_iso","league_id","season","from_date","to_date","metrics_json"]], use_container_width=True)
+        st.dataframe(bt, use_container_width=True)
     else:
         st.info("Nenhum backtest rodado ainda.")
 
 st.divider()
-st.subheader("Métricas rápidas (em cima das previsões carregadas)")
+st.subheader("Métricas (todas as previsões com jogo encerrado)")
 
-def parse_score(s):
-    import re
-    m = re.search(r"(\d+)\s*[–-]\s*(\d+)", str(s))
-    if not m: return None
-    return int(m.group(1)), int(m.group(2))
-
-finished = preds.dropna(subset=["home_goals","away_goals"])
-finished = finished[finished["home_goals"].apply(lambda x: isinstance(x, (int, float)))]
-
-if finished.empty:
-    st.warning("Sem resultados finais gravados no DB. (Você ainda não está atualizando placar final no matches.)")
+finished = int(view["finished"].sum()) if not view.empty else 0
+if not finished:
+    st.warning("Sem resultados finais gravados no DB. Configure TRACKED_LEAGUES (ingestão agendada) ou rode POST /ingest/run.")
 else:
-
-    ok = 0
-    exact = 0
-    total = 0
-    for _, r in finished.iterrows():
-        ps = parse_score(r["scoreline"])
-        if not ps: 
-            continue
-        ph, pa = ps
-        hg, ag = int(r["home_goals"]), int(r["away_goals"])
-        total += 1
-        if ph == hg and pa == ag: exact += 1
-        real = 0 if hg==ag else (1 if hg>ag else -1)
-        pred = 0 if ph==pa else (1 if ph>pa else -1)
-        if real == pred: ok += 1
-
     c1, c2, c3 = st.columns(3)
-    c1.metric("Jogos finalizados analisáveis", total)
-    c2.metric("Acerto resultado (W/D/L)", f"{(ok/total)*100:.1f}%")
-    c3.metric("Acerto placar exato", f"{(exact/total)*100:.1f}%")
+    c1.metric("Jogos finalizados analisáveis", finished)
+    c2.metric("Acerto resultado (W/D/L)", f"{view['outcome_hits'].sum() / finished * 100:.1f}%")
+    c3.metric("Acerto placar exato", f"{view['exact'].sum() / finished * 100:.1f}%")
+
+    by = view.groupby(["model", "league_id"], as_index=False)[["finished", "exact", "outcome_hits", "confidence_sum"]].sum()
+    by = by[by["finished"] > 0]
+    by["outcome_accuracy"] = by["outcome_hits"] / by["finished"]
+    by["exact_accuracy"] = by["exact"] / by["finished"]
+    by["mean_confidence"] = by["confidence_sum"] / by["finished"]
+    st.dataframe(by[["model", "league_id", "finished", "outcome_accuracy", "exact_accuracy", "mean_confidence"]],
+                 use_container_width=True)
@@ -0,0 +1,79 @@
+"""
+Confere (EXPLAIN QUERY PLAN) que as consultas quentes usam índice.
+Roda num banco temporário com o schema migrado:
+
+    python scripts/check_query_plans.py
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "plans.sqlite")
+
+from app.db import init_db, reader, explain  # noqa: E402
+from app.backtest import _LOAD_FRAME, _where  # noqa: E402
+from app.fixtures_index import _LOOKUP_FIXTURE  # noqa: E402
+from app.jobs import _CLAIM  # noqa: E402
+
+# SQL das consultas de verdade (importado dos módulos) sempre que possível
+_BACKTEST_WHERE, _BACKTEST_PARAMS = _where(71, 2023, "2023-05-01", "2023-05-31", "openai")
+
+# nome -> (sql, params, índices esperados no plano: todos precisam aparecer)
+HOT_QUERIES = {
+    "backtest_load_frame": (
+        _LOAD_FRAME.format(where=_BACKTEST_WHERE),
+        _BACKTEST_PARAMS,
+        ("idx_matches_league_season_ts", "idx_predictions_fixture"),
+    ),
+    "lookup_fixture": (
+        _LOOKUP_FIXTURE,
+        (100, 101, 1682899200, 1683158400, 1683043200),
+        ("idx_matches_teams_kickoff",),
+    ),
+    "jobs_claim": (
+        _CLAIM,
+        ("worker", 0.0, 0.0, 0.0),
+        ("idx_jobs_queue",),
+    ),
+    "predictions_since": (
+        "SELECT id FROM predictions WHERE created_at_iso >= ? ORDER BY created_at_iso",
+        ("2024-01-01",),
+        ("idx_predictions_created",),
+    ),
+    "prediction_by_fingerprint": (
+        "SELECT id, report_hash FROM predictions WHERE fingerprint=? AND created_at_iso >= ? ORDER BY created_at_iso DESC LIMIT 1",
+        ("abc", "2024-01-01"),
+        ("idx_predictions_fingerprint",),
+    ),
+    "dashboard_page_by_model": (
+        "SELECT p.id FROM predictions p WHERE p.model = ? ORDER BY p.id DESC LIMIT ? OFFSET ?",
+        ("openai", 50, 100),
+        ("idx_predictions_model",),
+    ),
+    "dashboard_latest_join": (
+        """
+        SELECT p.id, m.home_goals FROM predictions p
+        LEFT JOIN matches m ON m.fixture_id = p.fixture_id
+        ORDER BY p.id DESC LIMIT ?
+        """,
+        (50,),
+        ("INTEGER PRIMARY KEY",),
+    ),
+}
+
+
+def check() -> int:
+    init_db()
+    failures = 0
+    with reader() as c:
+        for name, (sql, params, expected) in HOT_QUERIES.items():
+            plan = explain(c, sql, params)
+            ok = all(any(e in line for line in plan) for e in expected)
+            failures += 0 if ok else 1
+            print(f"{'OK  ' if ok else 'FAIL'} {name}: {' | '.join(plan)}")
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if check() else 0)
@@ -0,0 +1,142 @@
+"""
+Fumaça ponta a ponta contra o upstream falso (app/fake_upstream.py), sem rede
+nem cota: sobe o stand-in numa thread, aponta os providers para ele (banco
+temporário) e roda pela API do app:
+
+  - /responses com o prompt de verdade (compact.prompt_payload + _request)
+  - POST /predict (dossiê + LLM)
+  - POST /predict/batch (rodada inteira, NDJSON)
+  - POST /ingest/run + POST /backtest/run (pool de processos) até "done"
+
+    python scripts/smoke_fake_upstream.py
+"""
+import os
+import sys
+import json
+import socket
+import tempfile
+import threading
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+if __name__ == "__main__":
+    # só no processo principal: os processos do backtest (spawn) reimportam
+    # este arquivo e herdam o ambiente já apontado para o upstream falso
+    _base = f"http://127.0.0.1:{_free_port()}"
+    os.environ.update(
+        DB_PATH=os.path.join(tempfile.mkdtemp(), "smoke.sqlite"),
+        APIFOOTBALL_KEY="fake", ODDS_API_KEY="fake", OPENAI_API_KEY="fake",
+        APIFOOTBALL_BASE_URL=_base, ODDS_BASE_URL=_base, OPENAI_BASE_URL=_base,
+        CASSETTE_RECORD="", HTTP_HTTP2="0", TRACKED_LEAGUES="", PREFETCH_LEAGUES="",
+        # o falso não tem limite de cota: sem ritmo do plano free nem do lote
+        APIFOOTBALL_RATE_PER_MINUTE="6000", BATCH_LLM_RATE_PER_MIN="0",
+    )
+
+import uvicorn  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app import fake_upstream  # noqa: E402
+from app.api import app  # noqa: E402
+from app.compact import prompt_payload  # noqa: E402
+from app.db import init_db  # noqa: E402
+from app.dossier import build_dossier  # noqa: E402
+from app.predictors import extract_scoreline  # noqa: E402
+from app.providers.openai_client import _client, _request  # noqa: E402
+
+TZ = "America/Sao_Paulo"
+LEAGUE = fake_upstream.LEAGUE_ID
+# season passada: todos os jogos do calendário falso já terminaram
+SEASON = datetime.now().year - 1
+ROUND_1 = [fx for fx in fake_upstream._fixtures(SEASON) if fx["league"]["round"].endswith(" 1")]
+FIRST = ROUND_1[0]
+HOME, AWAY = FIRST["teams"]["home"]["name"], FIRST["teams"]["away"]["name"]
+KICKOFF = datetime.fromtimestamp(FIRST["fixture"]["timestamp"], ZoneInfo(TZ)).strftime("%Y-%m-%d %H:%M")
+FROM_DATE, TO_DATE = f"{SEASON}-04-01", f"{SEASON}-04-08"  # rodadas 1 e 2
+
+
+def start_fake() -> uvicorn.Server:
+    port = int(os.environ["APIFOOTBALL_BASE_URL"].rsplit(":", 1)[1])
+    server = uvicorn.Server(uvicorn.Config(fake_upstream.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="fake-upstream", daemon=True).start()
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            raise SystemExit("upstream falso não subiu")
+        time.sleep(0.05)
+    return server
+
+
+def check(name: str, ok: bool, detail: str = "") -> None:
+    print(f"{'ok  ' if ok else 'FAIL'} {name}" + (f": {detail}" if detail else ""))
+    if not ok:
+        raise SystemExit(1)
+
+
+def check_llm_report() -> None:
+    """O /responses falso recebe o prompt real (dossiê compacto) e devolve o placar com os nomes dos times."""
+    dossier = build_dossier(HOME, AWAY, KICKOFF, TZ, SEASON, None, 5, 10)
+    for mode in ("full", "compact"):
+        payload, _ = prompt_payload(dossier, mode)
+        resp = _client().post("/responses", cast_to=object, body=_request(payload, mode))
+        report = resp["output"][0]["content"][0]["text"]
+        scoreline = extract_scoreline(report)
+        check(f"/responses ({mode})", HOME in scoreline and AWAY in scoreline, scoreline)
+
+
+def check_predict(client: TestClient) -> None:
+    r = client.post("/predict", json={"home": HOME, "away": AWAY, "kickoff": KICKOFF, "tz": TZ, "season": SEASON})
+    body = r.json()
+    check("/predict", r.status_code == 200 and HOME in body.get("scoreline", ""),
+          body.get("scoreline") if r.status_code == 200 else f"{r.status_code} {r.text[:200]}")
+
+
+def check_batch(client: TestClient) -> None:
+    req = {"league_id": LEAGUE, "season": SEASON, "from_date": FROM_DATE, "to_date": TO_DATE, "tz": TZ}
+    with client.stream("POST", "/predict/batch", json=req) as r:
+        events = [json.loads(line) for line in r.iter_lines() if line]
+    end = events[-1] if events else {}
+    errors = [e["error"] for e in events if e["type"] == "error"]
+    check("/predict/batch", end.get("type") == "end" and end.get("done") == 2 * len(ROUND_1) and not errors,
+          json.dumps(end) + (f" erros: {errors[:3]}" if errors else ""))
+
+
+def check_backtest(client: TestClient) -> None:
+    r = client.post("/ingest/run", json={"league_id": LEAGUE, "season": SEASON})
+    item = r.json()["leagues"][0]
+    check("/ingest/run", r.status_code == 200 and not item["error"] and item["seen"] > 0,
+          f"seen={item['seen']} high_water={item['high_water']}")
+
+    r = client.post("/backtest/run", json={"league_id": LEAGUE, "season": SEASON, "from_date": FROM_DATE,
+                                           "to_date": TO_DATE, "model": "openai"})
+    run_id = r.json()["runs"][0]
+    deadline = time.time() + 60
+    run = client.get(f"/backtest/runs/{run_id}").json()
+    while run["status"] in ("queued", "running") and time.time() < deadline:
+        time.sleep(0.2)
+        run = client.get(f"/backtest/runs/{run_id}").json()
+    metrics = run.get("metrics") or {}
+    check("/backtest/run", run["status"] == "done" and metrics.get("predictions_found") == 2 * len(ROUND_1),
+          f"status={run['status']} predictions_found={metrics.get('predictions_found')} error={run.get('error')}")
+
+
+if __name__ == "__main__":
+    init_db()
+    server = start_fake()
+    try:
+        check_llm_report()
+        with TestClient(app) as client:
+            check_predict(client)
+            check_batch(client)
+            check_backtest(client)
+    finally:
+        server.should_exit = True
@@ -0,0 +1,24 @@
+"""
+Roda as migrações pendentes e compacta o arquivo SQLite (VACUUM).
+Usar uma vez depois da migração de blobs; sem isso o arquivo não encolhe:
+
+    python scripts/vacuum_db.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.config import DB_PATH  # noqa: E402
+from app.db import init_db, reader, vacuum  # noqa: E402
+from app.blobs import blob_stats  # noqa: E402
+
+
+if __name__ == "__main__":
+    init_db()
+    before = os.path.getsize(DB_PATH)
+    vacuum()
+    after = os.path.getsize(DB_PATH)
+    with reader() as c:
+        stats = blob_stats(c)
+    print(f"{DB_PATH}: {before} -> {after} bytes | {stats}")